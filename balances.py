@@ -0,0 +1,190 @@
+import json
+import os
+import threading
+
+import pandas as pd
+
+import util
+
+# 余额引擎：账户余额 = 期初余额 + 账本中该账户的收支合计
+# 收支合计在交易写入时增量维护；需要时用一次 groupby 从全部交易重建
+# 补记的交易不改变当前余额，而是反向调整期初余额（见 util.TransactionBatch.adjust_balance）
+_totals = {}
+_totals_lock = threading.Lock()
+
+
+def account_totals():
+    # 账本版本变化且未能增量更新时重建
+    version = util.transactions_version()
+    with _totals_lock:
+        if _totals.get('version') == version:
+            return dict(_totals['totals'])
+    totals = util.ledger_totals(util.load_transactions_data(columns=['TransactionType', 'Amount', 'AccountName']))
+    with _totals_lock:
+        _totals.update(version=version, totals=totals)
+    return dict(totals)
+
+
+@util.on_transactions_change
+def _update_totals(version, new_version, removed_df, added_df):
+    with _totals_lock:
+        if _totals.get('version') != version:
+            return
+        totals = _totals['totals']
+        for df, sign in [(removed_df, -1), (added_df, 1)]:
+            if df is None:
+                continue
+            for account_name, amount in util.ledger_totals(df).items():
+                totals[account_name] = totals.get(account_name, 0) + sign * amount
+        _totals['version'] = new_version
+
+
+def load_accounts_with_opening():
+    # 旧数据没有期初余额时，以当前余额为准反推期初余额并写回 Account.csv
+    accounts_df = util.load_account_data()
+    if 'OpeningBalance' not in accounts_df.columns:
+        accounts_df['OpeningBalance'] = float('nan')
+    missing = accounts_df['OpeningBalance'].isna()
+    if missing.any():
+        totals = accounts_df['AccountName'].map(account_totals()).fillna(0.0)
+        accounts_df.loc[missing, 'OpeningBalance'] = (accounts_df['Balance'] - totals)[missing].round(2)
+        util.save_data(accounts_df, 'Account.csv')
+    return accounts_df
+
+
+def balance_report():
+    # 当前余额与按账本推算的余额对比，Drift 不为 0 表示两者不一致
+    accounts_df = load_accounts_with_opening()
+    report = accounts_df[['AccountID', 'AccountName', 'Balance', 'OpeningBalance']].copy()
+    report['LedgerTotal'] = report['AccountName'].map(account_totals()).fillna(0.0).round(2)
+    report['DerivedBalance'] = (report['OpeningBalance'] + report['LedgerTotal']).round(2)
+    report['Drift'] = (report['Balance'] - report['DerivedBalance']).round(2)
+    return report
+
+
+def rebuild_balances():
+    # 从全部交易重新计算各账户余额并写回，返回修改前后的账户行（用于撤销）
+    with _totals_lock:
+        _totals.clear()
+    report = balance_report()
+    drifted = report.loc[report['Drift'] != 0, 'AccountID']
+    accounts_df = load_accounts_with_opening()
+    before_rows = util.table_rows(accounts_df, 'AccountID', drifted)
+    if drifted.empty:
+        return before_rows, before_rows
+    derived = report.set_index('AccountID')['DerivedBalance']
+    mask = accounts_df['AccountID'].isin(drifted)
+    accounts_df.loc[mask, 'Balance'] = accounts_df.loc[mask, 'AccountID'].map(derived)
+    accounts_df.loc[mask, 'LastModifiedTime'] = pd.Timestamp.now().strftime('%Y-%m-%d %H:%M:%S')
+    after_rows = util.table_rows(accounts_df, 'AccountID', drifted)
+    util.replace_rows('Account.csv', 'AccountID', before_rows, after_rows)
+    return before_rows, after_rows
+
+
+# 月末余额快照：保存每个月末各账户的累计收支合计，以及对应的账本版本
+# 查询历史余额时读取上一个月末的快照，再加上当月至查询日期的少量交易
+# 交易写入时只删除被修改交易所在月份及之后的快照，下次查询时从最后一个有效快照向后补齐
+checkpoints_dir = 'Data/BalanceCheckpoints.json'
+checkpoint_columns = ['Date', 'TransactionType', 'Amount', 'AccountName']
+_checkpoints = {}
+_checkpoints_lock = threading.Lock()
+
+
+def _read_checkpoints():
+    if not _checkpoints and os.path.exists(checkpoints_dir):
+        with open(checkpoints_dir, encoding='utf-8') as f:
+            _checkpoints.update(json.load(f))
+    return _checkpoints
+
+
+def _write_checkpoints():
+    with open(checkpoints_dir, 'w', encoding='utf-8') as f:
+        json.dump(_checkpoints, f, ensure_ascii=False)
+
+
+def _save_checkpoints():
+    with _checkpoints_lock:
+        if _checkpoints:
+            _write_checkpoints()
+
+
+def _month_totals(transactions_df):
+    # 每月各账户收支合计，行为月份（YYYY-MM），列为账户
+    months = transactions_df['Date'].dt.strftime('%Y-%m')
+    totals = util.signed_amounts(transactions_df).groupby([months, transactions_df['AccountName']], observed=True).sum()
+    return totals.unstack(fill_value=0.0)
+
+
+def load_checkpoints():
+    # 返回 {月份: {账户名称: 截至该月末的累计收支合计}}；账本在外部被修改时全部重建
+    version = util.transactions_version()
+    with _checkpoints_lock:
+        checkpoints = _read_checkpoints()
+        if checkpoints.get('version') != version:
+            checkpoints.clear()
+            checkpoints.update(version=version, months={}, complete=False)
+        months = checkpoints['months']
+        completed = not checkpoints['complete']
+        if completed:
+            # 只读取最后一个有效快照之后的交易
+            last_month = max(months) if months else None
+            start_date = None if last_month is None else (pd.Period(last_month) + 1).start_time
+            tail_df = util.load_transactions_data(columns=checkpoint_columns, start_date=start_date)
+            totals = dict(months[last_month]) if last_month else {}
+            for month, month_totals in _month_totals(tail_df).iterrows():
+                for account_name, amount in month_totals.items():
+                    totals[account_name] = round(totals.get(account_name, 0) + amount, 2)
+                months[month] = dict(totals)
+            checkpoints['complete'] = True
+        result = {month: dict(totals) for month, totals in months.items()}
+    if completed:
+        util.persist_later(_save_checkpoints)
+    return result
+
+
+@util.on_transactions_change
+def _invalidate_checkpoints(version, new_version, removed_df, added_df):
+    with _checkpoints_lock:
+        checkpoints = _read_checkpoints()
+        if checkpoints.get('version') != version:
+            return
+        dates = [df['Date'].min() for df in (removed_df, added_df) if df is not None and not df.empty]
+        if dates:
+            first_month = min(dates).strftime('%Y-%m')
+            checkpoints['months'] = {month: totals for month, totals in checkpoints['months'].items()
+                                     if month < first_month}
+            checkpoints['complete'] = False
+        checkpoints['version'] = new_version
+    util.persist_later(_save_checkpoints)
+
+
+def _opening_balances():
+    return load_accounts_with_opening().set_index('AccountName')['OpeningBalance']
+
+
+def _with_opening(opening, totals):
+    # totals: {账户名称: 收支合计}，返回各账户余额（期初余额 + 收支合计）
+    return opening.add(pd.Series(totals, dtype=float), fill_value=0.0).round(2)
+
+
+def balance_as_of(date):
+    # 各账户在指定日期当天结束时的余额：上一个月末快照 + 当月至该日期的交易
+    date = pd.Timestamp(date)
+    month = date.strftime('%Y-%m')
+    months = load_checkpoints()
+    previous = [checkpoint for checkpoint in months if checkpoint < month]
+    totals = dict(months[max(previous)]) if previous else {}
+    tail_df = util.load_transactions_data(columns=checkpoint_columns, start_date=pd.Period(month).start_time,
+                                          end_date=date)
+    for account_name, amount in util.ledger_totals(tail_df).items():
+        totals[account_name] = totals.get(account_name, 0) + amount
+    return _with_opening(_opening_balances(), totals)
+
+
+def balance_history():
+    # 各账户每月末余额，行为月份，列为账户
+    months = load_checkpoints()
+    if not months:
+        return pd.DataFrame()
+    opening = _opening_balances()
+    return pd.DataFrame({month: _with_opening(opening, totals) for month, totals in sorted(months.items())}).T.fillna(0.0)
@@ -0,0 +1,156 @@
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+import links
+import util
+
+# 疑似重复交易：手工录入和导入账单的记录经常重叠
+# 分块（blocking）：只比较 账户、收支类型、金额都相同且日期相差不超过 window_days 天的记录，
+# 每块内按日期排序后比较相邻的记录，不需要两两比较全部交易
+# 候选记录再按商户和商品名称的相似度打分，分数不低于 min_score 的列为疑似重复
+dismissed_dir = 'Data/DuplicateDismissed.json'
+detect_columns = ['TransactionID', 'Date', 'TransactionType', 'AccountName', 'Amount', 'Merchant', 'Item',
+                  'RelatedTransactionID']
+# 得分 = 商户相似度、商品相似度和日期接近程度的加权和
+score_weights = {'Merchant': 0.6, 'Item': 0.3, 'Date': 0.1}
+window_days = 3
+min_score = 0.6
+# 合并时保留的记录缺少这些字段则取自被合并的记录
+fill_columns = ['SubcategoryName', 'Merchant', 'Item', 'Remarks']
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def _text(value):
+    return '' if value is None or pd.isna(value) else str(value).strip().lower()
+
+
+def _grams(text):
+    return {text[i:i + 2] for i in range(len(text) - 1)} or {text}
+
+
+def _grams_similarity(a, b, grams_a, grams_b):
+    if a == b:
+        return 1.0
+    if not a or not b:
+        return 0.5
+    return len(grams_a & grams_b) / min(len(grams_a), len(grams_b))
+
+
+def similarity(a, b):
+    # 两段文本的相似度（0~1）：相邻两字的重叠系数（交集 / 较小的集合），账单中的商户名常带有门店等后缀
+    # 两者都为空视为相同，只有一方为空时取中间值
+    a, b = _text(a), _text(b)
+    return _grams_similarity(a, b, _grams(a), _grams(b))
+
+
+def _pair_similarities(left, right):
+    # 逐对计算 similarity：每个取值只切分一次，相同的取值组合只计算一次
+    codes, values = pd.factorize(pd.concat([left, right], ignore_index=True).astype(object), use_na_sentinel=False)
+    texts = [_text(value) for value in values]
+    grams = [_grams(text) for text in texts]
+    pair_codes, inverse = np.unique(codes[:len(left)] * len(values) + codes[len(left):], return_inverse=True)
+    scores = np.array([_grams_similarity(texts[a], texts[b], grams[a], grams[b])
+                       for a, b in zip(*np.divmod(pair_codes, len(values)))], dtype=float)
+    return scores[inverse] if len(scores) else np.array([], dtype=float)
+
+
+def candidate_pairs(transactions_df, window_days=window_days):
+    # 返回 (较早的交易ID数组, 较晚的交易ID数组)，两笔交易的账户、收支类型、金额相同且日期相差不超过 window_days 天
+    if transactions_df.empty:
+        return np.array([], dtype='int64'), np.array([], dtype='int64')
+    cents = (transactions_df['Amount'] * 100).round()
+    block = transactions_df.assign(Cents=cents).groupby(['AccountName', 'TransactionType', 'Cents'], observed=True,
+                                                        sort=False, dropna=False).ngroup().to_numpy()
+    days = transactions_df['Date'].to_numpy().astype('datetime64[D]').astype('int64')
+    order = np.lexsort((days, block))
+    block, days, ids = block[order], days[order], transactions_df['TransactionID'].to_numpy()[order]
+    # 第 k 轮比较每条记录与其后第 k 条记录；某一轮没有符合条件的记录时，更远的记录也不会符合
+    first, second = [], []
+    for k in range(1, len(ids)):
+        matched = (block[k:] == block[:-k]) & (days[k:] - days[:-k] <= window_days)
+        if not matched.any():
+            break
+        first.append(ids[:-k][matched])
+        second.append(ids[k:][matched])
+    if not first:
+        return np.array([], dtype='int64'), np.array([], dtype='int64')
+    return np.concatenate(first), np.concatenate(second)
+
+
+def _score_pairs(transactions_df, first, second, window_days):
+    rows = transactions_df.set_index('TransactionID')
+    left, right = rows.loc[first], rows.loc[second]
+    merchant = _pair_similarities(left['Merchant'], right['Merchant'])
+    item = _pair_similarities(left['Item'], right['Item'])
+    gap = (right['Date'].dt.normalize().to_numpy() - left['Date'].dt.normalize().to_numpy()) / np.timedelta64(1, 'D')
+    score = score_weights['Merchant'] * merchant + score_weights['Item'] * item + \
+        score_weights['Date'] * (1 - gap / (window_days + 1))
+    # 较小的ID在前，作为默认保留的记录
+    pairs = pd.DataFrame({'TransactionID': np.minimum(first, second), 'DuplicateID': np.maximum(first, second),
+                          'Score': np.round(score, 3), 'DayGap': gap.astype(int)})
+    # 互相关联的记录（转账、退款、报销）不是重复
+    related = rows['RelatedTransactionID'].fillna(-1)
+    linked = (related.reindex(pairs['TransactionID']).to_numpy() == pairs['DuplicateID'].to_numpy()) | \
+        (related.reindex(pairs['DuplicateID']).to_numpy() == pairs['TransactionID'].to_numpy())
+    return pairs[~linked]
+
+
+def _read_dismissed():
+    if not os.path.exists(dismissed_dir):
+        return set()
+    with open(dismissed_dir, encoding='utf-8') as f:
+        return {tuple(pair) for pair in json.load(f)}
+
+
+def dismiss_duplicate(transaction_id, duplicate_id):
+    # 标记为不是重复，之后不再列出
+    dismissed = _read_dismissed()
+    dismissed.add((min(transaction_id, duplicate_id), max(transaction_id, duplicate_id)))
+    with open(dismissed_dir, 'w', encoding='utf-8') as f:
+        json.dump(sorted(dismissed), f)
+
+
+def find_duplicates(window_days=window_days, min_score=min_score):
+    # 返回疑似重复的交易对，按得分从高到低排序；结果按 (账本版本, 参数) 缓存
+    version = util.transactions_version()
+    key = (json.dumps(version), window_days)
+    with _cache_lock:
+        pairs = _cache.get(key)
+    if pairs is None:
+        transactions_df = util.load_transactions_data(columns=detect_columns)
+        first, second = candidate_pairs(transactions_df, window_days)
+        pairs = _score_pairs(transactions_df, first, second, window_days)
+        with _cache_lock:
+            _cache.clear()
+            _cache[key] = pairs
+    dismissed = _read_dismissed()
+    kept = [(a, b) not in dismissed for a, b in zip(pairs['TransactionID'], pairs['DuplicateID'])]
+    pairs = pairs[(pairs['Score'] >= min_score).to_numpy() & np.array(kept, dtype=bool)]
+    return pairs.sort_values(['Score', 'TransactionID'], ascending=[False, True]).reset_index(drop=True)
+
+
+def merge_duplicates(keep_id, drop_id):
+    # 删除 drop_id，keep_id 中为空的 子类别/商户/商品/备注 取自 drop_id，指向 drop_id 的关联改为指向 keep_id
+    # 与其他删除一样冲减 drop_id 对账户当前余额的影响，汇总表、关联索引等随删除增量更新
+    # 返回操作记录（见 history.py）
+    keep, drop = links.get_transaction(keep_id), links.get_transaction(drop_id)
+    if keep is None or drop is None:
+        return []
+    batch = util.TransactionBatch()
+    values = {column: drop[column] for column in fill_columns if not _text(keep[column]) and _text(drop[column])}
+    if keep['RelatedTransactionID'] is None and drop['RelatedTransactionID'] not in (None, keep_id):
+        values['RelatedTransactionID'] = drop['RelatedTransactionID']
+    if values:
+        batch.update(keep_id, **values)
+    for row in links.linked_transactions(drop_id):
+        if row['RelatedTransactionID'] == drop_id and row['TransactionID'] != keep_id:
+            batch.update(row['TransactionID'], RelatedTransactionID=keep_id)
+    batch.delete(drop_id)
+    for account_name, amount in util.ledger_totals(util.transaction_rows([drop_id])).items():
+        batch.adjust_balance(account_name, -round(float(amount), 2))
+    return batch.commit()
@@ -0,0 +1,108 @@
+import argparse
+import os
+import tempfile
+
+import util
+
+# 导出筛选结果：逐块读取（util.iter_transactions）并逐块写出，内存占用与导出的日期范围无关
+# 支持 CSV、Parquet（需要 pyarrow）和 XLSX（需要 openpyxl）
+export_formats = {'csv': 'CSV', 'parquet': 'Parquet', 'xlsx': 'Excel'}
+export_columns = ['TransactionID', 'Date', 'TransactionType', 'CategoryName', 'SubcategoryName', 'Amount',
+                  'AccountName', 'Merchant', 'Item', 'Remarks', 'IsRefund', 'RelatedTransactionID']
+chunk_size = 50000
+# Excel 单个工作表的最大行数（含表头），超出后写入新的工作表
+xlsx_max_rows = 1048576
+
+
+def export_chunks(filters=None, transaction_ids=None, row_filter=None, chunk_size=chunk_size):
+    # 逐块返回待导出的记录（文件中的文本格式）
+    # transaction_ids: 只导出这些交易（例如全文搜索的结果）；row_filter: 对每块记录再做的筛选，返回布尔序列
+    for chunk in util.iter_transactions(chunk_size, **(filters or {})):
+        if transaction_ids is not None:
+            chunk = chunk[chunk['TransactionID'].isin(transaction_ids)]
+        if row_filter is not None:
+            chunk = chunk[row_filter(chunk)]
+        if not chunk.empty:
+            yield util.to_storage_frame(chunk[export_columns])
+
+
+def _write_csv(f, chunks):
+    # 带 BOM 的 UTF-8，Excel 打开时中文不乱码
+    f.write(','.join(export_columns).encode('utf-8-sig') + b'\n')
+    for chunk in chunks:
+        f.write(chunk.to_csv(header=False, index=False, date_format='%Y-%m-%d %H:%M:%S').encode('utf-8'))
+
+
+def _write_parquet(f, chunks):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    schema = pa.schema([('TransactionID', pa.int64()), ('Date', pa.timestamp('us')),
+                        ('TransactionType', pa.string()), ('CategoryName', pa.string()),
+                        ('SubcategoryName', pa.string()), ('Amount', pa.float64()), ('AccountName', pa.string()),
+                        ('Merchant', pa.string()), ('Item', pa.string()), ('Remarks', pa.string()),
+                        ('IsRefund', pa.string()), ('RelatedTransactionID', pa.int64())])
+    # 每块写为一个行组
+    with pq.ParquetWriter(f, schema) as writer:
+        for chunk in chunks:
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+
+
+def _write_xlsx(f, chunks):
+    from openpyxl import Workbook
+    # 只写模式逐行写出，不在内存中保留整个工作簿
+    workbook = Workbook(write_only=True)
+    sheet, rows = None, xlsx_max_rows
+    for chunk in chunks:
+        chunk = chunk.astype(object).where(chunk.notna(), None)
+        for row in chunk.itertuples(index=False):
+            if rows >= xlsx_max_rows:
+                sheet = workbook.create_sheet(f'交易记录{len(workbook.worksheets) + 1}')
+                sheet.append(export_columns)
+                rows = 1
+            sheet.append(list(row))
+            rows += 1
+    if sheet is None:
+        workbook.create_sheet('交易记录1').append(export_columns)
+    workbook.save(f)
+
+
+def write_export(f, export_format, chunks):
+    # f: 以二进制方式打开的文件
+    {'csv': _write_csv, 'parquet': _write_parquet, 'xlsx': _write_xlsx}[export_format](f, chunks)
+
+
+def export_transactions(path, export_format=None, filters=None, transaction_ids=None, row_filter=None):
+    # 导出到文件，未指定格式时按扩展名判断
+    export_format = export_format or os.path.splitext(path)[1].lstrip('.').lower()
+    if export_format not in export_formats:
+        raise ValueError(f'不支持的导出格式：{export_format}')
+    with open(path, 'wb') as f:
+        write_export(f, export_format, export_chunks(filters, transaction_ids, row_filter))
+    return path
+
+
+def export_file(export_format, filters=None, transaction_ids=None, row_filter=None):
+    # 导出到临时文件并返回文件路径（用于页面上的下载按钮），调用方负责删除
+    fd, path = tempfile.mkstemp(suffix=f'.{export_format}')
+    os.close(fd)
+    return export_transactions(path, export_format, filters, transaction_ids, row_filter)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='导出交易记录')
+    parser.add_argument('output', help='导出文件，格式由扩展名决定：.csv、.parquet 或 .xlsx')
+    parser.add_argument('--start', help='开始日期')
+    parser.add_argument('--end', help='结束日期')
+    parser.add_argument('--type', choices=util.transaction_types, help='收支类型')
+    parser.add_argument('--account', action='append', help='账户，可重复')
+    parser.add_argument('--category', action='append', help='类别，可重复')
+    parser.add_argument('--subcategory', action='append', help='子类别，可重复')
+    args = parser.parse_args()
+    filters = {'start_date': args.start, 'end_date': args.end, 'transaction_type': args.type,
+               'account': args.account, 'category': args.category, 'subcategory': args.subcategory}
+    export_transactions(args.output, filters={key: value for key, value in filters.items() if value is not None})
+    print(f'已导出至 {args.output}')
+
+
+if __name__ == '__main__':
+    main()
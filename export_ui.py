@@ -0,0 +1,25 @@
+import os
+
+import streamlit as st
+
+from export import export_file, export_formats
+
+
+# 导出当前筛选结果：点击后逐块写入临时文件，再通过下载按钮提供给浏览器
+def export_buttons(key, filters, transaction_ids=None, row_filter=None, file_name='交易记录'):
+    col1, col2 = st.columns(2)
+    with col1:
+        export_format = st.selectbox('导出格式', list(export_formats), format_func=export_formats.get,
+                                     key=f'{key}_export_format')
+    state_key = f'{key}_export_path'
+    with col2:
+        if st.button('导出', key=f'{key}_export'):
+            # 删除上一次导出的临时文件
+            previous = st.session_state.pop(state_key, None)
+            if previous and os.path.exists(previous):
+                os.remove(previous)
+            st.session_state[state_key] = export_file(export_format, filters, transaction_ids, row_filter)
+    path = st.session_state.get(state_key)
+    if path and os.path.exists(path) and path.endswith(f'.{export_format}'):
+        with open(path, 'rb') as f:
+            st.download_button('下载导出文件', f, file_name=f'{file_name}.{export_format}', key=f'{key}_download')
@@ -0,0 +1,88 @@
+import threading
+
+import util
+
+# 全文索引：对 商户/商品/备注 建立字符 n-gram 倒排索引（单字和相邻两字），适用于没有空格分词的中文
+# 查询时先用 n-gram 倒排表求交集得到候选记录，再核对原文是否包含查询词
+# 索引保存在内存中，首次查询时构建，交易写入时增量更新
+text_columns = ['Merchant', 'Item', 'Remarks']
+_index = {}
+_index_lock = threading.Lock()
+
+
+def _grams(text):
+    grams = set(text)
+    grams.update(text[i:i + 2] for i in range(len(text) - 1))
+    grams.discard('\n')
+    return grams
+
+
+def _texts(transactions_df):
+    # {TransactionID: 小写的 商户/商品/备注 文本}，各字段之间用换行分隔，查询词不会跨字段匹配
+    df = transactions_df[text_columns].astype(object).fillna('').astype(str)
+    texts = (df['Merchant'] + '\n' + df['Item'] + '\n' + df['Remarks']).str.lower()
+    return dict(zip(transactions_df['TransactionID'].tolist(), texts.tolist()))
+
+
+def _add(texts):
+    postings = _index['postings']
+    for transaction_id, text in texts.items():
+        _index['texts'][transaction_id] = text
+        for gram in _grams(text):
+            postings.setdefault(gram, set()).add(transaction_id)
+
+
+def _remove(transaction_ids):
+    postings = _index['postings']
+    for transaction_id in transaction_ids:
+        text = _index['texts'].pop(transaction_id, None)
+        if text is None:
+            continue
+        for gram in _grams(text):
+            ids = postings.get(gram)
+            if ids is not None:
+                ids.discard(transaction_id)
+                if not ids:
+                    del postings[gram]
+
+
+def rebuild_fulltext_index():
+    version = util.transactions_version()
+    texts = _texts(util.load_transactions_data(columns=['TransactionID'] + text_columns))
+    with _index_lock:
+        _index.clear()
+        _index.update(version=version, texts={}, postings={})
+        _add(texts)
+
+
+@util.on_transactions_change
+def _update_fulltext_index(version, new_version, removed_df, added_df):
+    with _index_lock:
+        if _index.get('version') != version:
+            return
+        if removed_df is not None:
+            _remove(removed_df['TransactionID'].tolist())
+        if added_df is not None:
+            _add(_texts(added_df))
+        _index['version'] = new_version
+
+
+def search_transactions(query):
+    # 返回 商户/商品/备注 中包含查询词的交易ID集合；多个词用空格分隔，需同时包含
+    words = query.lower().split()
+    if not words:
+        return set()
+    if _index.get('version') != util.transactions_version():
+        rebuild_fulltext_index()
+    with _index_lock:
+        postings, texts = _index['postings'], _index['texts']
+        result = None
+        for word in words:
+            grams = {word[i:i + 2] for i in range(len(word) - 1)} or {word}
+            # 从最短的倒排表开始求交集
+            candidates = set.intersection(*sorted((postings.get(gram, set()) for gram in grams), key=len))
+            matched = {transaction_id for transaction_id in candidates if word in texts[transaction_id]}
+            result = matched if result is None else result & matched
+            if not result:
+                break
+        return result
@@ -0,0 +1,68 @@
+import pandas as pd
+
+import util
+
+# 操作记录：撤销/重做只保存每次操作改动的数据，而不是整张表的副本
+# 每个操作由若干步骤组成，步骤格式：
+#   {'op': 'add', 'rows': [交易行]}                         新增交易，逆操作为 delete
+#   {'op': 'delete', 'rows': [交易行]}                      删除交易，逆操作为 add
+#   {'op': 'patch', 'before': {ID: {列: 值}}, 'after': ...}  修改交易字段，逆操作交换 before/after
+#   {'op': 'balance', 'changes': {账户名称: 金额}, 'opening': ...}  调整账户余额和期初余额，逆操作取相反数
+#   {'op': 'rows', 'file_name': 文件, 'key': 主键, 'before': [行], 'after': [行]}  账户、类别等表的行级替换
+history_limit = 50
+
+
+def new_history():
+    return {'undo': [], 'redo': []}
+
+
+def record(history, label, steps):
+    # 记录新操作后清空重做栈；超出上限时丢弃最早的操作
+    if not steps:
+        return
+    history['undo'].append({'label': label, 'steps': steps})
+    del history['undo'][:-history_limit]
+    history['redo'].clear()
+
+
+def invert(step):
+    if step['op'] == 'add':
+        return {**step, 'op': 'delete'}
+    if step['op'] == 'delete':
+        return {**step, 'op': 'add'}
+    if step['op'] == 'balance':
+        return {**step, 'changes': {account: -amount for account, amount in step['changes'].items()},
+                'opening': {account: -amount for account, amount in step.get('opening', {}).items()}}
+    return {**step, 'before': step['after'], 'after': step['before']}
+
+
+def apply_step(step):
+    if step['op'] == 'add':
+        util.append_transactions(pd.DataFrame(step['rows'], columns=util.transaction_columns))
+    elif step['op'] == 'delete':
+        util.delete_transactions([row['TransactionID'] for row in step['rows']])
+    elif step['op'] == 'patch':
+        util.patch_transactions(step['after'])
+    elif step['op'] == 'balance':
+        util.adjust_account_balances(step['changes'], step.get('opening'))
+    elif step['op'] == 'rows':
+        util.replace_rows(step['file_name'], step['key'], step['before'], step['after'])
+    else:
+        raise ValueError(f"未知的操作类型：{step['op']}")
+
+
+def undo(history):
+    # 按相反顺序执行最近一次操作各步骤的逆操作，返回操作名称
+    operation = history['undo'].pop()
+    for step in reversed(operation['steps']):
+        apply_step(invert(step))
+    history['redo'].append(operation)
+    return operation['label']
+
+
+def redo(history):
+    operation = history['redo'].pop()
+    for step in operation['steps']:
+        apply_step(step)
+    history['undo'].append(operation)
+    return operation['label']
@@ -0,0 +1,30 @@
+import streamlit as st
+
+import history
+
+
+# 撤销/重做的操作记录保存在会话中，所有页面共用
+def session_history():
+    if 'history' not in st.session_state:
+        st.session_state.history = history.new_history()
+    return st.session_state.history
+
+
+def record_operation(label, steps):
+    history.record(session_history(), label, steps)
+
+
+def history_buttons(key):
+    # 显示撤销和重做按钮，执行后刷新页面并显示结果
+    operations = session_history()
+    if 'history_message' in st.session_state:
+        st.success(st.session_state.pop('history_message'))
+    col1, col2 = st.columns(2)
+    with col1:
+        if operations['undo'] and st.button(f"撤销：{operations['undo'][-1]['label']}", key=f'{key}_undo'):
+            st.session_state.history_message = f'已撤销：{history.undo(operations)}'
+            st.rerun()
+    with col2:
+        if operations['redo'] and st.button(f"重做：{operations['redo'][-1]['label']}", key=f'{key}_redo'):
+            st.session_state.history_message = f'已重做：{history.redo(operations)}'
+            st.rerun()
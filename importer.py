@@ -0,0 +1,247 @@
+import argparse
+import threading
+
+import pandas as pd
+
+import suggestions
+import util
+
+# 批量导入银行/电子钱包账单：按块读取 CSV，映射到交易表的列，通过维度目录解析账户和类别
+# 重复判断使用 (日期, 金额, 账户, 商户) 的哈希索引：账本中已有的次数不再导入，同一账单内的重复记录照常导入
+# 全部通过校验的记录最后通过 TransactionBatch 一次写入账本（可以撤销）
+import_columns = ['Date', 'TransactionType', 'CategoryName', 'SubcategoryName', 'Amount', 'AccountName',
+                  'Remarks', 'Merchant', 'Item']
+key_columns = ['Date', 'Amount', 'AccountName', 'Merchant']
+chunk_size = 50000
+# 每种拒绝原因最多保留的示例行数
+rejected_sample_limit = 20
+_index = {}
+_index_lock = threading.Lock()
+
+
+def _key_hashes(df):
+    # 每行 (日期, 金额, 账户, 商户) 的 64 位哈希，日期只取到天，金额按分取整
+    keys = pd.DataFrame({
+        'Date': pd.to_datetime(df['Date']).dt.normalize().astype('datetime64[ns]'),
+        'Amount': (pd.to_numeric(df['Amount']).abs() * 100).round().astype('int64'),
+        'AccountName': df['AccountName'].astype(object).fillna('').astype(str),
+        'Merchant': df['Merchant'].astype(object).fillna('').astype(str),
+    })
+    return pd.util.hash_pandas_object(keys, index=False)
+
+
+def _counts(transactions_df):
+    if transactions_df.empty:
+        return {}
+    return _key_hashes(transactions_df).value_counts().to_dict()
+
+
+def rebuild_duplicate_index():
+    version = util.transactions_version()
+    counts = _counts(util.load_transactions_data(columns=key_columns))
+    with _index_lock:
+        _index.clear()
+        _index.update(version=version, counts=counts)
+
+
+def _current_index():
+    if _index.get('version') != util.transactions_version():
+        rebuild_duplicate_index()
+    return _index
+
+
+@util.on_transactions_change
+def _update_duplicate_index(version, new_version, removed_df, added_df):
+    with _index_lock:
+        if _index.get('version') != version:
+            return
+        counts = _index['counts']
+        for df, sign in [(removed_df, -1), (added_df, 1)]:
+            if df is None:
+                continue
+            for key, count in _counts(df).items():
+                counts[key] = counts.get(key, 0) + sign * count
+                if counts[key] <= 0:
+                    del counts[key]
+        _index['version'] = new_version
+
+
+def read_statement(source, column_map, encoding='utf-8', chunksize=chunk_size):
+    # 按块读取账单，只读取映射到的列并改为交易表的列名；column_map: {账单列名: 交易表列名}
+    reader = pd.read_csv(source, usecols=list(column_map), dtype=str, encoding=encoding, chunksize=chunksize,
+                         skipinitialspace=True)
+    for chunk in reader:
+        yield chunk.rename(columns=column_map)
+
+
+def _text_column(chunk, column, default=None):
+    if column in chunk.columns:
+        values = chunk[column].str.strip()
+        values = values.where(values != '', None)
+        return values if default is None else values.fillna(default)
+    return pd.Series(default, index=chunk.index, dtype=object)
+
+
+def _suggested(merchants, items, transaction_types, field, cache):
+    values = []
+    for key in zip(merchants, items, transaction_types):
+        if key not in cache:
+            cache[key] = suggestions.suggest(key[0] or '', key[1] or '', key[2])
+        values.append(cache[key][field])
+    return values
+
+
+def prepare_chunk(chunk, defaults=None, catalog=None, suggestion_cache=None):
+    # 将一块账单转换为交易记录，返回 (有效记录, 拒绝的记录及原因)
+    # defaults: 账单中没有的列使用的值，例如整份账单属于同一个账户
+    defaults = defaults or {}
+    catalog = catalog or util.dimension_catalog()
+    suggestion_cache = {} if suggestion_cache is None else suggestion_cache
+    df = pd.DataFrame(index=chunk.index)
+    df['Date'] = pd.to_datetime(_text_column(chunk, 'Date', defaults.get('Date')), errors='coerce', format='mixed')
+    amounts = _text_column(chunk, 'Amount', defaults.get('Amount')).astype(object).fillna('')
+    amounts = pd.to_numeric(amounts.astype(str).str.replace(r'[,¥￥\s]', '', regex=True), errors='coerce')
+    # 没有收支类型时按金额的正负判断：负数为支出
+    transaction_types = _text_column(chunk, 'TransactionType', defaults.get('TransactionType'))
+    signs = amounts.lt(0).map({True: '支出', False: '收入'})
+    df['TransactionType'] = transaction_types.where(transaction_types.notna(), signs)
+    df['Amount'] = amounts.abs().round(2)
+    for column in ['AccountName', 'Merchant', 'Item', 'Remarks', 'CategoryName', 'SubcategoryName']:
+        df[column] = _text_column(chunk, column, defaults.get(column))
+    # 没有类别时按商户和商品名称取自动分类建议
+    missing = df['CategoryName'].isna() & df['TransactionType'].isin(util.transaction_types)
+    if missing.any():
+        rows = df[missing]
+        args = (rows['Merchant'], rows['Item'], rows['TransactionType'])
+        df.loc[missing, 'CategoryName'] = _suggested(*args, 'CategoryName', suggestion_cache)
+        suggested = pd.Series(_suggested(*args, 'SubcategoryName', suggestion_cache), index=rows.index, dtype=object)
+        df.loc[missing, 'SubcategoryName'] = rows['SubcategoryName'].where(rows['SubcategoryName'].notna(), suggested)
+    # 子类别不属于该类别时留空
+    valid_subcategory = pd.Series([subcategory is None or catalog.subcategory_id(category, subcategory) is not None
+                                   for category, subcategory in zip(df['CategoryName'], df['SubcategoryName'])],
+                                  index=df.index)
+    df['SubcategoryName'] = df['SubcategoryName'].where(valid_subcategory, None)
+    category_types = {category: transaction_type for transaction_type in util.transaction_types
+                      for category in catalog.categories(transaction_type)}
+    checks = [
+        ('日期无效', df['Date'].isna()),
+        ('金额无效', df['Amount'].isna() | df['Amount'].eq(0)),
+        ('收支类型无效', ~df['TransactionType'].isin(util.transaction_types)),
+        ('账户不存在', ~df['AccountName'].isin(catalog.accounts_by_name)),
+        ('账户已删除', df['AccountName'].isin(set(catalog.account_names) - set(catalog.valid_accounts))),
+        ('缺少类别', df['CategoryName'].isna()),
+        ('类别不存在', df['CategoryName'].notna() & ~df['CategoryName'].isin(category_types)),
+        ('类别与收支类型不符', df['CategoryName'].map(category_types).ne(df['TransactionType']) &
+         df['CategoryName'].isin(category_types)),
+    ]
+    reasons = pd.Series(None, index=df.index, dtype=object)
+    for reason, mask in checks:
+        reasons = reasons.where(reasons.notna() | ~mask, reason)
+    rejected = chunk[reasons.notna()].assign(Reason=reasons[reasons.notna()])
+    return df[reasons.isna()], rejected
+
+
+class StatementImport:
+    # 一次导入：逐块 feed() 校验和去重，commit() 一次写入；只保留通过的记录，内存占用与账单大小无关
+    def __init__(self, defaults=None, backdated=True):
+        # backdated: 账单中的交易已反映在账户的当前余额中，只调整期初余额（与首页的补记相同）
+        self.defaults = defaults or {}
+        self.backdated = backdated
+        self.catalog = util.dimension_catalog()
+        self.existing = dict(_current_index()['counts'])
+        self.seen = {}
+        self.suggestion_cache = {}
+        self.accepted = []
+        self.total = 0
+        self.duplicates = 0
+        self.rejected = {}
+        self.rejected_samples = {}
+
+    def feed(self, chunk):
+        self.total += len(chunk)
+        df, rejected = prepare_chunk(chunk, self.defaults, self.catalog, self.suggestion_cache)
+        for reason, count in rejected['Reason'].value_counts().items():
+            self.rejected[reason] = self.rejected.get(reason, 0) + int(count)
+            samples = self.rejected_samples.get(reason)
+            if samples is None or len(samples) < rejected_sample_limit:
+                new_samples = rejected[rejected['Reason'] == reason]
+                samples = new_samples if samples is None else pd.concat([samples, new_samples])
+                self.rejected_samples[reason] = samples.head(rejected_sample_limit)
+        if df.empty:
+            return
+        # 同一键在账单中第 n 次出现，且账本中已有不少于 n 条时视为重复
+        hashes = _key_hashes(df)
+        occurrence = hashes.groupby(hashes).cumcount() + 1 + hashes.map(self.seen).fillna(0)
+        duplicate = occurrence <= hashes.map(self.existing).fillna(0)
+        for key, count in hashes.value_counts().items():
+            self.seen[key] = self.seen.get(key, 0) + int(count)
+        self.duplicates += int(duplicate.sum())
+        if (~duplicate).any():
+            self.accepted.append(df[~duplicate.to_numpy()])
+
+    def summary(self):
+        return {'total': self.total, 'imported': sum(len(df) for df in self.accepted),
+                'duplicates': self.duplicates, 'rejected': dict(self.rejected)}
+
+    def rejected_rows(self):
+        # 被拒绝的记录示例（账单中的原始列及原因）
+        if not self.rejected_samples:
+            return pd.DataFrame(columns=['Reason'])
+        return pd.concat(self.rejected_samples.values(), ignore_index=True)
+
+    def commit(self):
+        # 返回操作记录（见 history.py）
+        if not self.accepted:
+            return []
+        new_transactions_df = pd.concat(self.accepted, ignore_index=True)
+        self.accepted = []
+        new_transactions_df['TransactionID'] = util.allocate_transaction_ids(len(new_transactions_df))
+        new_transactions_df['Remarks'] = new_transactions_df['Remarks'].fillna('')
+        batch = util.TransactionBatch()
+        batch.add_transactions(new_transactions_df, self.backdated)
+        return batch.commit()
+
+
+def import_statement(source, column_map, defaults=None, encoding='utf-8', chunksize=chunk_size, backdated=True,
+                     dry_run=False):
+    # 返回 (导入统计, 被拒绝的记录示例, 操作记录)；dry_run 时只校验不写入
+    statement_import = StatementImport(defaults, backdated)
+    for chunk in read_statement(source, column_map, encoding, chunksize):
+        statement_import.feed(chunk)
+    summary, rejected = statement_import.summary(), statement_import.rejected_rows()
+    steps = [] if dry_run else statement_import.commit()
+    return summary, rejected, steps
+
+
+def _pairs(values):
+    # ['账单列=交易表列', ...] -> {账单列: 交易表列}
+    pairs = {}
+    for value in values or []:
+        key, _, column = value.partition('=')
+        pairs[key] = column
+    return pairs
+
+
+def main():
+    parser = argparse.ArgumentParser(description='批量导入银行/电子钱包账单')
+    parser.add_argument('statement', help='账单 CSV 文件')
+    parser.add_argument('--map', action='append', metavar='账单列=交易表列', required=True,
+                        help=f"列映射，交易表列可选：{', '.join(import_columns)}")
+    parser.add_argument('--set', action='append', metavar='交易表列=值', help='账单中没有的列的取值，例如 AccountName=招商银行')
+    parser.add_argument('--encoding', default='utf-8')
+    parser.add_argument('--chunksize', type=int, default=chunk_size)
+    parser.add_argument('--update-balance', action='store_true', help='调整账户当前余额（默认只调整期初余额）')
+    parser.add_argument('--dry-run', action='store_true', help='只校验，不写入')
+    args = parser.parse_args()
+    summary, rejected, _ = import_statement(args.statement, _pairs(args.map), _pairs(args.set), args.encoding,
+                                            args.chunksize, not args.update_balance, args.dry_run)
+    print(f"共 {summary['total']} 条，{'可导入' if args.dry_run else '导入'} {summary['imported']} 条，"
+          f"重复 {summary['duplicates']} 条")
+    for reason, count in summary['rejected'].items():
+        print(f'拒绝 {count} 条：{reason}')
+    if not rejected.empty:
+        print(rejected.to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+import threading
+
+import pandas as pd
+
+import util
+
+# 关联交易索引：转账、退款和报销通过 RelatedTransactionID 相互关联
+# rows: 交易ID -> 交易记录；related: 交易ID -> 与之关联的交易ID（双向）
+# 首次使用时一次构建，交易写入时增量更新，按ID查询交易和关联链均为 O(1)
+_index = {}
+_index_lock = threading.Lock()
+
+
+def _records(transactions_df):
+    transactions_df = transactions_df.astype(object).where(transactions_df.notna(), None)
+    return {row['TransactionID']: row for row in transactions_df.to_dict('records')}
+
+
+def _link(related, transaction_id, related_id):
+    related.setdefault(transaction_id, set()).add(related_id)
+    related.setdefault(related_id, set()).add(transaction_id)
+
+
+def _unlink(related, transaction_id, related_id):
+    for a, b in [(transaction_id, related_id), (related_id, transaction_id)]:
+        ids = related.get(a)
+        if ids is not None:
+            ids.discard(b)
+            if not ids:
+                del related[a]
+
+
+def _add(rows):
+    for transaction_id, row in rows.items():
+        _index['rows'][transaction_id] = row
+        if row['RelatedTransactionID'] is not None:
+            _link(_index['related'], transaction_id, int(row['RelatedTransactionID']))
+
+
+def _remove(transaction_ids):
+    for transaction_id in transaction_ids:
+        row = _index['rows'].pop(transaction_id, None)
+        if row is None or row['RelatedTransactionID'] is None:
+            continue
+        related_id = int(row['RelatedTransactionID'])
+        # 对方也指向本记录时保留这条边
+        other = _index['rows'].get(related_id)
+        if other is None or other['RelatedTransactionID'] != transaction_id:
+            _unlink(_index['related'], transaction_id, related_id)
+
+
+def rebuild_link_index():
+    version = util.transactions_version()
+    rows = _records(util.load_transactions_data())
+    with _index_lock:
+        _index.clear()
+        _index.update(version=version, rows={}, related={})
+        _add(rows)
+
+
+def _current_index():
+    if _index.get('version') != util.transactions_version():
+        rebuild_link_index()
+    return _index
+
+
+@util.on_transactions_change
+def _update_link_index(version, new_version, removed_df, added_df):
+    with _index_lock:
+        if _index.get('version') != version:
+            return
+        if removed_df is not None:
+            _remove(removed_df['TransactionID'].tolist())
+        if added_df is not None:
+            _add(_records(added_df))
+        _index['version'] = new_version
+
+
+def get_transaction(transaction_id):
+    # 按ID返回交易记录（字典），不存在时返回 None
+    return _current_index()['rows'].get(transaction_id)
+
+
+def linked_transactions(transaction_id):
+    # 与该交易直接关联的交易记录，例如转出对应的转入、支出对应的退款
+    index = _current_index()
+    return [index['rows'][related_id] for related_id in sorted(index['related'].get(transaction_id, ()))
+            if related_id in index['rows']]
+
+
+def linked_chain(transaction_id):
+    # 通过关联关系可达的全部交易（含自身），按日期排序
+    index = _current_index()
+    seen, pending = {transaction_id}, [transaction_id]
+    while pending:
+        for related_id in index['related'].get(pending.pop(), ()):
+            if related_id not in seen:
+                seen.add(related_id)
+                pending.append(related_id)
+    rows = [index['rows'][related_id] for related_id in seen if related_id in index['rows']]
+    return sorted(rows, key=lambda row: (row['Date'], row['TransactionID']))
+
+
+def link_report():
+    # 关联完整性检查：关联的交易不存在、关联指向自身、对方没有反向关联
+    rows = _current_index()['rows']
+    problems = []
+    for transaction_id, row in rows.items():
+        related_id = row['RelatedTransactionID']
+        if related_id is None:
+            continue
+        related_id = int(related_id)
+        if related_id == transaction_id:
+            problems.append((transaction_id, related_id, '关联指向自身'))
+        elif related_id not in rows:
+            problems.append((transaction_id, related_id, '关联的交易不存在'))
+        elif rows[related_id]['RelatedTransactionID'] != transaction_id:
+            problems.append((transaction_id, related_id, '对方没有反向关联'))
+    return pd.DataFrame(problems, columns=['TransactionID', 'RelatedTransactionID', 'Problem'])
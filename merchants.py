@@ -0,0 +1,162 @@
+import bisect
+import heapq
+import itertools
+import json
+import os
+import threading
+
+import pandas as pd
+
+import util
+
+# 商户索引：商户名称 -> 使用次数、最近使用日期及最近一次使用的类别/子类别/账户
+# 与账本版本一起保存，交易写入时增量更新，账本在外部被修改时重建
+merchant_index_dir = 'Data/MerchantIndex.json'
+merchant_columns = ['Date', 'Merchant', 'CategoryName', 'SubcategoryName', 'AccountName']
+_index = {}
+_index_lock = threading.Lock()
+
+
+def _text(value):
+    return None if pd.isna(value) else str(value)
+
+
+def _entries(transactions_df):
+    # 一次 groupby 计算各商户的统计信息
+    df = transactions_df[transactions_df['Merchant'].notna() & (transactions_df['Merchant'] != '')]
+    if df.empty:
+        return {}
+    df = df.sort_values('Date', kind='stable')
+    grouped = df.groupby(df['Merchant'].astype(str), sort=False)
+    last = grouped.last()
+    counts = grouped.size()
+    return {merchant: {'Count': int(counts[merchant]),
+                       'LastUsed': last.at[merchant, 'Date'].strftime('%Y-%m-%d %H:%M:%S'),
+                       'CategoryName': _text(last.at[merchant, 'CategoryName']),
+                       'SubcategoryName': _text(last.at[merchant, 'SubcategoryName']),
+                       'AccountName': _text(last.at[merchant, 'AccountName'])}
+            for merchant in counts.index}
+
+
+def _write_index():
+    with open(merchant_index_dir, 'w', encoding='utf-8') as f:
+        json.dump({'version': _index['version'], 'merchants': _index['merchants']}, f, ensure_ascii=False)
+
+
+def _save_index():
+    with _index_lock:
+        if _index:
+            _write_index()
+
+
+def _read_index():
+    if not _index and os.path.exists(merchant_index_dir):
+        with open(merchant_index_dir, encoding='utf-8') as f:
+            _index.update(json.load(f))
+    return _index
+
+
+def rebuild_merchant_index():
+    version = util.transactions_version()
+    merchants = _entries(util.load_transactions_data(columns=merchant_columns))
+    with _index_lock:
+        _index.clear()
+        _index.update(version=version, merchants=merchants)
+        _write_index()
+    return merchants
+
+
+def load_merchant_index():
+    # 返回 {商户名称: 统计信息}
+    version = util.transactions_version()
+    with _index_lock:
+        if _read_index().get('version') == version:
+            return _index['merchants']
+    return rebuild_merchant_index()
+
+
+@util.on_transactions_change
+def _update_merchant_index(version, new_version, removed_df, added_df):
+    with _index_lock:
+        if _read_index().get('version') != version:
+            return
+        merchants = _index['merchants']
+        stale = set()
+        if removed_df is not None:
+            for merchant, entry in _entries(removed_df).items():
+                current = merchants.get(merchant)
+                if current is None:
+                    continue
+                current['Count'] -= entry['Count']
+                # 移除的交易可能是该商户最近的一次使用，需要重新查询
+                if entry['LastUsed'] >= current['LastUsed']:
+                    stale.add(merchant)
+                if current['Count'] <= 0:
+                    del merchants[merchant]
+                    stale.discard(merchant)
+                    _index.pop('sorted_names', None)
+        if added_df is not None:
+            for merchant, entry in _entries(added_df).items():
+                current = merchants.get(merchant)
+                if current is None:
+                    merchants[merchant] = entry
+                    _index.pop('sorted_names', None)
+                else:
+                    count = current['Count'] + entry['Count']
+                    if entry['LastUsed'] >= current['LastUsed']:
+                        current.update(entry)
+                        stale.discard(merchant)
+                    current['Count'] = count
+        _index['version'] = new_version
+    # 只有最近一次使用被移除且没有更新的使用补上的商户需要查询账本，所有这些商户合并为一次查询
+    if stale:
+        entries = _entries(util.query_transactions(merchant=sorted(stale)))
+        with _index_lock:
+            for merchant in stale:
+                if merchant in entries:
+                    _index['merchants'][merchant] = entries[merchant]
+                elif _index['merchants'].pop(merchant, None) is not None:
+                    _index.pop('sorted_names', None)
+    util.persist_later(_save_index)
+
+
+def _is_subsequence(query, name):
+    # 模糊匹配：query 中的字符按顺序出现在 name 中
+    characters = iter(name)
+    return all(character in characters for character in query)
+
+
+def search_merchants(query='', limit=20):
+    # 按使用次数排序返回最多 limit 个商户：依次为前缀匹配、包含匹配、模糊匹配
+    merchants = load_merchant_index()
+    query = query.strip().lower()
+    rank = lambda merchant: (merchants[merchant]['Count'], merchants[merchant]['LastUsed'])
+    if not query:
+        return heapq.nlargest(limit, merchants, key=rank)
+    names = _sorted_names(merchants)
+    start = bisect.bisect_left(names, (query,))
+    prefix = []
+    for lower_name, merchant in itertools.islice(names, start, None):
+        if not lower_name.startswith(query):
+            break
+        prefix.append(merchant)
+    results = heapq.nlargest(limit, prefix, key=rank)
+    for matcher in [lambda name: query in name, lambda name: _is_subsequence(query, name)]:
+        if len(results) >= limit:
+            break
+        found = set(results)
+        candidates = [merchant for lower_name, merchant in names if merchant not in found and matcher(lower_name)]
+        results += heapq.nlargest(limit - len(results), candidates, key=rank)
+    return results
+
+
+def _sorted_names(merchants):
+    # (小写名称, 名称) 的有序列表，商户集合变化时重建
+    if 'sorted_names' not in _index:
+        _index['sorted_names'] = sorted((merchant.lower(), merchant) for merchant in merchants)
+    return _index['sorted_names']
+
+
+def merchant_info(merchant):
+    # 商户最近一次使用的类别/子类别/账户等信息，未知商户返回 None
+    return load_merchant_index().get(merchant)
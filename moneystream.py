@@ -0,0 +1,429 @@
+import argparse
+from datetime import datetime
+
+import pandas as pd
+
+import links
+import util
+
+# 记账操作的服务层：新增交易和转账、退款、报销、账户和类别的增删改
+# 页面和命令行共用这些函数，不依赖 streamlit/plotly；校验失败时抛出 ValueError，信息可直接显示给用户
+# 每个函数返回操作记录（见 history.py），页面据此提供撤销/重做
+account_types = ['借记卡', '信用卡', '电子钱包', '理财']
+transaction_fields = ['Date', 'TransactionType', 'CategoryName', 'SubcategoryName', 'Amount', 'AccountName',
+                      'Remarks', 'Merchant', 'Item']
+
+
+def _date_text(date=None, date_format='%Y-%m-%d %H:%M:%S'):
+    # 未指定日期时取今天
+    return pd.Timestamp(datetime.now().date() if date is None else date).strftime(date_format)
+
+
+def _now():
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _check_transactions(df, catalog):
+    # 校验待新增的交易，有错误时抛出第一条
+    category_types = {category: transaction_type for transaction_type in util.transaction_types
+                      for category in catalog.categories(transaction_type)}
+    valid_subcategory = pd.Series([subcategory is None or catalog.subcategory_id(category, subcategory) is not None
+                                   for category, subcategory in zip(df['CategoryName'], df['SubcategoryName'])],
+                                  index=df.index)
+    # (错误原因, 出错的行, 错误信息中显示的列)
+    checks = [
+        ('日期无效', df['Date'].isna(), 'Date'),
+        ('金额无效', df['Amount'].isna() | df['Amount'].lt(0), 'Amount'),
+        ('收支类型无效', ~df['TransactionType'].isin(util.transaction_types), 'TransactionType'),
+        ('账户不存在', ~df['AccountName'].isin(catalog.accounts_by_name), 'AccountName'),
+        ('类别不存在', ~df['CategoryName'].isin(category_types), 'CategoryName'),
+        ('类别与收支类型不符', df['CategoryName'].map(category_types).ne(df['TransactionType']) &
+         df['CategoryName'].isin(category_types), 'CategoryName'),
+        ('子类别不属于该类别', ~valid_subcategory, 'SubcategoryName'),
+    ]
+    for reason, mask, column in checks:
+        if mask.any():
+            raise ValueError(f'{reason}：{df.loc[mask, column].iloc[0]}')
+
+
+def add_transactions(rows, backdated=False):
+    # 一次新增多笔交易：rows 为 DataFrame 或字典列表（列见 transaction_fields），整批校验后一次写入
+    # 账户余额按账户汇总后调整；补记的交易不更新账户余额，改为调整期初余额
+    df = pd.DataFrame(rows).reindex(columns=transaction_fields)
+    if df.empty:
+        return []
+    df['Date'] = pd.to_datetime(df['Date'].fillna(_date_text()), errors='coerce', format='mixed')
+    df['Amount'] = pd.to_numeric(df['Amount'], errors='coerce').round(2)
+    df['SubcategoryName'] = df['SubcategoryName'].astype(object).where(
+        df['SubcategoryName'].notna() & df['SubcategoryName'].ne(''), None)
+    for column in ['Remarks', 'Merchant', 'Item']:
+        df[column] = df[column].fillna('')
+    _check_transactions(df, util.dimension_catalog())
+    df['Date'] = df['Date'].dt.strftime('%Y-%m-%d %H:%M:%S')
+    df['TransactionID'] = util.allocate_transaction_ids(len(df))
+    batch = util.TransactionBatch()
+    batch.add_transactions(df, backdated)
+    return batch.commit()
+
+
+def add_transaction(transaction_type, category, amount, account, subcategory=None, date=None, merchant='', item='',
+                    remarks='', backdated=False):
+    return add_transactions([{'Date': _date_text(date), 'TransactionType': transaction_type,
+                              'CategoryName': category, 'SubcategoryName': subcategory, 'Amount': amount,
+                              'AccountName': account, 'Remarks': remarks, 'Merchant': merchant, 'Item': item}],
+                            backdated)
+
+
+def add_transfer(from_account, to_account, amount, date=None, remarks='', backdated=False):
+    # 生成转出和转入两笔互相关联的交易记录
+    if from_account == to_account:
+        raise ValueError('转出账户和转入账户不能相同！')
+    if amount <= 0:
+        raise ValueError('转账金额必须大于0！')
+    catalog = util.dimension_catalog()
+    for account_name in [from_account, to_account]:
+        if catalog.account(account_name) is None:
+            raise ValueError(f'账户不存在：{account_name}')
+    out_id, in_id = util.allocate_transaction_ids(2)
+    date_text = _date_text(date)
+    batch = util.TransactionBatch()
+    batch.add(TransactionID=out_id, Date=date_text, TransactionType='支出', CategoryName='转账',
+              SubcategoryName='转账', Amount=amount, AccountName=from_account, Merchant='系统转账',
+              Remarks=f'转账至{to_account}' + remarks, Item='转账', RelatedTransactionID=in_id)
+    batch.add(TransactionID=in_id, Date=date_text, TransactionType='收入', CategoryName='转账',
+              SubcategoryName='转账', Amount=amount, AccountName=to_account, Merchant='系统转账',
+              Remarks=f'来自{from_account}的转账' + remarks, Item='转账', RelatedTransactionID=out_id)
+    # 补记的转账不更新账户余额，改为调整期初余额
+    batch.adjust_balance(from_account, -amount, backdated=backdated)
+    batch.adjust_balance(to_account, amount, backdated=backdated)
+    return batch.commit()
+
+
+def _open_transaction(transaction_id):
+    row = links.get_transaction(transaction_id)
+    if row is None:
+        raise ValueError(f'未找到交易：{transaction_id}')
+    if row['IsRefund']:
+        raise ValueError(f'交易 {transaction_id} 已退款或报销')
+    return row
+
+
+def refund_transaction(transaction_id):
+    # 新增一笔退款收入，原交易标记为已退款，两者互相关联，退款金额退回原账户
+    row = _open_transaction(transaction_id)
+    batch = util.TransactionBatch()
+    refund_id = batch.add(
+        Date=_date_text(date_format='%Y-%m-%d'),
+        TransactionType='收入',
+        CategoryName='收入',
+        SubcategoryName='退款',
+        Amount=row['Amount'],
+        AccountName=row['AccountName'],
+        Remarks='退款',
+        Merchant=row['Merchant'],
+        Item=f"退款-{row['Item']}",
+        IsRefund=True,
+        RelatedTransactionID=int(transaction_id),
+    )
+    batch.update(transaction_id, IsRefund=True, RelatedTransactionID=refund_id)
+    batch.adjust_balance(row['AccountName'], row['Amount'])
+    return batch.commit()
+
+
+def reimburse_transactions(transaction_ids, account, amounts=None, merchants=None):
+    # 为每笔交易新增一笔报销收入并标记原交易，报销金额计入 account
+    # amounts/merchants: {交易ID: 报销金额/报销商户}，未给出时取原交易的金额和商户
+    if not transaction_ids:
+        raise ValueError('请选择要报销的交易')
+    if util.dimension_catalog().account(account) is None:
+        raise ValueError(f'账户不存在：{account}')
+    amounts, merchants = amounts or {}, merchants or {}
+    rows = [_open_transaction(transaction_id) for transaction_id in transaction_ids]
+    batch = util.TransactionBatch()
+    new_ids = util.allocate_transaction_ids(len(rows))
+    for row, new_id in zip(rows, new_ids):
+        transaction_id = row['TransactionID']
+        amount = amounts.get(transaction_id, row['Amount'])
+        batch.add(
+            TransactionID=new_id,
+            Date=_now(),
+            TransactionType='收入',
+            CategoryName='收入',
+            SubcategoryName='报销',
+            Amount=amount,
+            AccountName=account,
+            Merchant=merchants.get(transaction_id, row['Merchant']),
+            Item=f"{row['Merchant']}_{row['Item']}报销",
+            RelatedTransactionID=int(transaction_id),
+        )
+        batch.update(transaction_id, IsRefund=True, RelatedTransactionID=new_id)
+        batch.adjust_balance(account, amount)
+    return batch.commit()
+
+
+def _rows_step(file_name, key, before_rows, after_rows):
+    util.replace_rows(file_name, key, before_rows, after_rows)
+    return {'op': 'rows', 'file_name': file_name, 'key': key, 'before': before_rows, 'after': after_rows}
+
+
+def _account_row(account_name):
+    accounts_df = util.load_account_data()
+    row = accounts_df[accounts_df['AccountName'] == account_name]
+    if row.empty:
+        raise ValueError(f'未找到账户：{account_name}')
+    return accounts_df, row.index[0]
+
+
+def add_account(account_name, account_type, balance=0.0, suffix='', description='', is_locked=False):
+    if not account_name:
+        raise ValueError('账户名称不能为空！')
+    if util.dimension_catalog().account(account_name) is not None:
+        raise ValueError('该账户名称已存在！')
+    if account_type not in account_types:
+        raise ValueError(f'账户类型无效：{account_type}')
+    accounts_df = util.load_account_data()
+    new_account = pd.DataFrame({
+        'AccountID': [int(accounts_df['AccountID'].max()) + 1 if not accounts_df.empty else 1],
+        'AccountName': [account_name],
+        'AccountType': [account_type],
+        'Description': [description],
+        'AccountSuffix': [suffix if suffix else None],
+        'IsLocked': ['是' if is_locked else '否'],
+        'Balance': [balance],
+        'IsValid': ['是'],
+        'LastModifiedTime': [_now()],
+        'OpeningBalance': [balance]
+    })
+    after_rows = util.table_rows(new_account, 'AccountID', new_account['AccountID'])
+    return [_rows_step('Account.csv', 'AccountID', [], after_rows)]
+
+
+def update_account(account_name, new_name=None, account_type=None, description=None, suffix=None, is_locked=None,
+                   balance=None):
+    # 只修改给出的字段；交易记录中只保存账户ID，改名只需修改账户表
+    accounts_df, index = _account_row(account_name)
+    if new_name and new_name != account_name and util.dimension_catalog().account(new_name) is not None:
+        raise ValueError('该账户名称已存在！')
+    if account_type is not None and account_type not in account_types:
+        raise ValueError(f'账户类型无效：{account_type}')
+    update_data = {'AccountName': new_name or None, 'AccountType': account_type, 'Description': description,
+                   'IsLocked': None if is_locked is None else '是' if is_locked else '否', 'Balance': balance}
+    update_data = {column: value for column, value in update_data.items() if value is not None}
+    if suffix is not None:
+        update_data['AccountSuffix'] = suffix if suffix else None
+    update_data.update(IsValid='是', LastModifiedTime=_now())
+    account_ids = [accounts_df.at[index, 'AccountID']]
+    before_rows = util.table_rows(accounts_df, 'AccountID', account_ids)
+    # 手动修改余额视为校正，期初余额同步调整，使余额与账本保持一致
+    if balance is not None and 'OpeningBalance' in accounts_df.columns and \
+            pd.notna(accounts_df.at[index, 'OpeningBalance']):
+        update_data['OpeningBalance'] = round(
+            accounts_df.at[index, 'OpeningBalance'] + balance - accounts_df.at[index, 'Balance'], 2)
+    accounts_df.loc[index, list(update_data)] = list(update_data.values())
+    after_rows = util.table_rows(accounts_df, 'AccountID', account_ids)
+    return [_rows_step('Account.csv', 'AccountID', before_rows, after_rows)]
+
+
+def delete_account(account_name):
+    # 将账户标记为无效，而不是直接删除
+    accounts_df, index = _account_row(account_name)
+    account_ids = [accounts_df.at[index, 'AccountID']]
+    before_rows = util.table_rows(accounts_df, 'AccountID', account_ids)
+    accounts_df.loc[index, ['IsValid', 'LastModifiedTime']] = ['否', _now()]
+    after_rows = util.table_rows(accounts_df, 'AccountID', account_ids)
+    return [_rows_step('Account.csv', 'AccountID', before_rows, after_rows)]
+
+
+def add_category(category_name, transaction_type, description=''):
+    if not category_name:
+        raise ValueError('类别名称不能为空！')
+    if transaction_type not in util.transaction_types:
+        raise ValueError(f'收支类型无效：{transaction_type}')
+    categories_df = util.load_categories_data()
+    if category_name in categories_df['CategoryName'].values:
+        raise ValueError('该类别名称已存在！')
+    new_category_id = int(categories_df['CategoryID'].max()) + 1 if not categories_df.empty else 1
+    new_category = pd.DataFrame({
+        'CategoryID': [new_category_id],
+        'CategoryName': [category_name],
+        'Description': [description],
+        'TransactionType': [transaction_type]
+    })
+    after_rows = util.table_rows(new_category, 'CategoryID', [new_category_id])
+    return [_rows_step('Categories.csv', 'CategoryID', [], after_rows)]
+
+
+def add_subcategory(category_name, subcategory_name, description=''):
+    if not subcategory_name:
+        raise ValueError('子类别名称不能为空！')
+    catalog = util.dimension_catalog()
+    if category_name not in catalog.categories():
+        raise ValueError(f'类别不存在：{category_name}')
+    if catalog.subcategory_id(category_name, subcategory_name) is not None:
+        raise ValueError('该子类别名称在所选类别下已存在！')
+    new_subcategory_id = util.next_dimension_id('Subcategories.csv', 'SubcategoryID', 1)
+    new_subcategory = pd.DataFrame({
+        'SubcategoryID': [new_subcategory_id],
+        'SubcategoryName': [subcategory_name],
+        'ParentCategoryName': [category_name],
+        'Description': [description]
+    })
+    after_rows = util.table_rows(new_subcategory, 'SubcategoryID', [new_subcategory_id])
+    return [_rows_step('Subcategories.csv', 'SubcategoryID', [], after_rows)]
+
+
+def _subcategory_rows(category_name, subcategory_name):
+    subcategories_df = util.load_subcategories_data()
+    ids = subcategories_df.loc[(subcategories_df['ParentCategoryName'] == category_name) &
+                               (subcategories_df['SubcategoryName'] == subcategory_name), 'SubcategoryID']
+    if ids.empty:
+        raise ValueError(f'未找到子类别：{category_name}/{subcategory_name}')
+    return util.table_rows(subcategories_df, 'SubcategoryID', ids)
+
+
+def delete_subcategory(category_name, subcategory_name):
+    # 存在使用该子类别的交易记录时不能删除（可以改用 merge_subcategory）
+    before_rows = _subcategory_rows(category_name, subcategory_name)
+    if not util.query_transactions(category=[category_name], subcategory=[subcategory_name]).empty:
+        raise ValueError(f'无法删除子类别 {subcategory_name}，因为存在使用该子类别的交易记录！')
+    return [_rows_step('Subcategories.csv', 'SubcategoryID', before_rows, [])]
+
+
+def merge_subcategory(category_name, subcategory_name, target_category, target_subcategory):
+    # 交易记录中只保存子类别ID：原子类别移入 SubcategoryAliases.csv 并指向目标子类别，交易记录无需修改
+    if category_name == target_category and subcategory_name == target_subcategory:
+        raise ValueError('原子类别和目标子类别不能相同！')
+    before_rows = _subcategory_rows(category_name, subcategory_name)
+    target_id = util.dimension_catalog().subcategory_id(target_category, target_subcategory)
+    if target_id is None:
+        raise ValueError(f'未找到子类别：{target_category}/{target_subcategory}')
+    alias_rows = [{'SubcategoryID': row['SubcategoryID'], 'SubcategoryName': row['SubcategoryName'],
+                   'ParentCategoryName': row['ParentCategoryName'], 'MergedIntoID': int(target_id)}
+                  for row in before_rows]
+    return [_rows_step('Subcategories.csv', 'SubcategoryID', before_rows, []),
+            _rows_step('SubcategoryAliases.csv', 'SubcategoryID', [], alias_rows)]
+
+
+def _run(args):
+    if args.command == 'add':
+        if args.file:
+            rows = pd.read_csv(args.file, dtype=str, encoding=args.encoding)
+            return add_transactions(rows, args.backdated), f'已添加 {len(rows)} 笔交易'
+        if not (args.type and args.category and args.amount is not None and args.account):
+            raise ValueError('请指定 --type、--category、--amount 和 --account，或使用 --file')
+        return add_transaction(args.type, args.category, args.amount, args.account, args.subcategory, args.date,
+                               args.merchant, args.item, args.remarks, args.backdated), '交易已添加'
+    if args.command == 'transfer':
+        return add_transfer(args.from_account, args.to_account, args.amount, args.date, args.remarks,
+                            args.backdated), '转账成功'
+    if args.command == 'refund':
+        return refund_transaction(args.transaction_id), '退款处理成功'
+    if args.command == 'reimburse':
+        amounts = dict(zip(args.transaction_ids, args.amount)) if args.amount else None
+        return reimburse_transactions(args.transaction_ids, args.account, amounts), '报销处理成功'
+    if args.command == 'account-add':
+        return add_account(args.name, args.type, args.balance, args.suffix, args.description, args.locked), \
+            f'已新增账户 {args.name}'
+    if args.command == 'account-update':
+        locked = {'yes': True, 'no': False}.get(args.locked)
+        return update_account(args.name, args.new_name, args.type, args.description, args.suffix, locked,
+                              args.balance), f'已修改账户 {args.name}'
+    if args.command == 'account-delete':
+        return delete_account(args.name), f'账户 {args.name} 已标记为无效'
+    if args.command == 'category-add':
+        return add_category(args.name, args.type, args.description), f'已新增类别 {args.name}'
+    if args.command == 'subcategory-add':
+        return add_subcategory(args.category, args.name, args.description), f'已新增子类别 {args.name}'
+    if args.command == 'subcategory-delete':
+        return delete_subcategory(args.category, args.name), f'已删除子类别 {args.name}'
+    if args.command == 'subcategory-merge':
+        return merge_subcategory(args.category, args.name, args.target_category, args.target), \
+            f'已将子类别 {args.name} 调整为 {args.target}'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='MoneyStream 命令行记账（不启动页面）')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    add = commands.add_parser('add', help='新增交易')
+    add.add_argument('--type', choices=util.transaction_types, help='收支类型')
+    add.add_argument('--category', help='类别')
+    add.add_argument('--subcategory', help='子类别')
+    add.add_argument('--amount', type=float, help='金额')
+    add.add_argument('--account', help='账户')
+    add.add_argument('--date', help='日期，默认为今天')
+    add.add_argument('--merchant', default='', help='商户')
+    add.add_argument('--item', default='', help='商品')
+    add.add_argument('--remarks', default='', help='备注')
+    add.add_argument('--file', help='从 CSV 文件批量新增，列名同交易表：Date、TransactionType、CategoryName ...')
+    add.add_argument('--encoding', default='utf-8', help='CSV 文件编码')
+    add.add_argument('--backdated', action='store_true', help='补记：不更新账户余额，改为调整期初余额')
+
+    transfer = commands.add_parser('transfer', help='新增转账')
+    transfer.add_argument('from_account', help='转出账户')
+    transfer.add_argument('to_account', help='转入账户')
+    transfer.add_argument('amount', type=float, help='转账金额')
+    transfer.add_argument('--date', help='日期，默认为今天')
+    transfer.add_argument('--remarks', default='', help='备注')
+    transfer.add_argument('--backdated', action='store_true', help='补记：不更新账户余额，改为调整期初余额')
+
+    refund = commands.add_parser('refund', help='退款')
+    refund.add_argument('transaction_id', type=int, help='要退款的交易ID')
+
+    reimburse = commands.add_parser('reimburse', help='报销')
+    reimburse.add_argument('transaction_ids', type=int, nargs='+', help='要报销的交易ID')
+    reimburse.add_argument('--account', required=True, help='报销入账账户')
+    reimburse.add_argument('--amount', type=float, nargs='+', help='各笔交易的报销金额，默认为原金额')
+
+    account_add = commands.add_parser('account-add', help='新增账户')
+    account_add.add_argument('name', help='账户名称')
+    account_add.add_argument('--type', choices=account_types, required=True, help='账户类型')
+    account_add.add_argument('--balance', type=float, default=0.0, help='初始余额')
+    account_add.add_argument('--suffix', default='', help='账户后缀')
+    account_add.add_argument('--description', default='', help='账户描述')
+    account_add.add_argument('--locked', action='store_true', help='锁定')
+
+    account_update = commands.add_parser('account-update', help='修改账户')
+    account_update.add_argument('name', help='账户名称')
+    account_update.add_argument('--new-name', help='新的账户名称')
+    account_update.add_argument('--type', choices=account_types, help='账户类型')
+    account_update.add_argument('--balance', type=float, help='余额')
+    account_update.add_argument('--suffix', help='账户后缀')
+    account_update.add_argument('--description', help='账户描述')
+    account_update.add_argument('--locked', choices=['yes', 'no'], help='是否锁定')
+
+    account_delete = commands.add_parser('account-delete', help='删除账户（标记为无效）')
+    account_delete.add_argument('name', help='账户名称')
+
+    category_add = commands.add_parser('category-add', help='新增类别')
+    category_add.add_argument('name', help='类别名称')
+    category_add.add_argument('--type', choices=util.transaction_types, required=True, help='类别类型')
+    category_add.add_argument('--description', default='', help='类别描述')
+
+    subcategory_add = commands.add_parser('subcategory-add', help='新增子类别')
+    subcategory_add.add_argument('category', help='所属类别')
+    subcategory_add.add_argument('name', help='子类别名称')
+    subcategory_add.add_argument('--description', default='', help='子类别描述')
+
+    subcategory_delete = commands.add_parser('subcategory-delete', help='删除子类别')
+    subcategory_delete.add_argument('category', help='所属类别')
+    subcategory_delete.add_argument('name', help='子类别名称')
+
+    subcategory_merge = commands.add_parser('subcategory-merge', help='将子类别合并到另一个子类别')
+    subcategory_merge.add_argument('category', help='原子类别所属类别')
+    subcategory_merge.add_argument('name', help='原子类别')
+    subcategory_merge.add_argument('target_category', help='目标子类别所属类别')
+    subcategory_merge.add_argument('target', help='目标子类别')
+
+    args = parser.parse_args(argv)
+    if args.command == 'reimburse' and args.amount and len(args.amount) != len(args.transaction_ids):
+        parser.error('--amount 的个数必须与交易ID的个数相同')
+    try:
+        _, message = _run(args)
+    except ValueError as e:
+        parser.exit(1, f'{e}\n')
+    print(message)
+
+
+if __name__ == '__main__':
+    main()
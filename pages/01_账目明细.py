@@ -1,75 +1,64 @@
 import streamlit as st
-import pandas as pd
-from datetime import datetime
 
-from util import *
+from util import apply_transaction_schema, changed_transactions, diff_transactions, dimension_catalog, \
+    query_date_range, query_distinct, query_transactions, save_transaction_edits, to_storage_frame, \
+    validate_transactions
+from history_ui import history_buttons, record_operation
+from fulltext import search_transactions
+from export_ui import export_buttons
 
 st.header('账目明细')
 
 # 读取数据
-transactions_df, _, subcategories_df, _ = load_data()
-transactions_df.sort_values('Date', ascending=False, inplace=True)
+catalog = dimension_catalog()
 
 # 筛选条件
 
+# 全文搜索：商户、商品和备注
+keyword = st.sidebar.text_input('搜索', placeholder='商户/商品/备注，多个关键词用空格分隔')
+
 # 日期范围筛选
-start_date = st.sidebar.date_input('开始日期', pd.to_datetime(transactions_df['Date']).min())
-end_date = st.sidebar.date_input('结束日期', pd.to_datetime(transactions_df['Date']).max())
+min_date, max_date = query_date_range()
+start_date = st.sidebar.date_input('开始日期', min_date)
+end_date = st.sidebar.date_input('结束日期', max_date)
 
 # 交易类型筛选
-transaction_types = ['全部'] + list(transactions_df['TransactionType'].unique())
+transaction_types = ['全部'] + query_distinct('TransactionType')
 selected_type = st.sidebar.selectbox('交易类型', transaction_types)
 
 # 账户筛选
-accounts = list(transactions_df['AccountName'].unique())
+accounts = query_distinct('AccountName')
 selected_account = st.sidebar.selectbox('账户', ['全部'] + accounts)
 
 # 类别筛选
-categories = list(transactions_df['CategoryName'].unique())
+categories = query_distinct('CategoryName')
 selected_category = st.sidebar.selectbox('类别', ['全部'] + categories)
 
 # 子类别筛选
 if selected_category != '全部':
-    subcategories = list(
-        subcategories_df[subcategories_df['ParentCategoryName'] == selected_category]['SubcategoryName'].unique())
+    subcategories = list(dict.fromkeys(catalog.subcategories(selected_category)))
     selected_subcategory = st.sidebar.selectbox('子类别', ['全部'] + subcategories)
 else:
-    subcategories = list(subcategories_df['SubcategoryName'].unique())
+    subcategories = catalog.subcategory_names
     selected_subcategory = '全部'
 
 # 是否为报销项
 reimbursable_options = ['全部', '是', '否']
 selected_reimbursable = st.sidebar.selectbox('是否已报销', reimbursable_options)
 
-# 应用筛选条件
-filtered_df = transactions_df.copy()
-
-# 日期筛选
-filtered_df['Date'] = pd.to_datetime(filtered_df['Date'])
-filtered_df = filtered_df[
-    (filtered_df['Date'].dt.date >= start_date) &
-    (filtered_df['Date'].dt.date <= end_date)
-    ]
-
-# 交易类型筛选
-if selected_type != '全部':
-    filtered_df = filtered_df[filtered_df['TransactionType'] == selected_type]
-
-# 账户筛选
-if selected_account != '全部':
-    filtered_df = filtered_df[filtered_df['AccountName'] == selected_account]
-
-# 类别筛选
-if selected_category != '全部':
-    filtered_df = filtered_df[filtered_df['CategoryName'] == selected_category]
-
-# 子类别筛选
-if selected_subcategory != '全部':
-    filtered_df = filtered_df[filtered_df['SubcategoryName'] == selected_subcategory] \
- \
-# 报销项筛选
+# 应用筛选条件（SQLite 后端下推为 SQL 查询）
+filters = {'start_date': start_date, 'end_date': end_date}
+for key, value in [('transaction_type', selected_type), ('account', selected_account),
+                   ('category', selected_category), ('subcategory', selected_subcategory)]:
+    if value != '全部':
+        filters[key] = value
 if selected_reimbursable != '全部':
-    filtered_df = filtered_df[filtered_df['IsRefund'] == selected_reimbursable]
+    filters['is_refund'] = selected_reimbursable == '是'
+filtered_df = query_transactions(**filters)
+matched_ids = search_transactions(keyword) if keyword.strip() else None
+if matched_ids is not None:
+    filtered_df = filtered_df[filtered_df['TransactionID'].isin(matched_ids)]
+filtered_df = filtered_df.sort_values('Date', ascending=False)
 
 # 显示筛选后的数据
 if not filtered_df.empty:
@@ -112,19 +101,29 @@ if not filtered_df.empty:
         'AccountName': st.column_config.SelectboxColumn('账户', options=accounts, required=True, disabled=True),
         'Merchant': st.column_config.TextColumn('商户'),
         'Remarks': st.column_config.TextColumn('备注'),
-        'IsRefund': st.column_config.SelectboxColumn('已报销', options=['是', '否'], required=True)
+        'IsRefund': st.column_config.CheckboxColumn('已报销')
     }, column_order=display_columns, hide_index=True, use_container_width=True)
     # todo: 子类别还不能和类别联动
 
     if st.button('保存'):
-        updated_transactions_df = transactions_df.set_index('TransactionID')
-        edited_transactions_df = edited_transactions_df.set_index('TransactionID')
-        updated_transactions_df.loc[
-            edited_transactions_df.index, edited_transactions_df.columns] = edited_transactions_df
-        updated_transactions_df.reset_index(inplace=True)
-        save_data(updated_transactions_df, 'Transactions.csv')
-        st.success('交易记录已更新')
+        # 只保存被修改的单元格
+        patches = diff_transactions(filtered_df, edited_transactions_df)
+        problems = validate_transactions(apply_transaction_schema(to_storage_frame(
+            changed_transactions(edited_transactions_df, patches))))
+        if problems:
+            st.error('交易记录校验失败：\n' + '\n'.join(problems))
+        else:
+            steps = save_transaction_edits(filtered_df, edited_transactions_df, patches)
+            record_operation('编辑交易记录', steps)
+            changed_rows = sum(len(step['after']) for step in steps)
+            st.success(f'交易记录已更新（{changed_rows} 条）')
         # st.return()
 
+    # 导出当前筛选结果
+    export_buttons('details', filters, matched_ids, file_name='账目明细')
+
+    # 显示撤销/重做按钮
+    history_buttons('details')
+
 else:
     st.info('没有找到符合条件的交易记录')
@@ -1,63 +1,79 @@
 import streamlit as st
-import plotly.graph_objects as go
 import pandas as pd
-from plotly.subplots import make_subplots
-import plotly.express as px
-from util import *
+from util import apply_transaction_schema, changed_transactions, diff_transactions, dimension_catalog, \
+    query_transactions, save_transaction_edits, to_storage_frame, validate_transactions
+from history_ui import history_buttons, record_operation
+from export_ui import export_buttons
+from rollup import load_rollup
 
 st.header('收支统计')
 
-# 读取数据
-transactions_df, _, subcategories_df, _ = load_data()
+# 读取数据（统计图直接使用预先汇总的汇总表，不读取交易明细）
+catalog = dimension_catalog()
+rollup_df = load_rollup()
 # 选择交易类型
 transaction_type = st.sidebar.radio("交易类型", ['支出', '收入'])
 
-selected_transaction_df = transactions_df[(transactions_df['TransactionType'] == transaction_type) &
-                             (transactions_df['IsRefund'] == '否') & (transactions_df['Amount'] > 0)
-                             & (transactions_df['SubcategoryName']!='退款')].copy()
-selected_transaction_df['Month'] = selected_transaction_df['Date'].dt.strftime('%Y/%m')
-categories = sorted(selected_transaction_df['CategoryName'].unique().tolist())
+# 只统计金额大于 0 的交易（PositiveAmount/PositiveCount）
+selected_rollup_df = rollup_df[(rollup_df['TransactionType'] == transaction_type) &
+                               (~rollup_df['IsRefund'].astype(bool)) & (rollup_df['PositiveCount'] > 0)
+                               & (rollup_df['SubcategoryName'] != '退款')]
+categories = sorted(selected_rollup_df['CategoryName'].dropna().unique().tolist())
 
 # 创建统一的颜色序列
 # colors = ['#B5EAD7', '#C7CEEA', '#FFDAC1', '#E2F0CB', '#FFB7B2', '#D4A5A5', '#99C3CC', '#F8E9A2', '#CBE4F9', '#DAB3FF', '#A8D8B9', '#FFEEE4', '#B0E0E6', '#FDD2B5', '#C4E1D3', '#F4BBD3', '#CCE2EB', '#FFF5BA', '#D3E0EA', '#E9C7C6', '#B4EBB7', '#FED8B1', '#CBDEF8', '#E6D3E7']
 # color_map = {cat:color for cat, color in zip(categories, colors[:len(categories)])}
-grouped_transaction_df = selected_transaction_df.groupby(by=['Month', 'CategoryName'])['Amount'].sum().reset_index()
-bar = px.bar(grouped_transaction_df.sort_values(['Month', 'CategoryName']), x='Month', y='Amount', color='CategoryName',
-             category_orders={'CategoryName': categories}, color_discrete_sequence=px.colors.qualitative.Pastel_r)
-st.plotly_chart(bar)
+grouped_transaction_df = selected_rollup_df.groupby(by=['Month', 'CategoryName'])['PositiveAmount'].sum()\
+    .rename('Amount').reset_index()
+# plotly 只在绘图时导入（首次导入较慢），没有数据时不导入
+if grouped_transaction_df.empty:
+    st.info('暂无交易记录')
+else:
+    import plotly.express as px
+    bar = px.bar(grouped_transaction_df.sort_values(['Month', 'CategoryName']), x='Month', y='Amount',
+                 color='CategoryName', category_orders={'CategoryName': categories},
+                 color_discrete_sequence=px.colors.qualitative.Pastel_r)
+    st.plotly_chart(bar)
 
 # 选择月份
 # 从交易数据中提取所有月份并按时间顺序排序
-all_months = sorted(selected_transaction_df['Month'].unique())
+all_months = sorted(selected_rollup_df['Month'].unique())
 month = st.sidebar.selectbox('选择月份', ['全部']+all_months)
 # 选择类别
 category = st.sidebar.selectbox('选择类别', categories)
+if category is None:
+    st.info('暂无可统计的类别')
+    st.stop()
 
 # 根据选择的月份筛选数据，并只保留支出类型且不可报销的交易
 if month == '全部':
-    selected_data = selected_transaction_df[
-    (selected_transaction_df['CategoryName'] == category)
-    ].sort_values('Date', ascending=False)
+    selected_data = selected_rollup_df[selected_rollup_df['CategoryName'] == category]
 else:
-    selected_data = selected_transaction_df[
-        (selected_transaction_df['Date'].str.startswith(month))
-        & (selected_transaction_df['CategoryName'] == category)
-        ].sort_values('Date', ascending=False)
+    selected_data = selected_rollup_df[(selected_rollup_df['Month'] == month)
+                                       & (selected_rollup_df['CategoryName'] == category)]
 
-sub_category_sums = selected_data.groupby(['SubcategoryName'])['Amount'].sum().reset_index()
+sub_category_sums = selected_data.groupby(['SubcategoryName'])['PositiveAmount'].sum().rename('Amount').reset_index()
 
-pie=px.pie(sub_category_sums, names='SubcategoryName', values='Amount')
-st.plotly_chart(pie)
+if not sub_category_sums.empty:
+    import plotly.express as px
+    pie = px.pie(sub_category_sums, names='SubcategoryName', values='Amount')
+    st.plotly_chart(pie)
 
 # 子类别筛选
-subcategories = ['全部'] + list(subcategories_df[subcategories_df['ParentCategoryName'] == category]['SubcategoryName'].unique())
+subcategories = ['全部'] + list(dict.fromkeys(catalog.subcategories(category)))
 selected_subcategory = st.sidebar.selectbox('子类别', subcategories)
 
+# 明细表格需要完整的列：所有筛选条件合并为一次查询，选定月份时只读取该月的数据
+detail_filters = {'transaction_type': transaction_type, 'is_refund': False, 'category': category,
+                  'exclude_subcategory': '退款'}
+if month != '全部':
+    month_start = pd.Timestamp(month.replace('/', '-') + '-01')
+    detail_filters.update(start_date=month_start, end_date=month_start + pd.offsets.MonthEnd(0))
 if selected_subcategory != '全部':
-    selected_data = selected_data[(selected_data['SubcategoryName'] == selected_subcategory)]
-
-drop_columns = ['Month']
-edited_transactions_df = st.data_editor(selected_data.drop(columns=drop_columns), column_config={
+    detail_filters['subcategory'] = selected_subcategory
+detail_df = query_transactions(**detail_filters)
+detail_df = detail_df[detail_df['Amount'] > 0].sort_values('Date', ascending=False)
+edited_transactions_df = st.data_editor(detail_df, column_config={
     'Date': st.column_config.DateColumn('日期'),
     'TransactionType': st.column_config.TextColumn('类型', width='small'),
     'CategoryName': st.column_config.TextColumn('类别', width='small'),
@@ -71,13 +87,23 @@ edited_transactions_df = st.data_editor(selected_data.drop(columns=drop_columns)
                  'Item', 'Remarks'], hide_index=True, use_container_width=True)
 
 if st.button('保存'):
-    updated_transactions_df = transactions_df.set_index('TransactionID')
-    edited_transactions_df = edited_transactions_df.set_index('TransactionID')
-    updated_transactions_df.loc[
-        edited_transactions_df.index, edited_transactions_df.columns] = edited_transactions_df
-    updated_transactions_df.reset_index(inplace=True)
-    save_data(updated_transactions_df, 'Transactions.csv')
-    st.success('交易记录已更新')
+    # 只保存被修改的单元格
+    patches = diff_transactions(detail_df, edited_transactions_df)
+    problems = validate_transactions(apply_transaction_schema(to_storage_frame(
+        changed_transactions(edited_transactions_df, patches))))
+    if problems:
+        st.error('交易记录校验失败：\n' + '\n'.join(problems))
+    else:
+        steps = save_transaction_edits(detail_df, edited_transactions_df, patches)
+        record_operation('编辑交易记录', steps)
+        changed_rows = sum(len(step['after']) for step in steps)
+        st.success(f'交易记录已更新（{changed_rows} 条）')
+
+# 导出明细
+export_buttons('statistics', detail_filters, row_filter=lambda df: df['Amount'] > 0, file_name='账目统计明细')
+
+# 显示撤销/重做按钮
+history_buttons('statistics')
 
 # # 按类别汇总金额
 # category_sums = selected_month_data.groupby(['Month', 'CategoryName'])['Amount'].sum().reset_index()
@@ -0,0 +1,64 @@
+import streamlit as st
+import pandas as pd
+from util import dimension_catalog
+from history_ui import history_buttons, record_operation
+from importer import import_columns, import_statement, rejected_sample_limit
+
+st.header('批量导入账单')
+
+# 读取数据
+catalog = dimension_catalog()
+
+# 显示撤销/重做按钮
+history_buttons('import')
+
+column_labels = {'Date': '日期', 'TransactionType': '收支类型', 'CategoryName': '类别', 'SubcategoryName': '子类别',
+                 'Amount': '金额', 'AccountName': '账户', 'Remarks': '备注', 'Merchant': '商户', 'Item': '商品'}
+
+uploaded_file = st.file_uploader('选择账单文件（CSV）', type=['csv'])
+encoding = st.selectbox('文件编码', ['utf-8', 'gbk', 'utf-8-sig'])
+
+if uploaded_file is not None:
+    # 只读取表头用于设置列映射，账单内容在导入时按块读取
+    statement_columns = list(pd.read_csv(uploaded_file, nrows=0, encoding=encoding).columns)
+    uploaded_file.seek(0)
+
+    st.subheader('列映射')
+    st.caption('没有收支类型列时按金额的正负判断（负数为支出）；没有类别列时按商户和商品名称自动分类')
+    column_map = {}
+    cols = st.columns(3)
+    for i, column in enumerate(import_columns):
+        with cols[i % 3]:
+            source = st.selectbox(column_labels[column], ['（无）'] + statement_columns, key=f'map_{column}')
+        if source != '（无）':
+            column_map[source] = column
+
+    defaults = {}
+    if 'AccountName' not in column_map.values():
+        defaults['AccountName'] = st.selectbox('账单所属账户', catalog.valid_accounts)
+    is_backdated = st.checkbox('账单中的交易已反映在账户余额中（只调整期初余额）', value=True)
+
+    col1, col2 = st.columns(2)
+    with col1:
+        preview = st.button('校验')
+    with col2:
+        submit = st.button('导入')
+
+    if len(set(column_map.values())) < len(column_map):
+        st.error('同一列不能重复映射！')
+    elif 'Date' not in column_map.values() or 'Amount' not in column_map.values():
+        st.error('请设置日期和金额列！')
+    elif preview or submit:
+        summary, rejected, steps = import_statement(uploaded_file, column_map, defaults, encoding,
+                                                    backdated=is_backdated, dry_run=not submit)
+        if submit:
+            record_operation('导入账单', steps)
+            st.success(f"已导入 {summary['imported']} 条交易！")
+        else:
+            st.info(f"可导入 {summary['imported']} 条交易")
+        st.write(f"共 {summary['total']} 条，重复 {summary['duplicates']} 条，"
+                 f"拒绝 {sum(summary['rejected'].values())} 条")
+        if summary['rejected']:
+            st.dataframe(pd.DataFrame(list(summary['rejected'].items()), columns=['原因', '条数']), hide_index=True)
+            st.caption(f'被拒绝的记录（每种原因最多显示 {rejected_sample_limit} 条）')
+            st.dataframe(rejected, hide_index=True)
@@ -0,0 +1,48 @@
+import streamlit as st
+import pandas as pd
+from history_ui import history_buttons, record_operation
+from links import get_transaction
+from duplicates import dismiss_duplicate, find_duplicates, merge_duplicates
+
+st.header('疑似重复交易')
+st.caption('账户、收支类型和金额相同且日期相近的交易，按商户和商品名称的相似度排序')
+
+# 显示撤销/重做按钮
+history_buttons('duplicates')
+
+window_days = st.sidebar.number_input('日期相差不超过（天）', min_value=0, max_value=30, value=3)
+min_score = st.sidebar.slider('最低相似度', min_value=0.0, max_value=1.0, value=0.6, step=0.05)
+page_size = st.sidebar.selectbox('每页显示', [10, 20, 50], index=1)
+
+pairs = find_duplicates(window_days, min_score)
+if pairs.empty:
+    st.info('没有找到疑似重复的交易')
+    st.stop()
+
+# 分页显示
+page_count = (len(pairs) - 1) // page_size + 1
+page = st.sidebar.number_input('页码', min_value=1, max_value=page_count, value=1)
+st.write(f'共 {len(pairs)} 对疑似重复的交易，第 {page}/{page_count} 页')
+display_columns = ['TransactionID', 'Date', 'TransactionType', 'CategoryName', 'SubcategoryName', 'Amount',
+                   'AccountName', 'Merchant', 'Item', 'Remarks']
+
+for pair in pairs.iloc[(page - 1) * page_size:page * page_size].itertuples(index=False):
+    left, right = get_transaction(pair.TransactionID), get_transaction(pair.DuplicateID)
+    if left is None or right is None:
+        continue
+    st.markdown('---')
+    st.markdown(f'**相似度 {pair.Score:.2f}**，日期相差 {pair.DayGap} 天')
+    st.dataframe(pd.DataFrame([left, right])[display_columns], hide_index=True, use_container_width=True)
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        if st.button('保留第一条，合并第二条', key=f'keep_{pair.TransactionID}_{pair.DuplicateID}'):
+            record_operation('合并重复交易', merge_duplicates(pair.TransactionID, pair.DuplicateID))
+            st.rerun()
+    with col2:
+        if st.button('保留第二条，合并第一条', key=f'keep_{pair.DuplicateID}_{pair.TransactionID}'):
+            record_operation('合并重复交易', merge_duplicates(pair.DuplicateID, pair.TransactionID))
+            st.rerun()
+    with col3:
+        if st.button('不是重复', key=f'dismiss_{pair.TransactionID}_{pair.DuplicateID}'):
+            dismiss_duplicate(pair.TransactionID, pair.DuplicateID)
+            st.rerun()
@@ -1,26 +1,21 @@
 import streamlit as st
 import pandas as pd
 from datetime import datetime
-from util import *
+from util import dimension_catalog, load_account_data
+from history_ui import history_buttons, record_operation
+from moneystream import account_types, add_account, delete_account, update_account
+from balances import balance_as_of, balance_history, balance_report, rebuild_balances
 
-account_types = ['借记卡', '信用卡','电子钱包', '理财']
-
-# 读取数据
-transactions_df, categories_df, subcategories_df, accounts_df = load_data()
+# 读取数据（只需要账户表，不读取交易记录）
+accounts_df = load_account_data()
+catalog = dimension_catalog()
 
 st.set_page_config(layout="wide")
 
 st.header('账户管理页面')
 
-# 初始化会话状态
-if 'previous_accounts_df' not in st.session_state:
-    st.session_state.previous_accounts_df = None
-if 'show_undo_add' not in st.session_state:
-    st.session_state.show_undo_add = False
-if 'show_undo_delete' not in st.session_state:
-    st.session_state.show_undo_delete = False
-if 'show_undo_edit' not in st.session_state:
-    st.session_state.show_undo_edit = False
+# 显示撤销/重做按钮
+history_buttons('accounts')
 
 # 显示按类型分组的账户余额
 # st.subheader('按类型显示账户余额')
@@ -50,9 +45,8 @@ if show_balance:
                 )
                 
                 # 显示该类型的所有账户详情
-                type_accounts = accounts_df[accounts_df['AccountType'] == acc_type]
-                for _, acc in type_accounts.iterrows():
-                    if abs(acc['Balance']) > 100:
+                for acc in catalog.accounts_by_type.get(acc_type, []):
+                    if acc['Balance'] is not None and abs(acc['Balance']) > 100:
                         st.markdown(f"**{acc['AccountName']}**")
                         st.markdown(f"¥{acc['Balance']:,.2f}")
             else:
@@ -108,57 +102,26 @@ with st.form('add_account_form'):
     
     with col3:
         add_description = st.text_input('账户描述')
-        add_is_locked = '是' if st.checkbox('是否锁定', value=False) else '否'
+        add_is_locked = st.checkbox('是否锁定', value=False)
 
     
     add_submit = st.form_submit_button('添加账户')
     
     if add_submit:
-        if add_name in accounts_df['AccountName'].values:
-            st.error('该账户名称已存在！')
-        elif not add_name:
-            st.error('账户名称不能为空！')
-        else:
-            # 保存当前状态
-            st.session_state.previous_accounts_df = accounts_df.copy()
-            st.session_state.show_undo_add = True
-            st.session_state.show_undo_delete = False
-            st.session_state.show_undo_edit = False
-            
-            current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            new_account = pd.DataFrame({
-                'AccountID': [max(accounts_df['AccountID']) + 1],
-                'AccountName': [add_name],
-                'AccountType': [add_type],
-                'Description': [add_description],
-                'AccountSuffix': [add_suffix if add_suffix else None],
-                'IsLocked': [add_is_locked],
-                'Balance': [add_balance],
-                'IsValid': ['是'],
-                'LastModifiedTime': [current_time]
-            })
-            accounts_df = pd.concat([accounts_df, new_account], ignore_index=True)
-            save_data(accounts_df, 'Account.csv')
+        try:
+            record_operation(f'新增账户 {add_name}', add_account(add_name, add_type, add_balance, add_suffix,
+                                                              add_description, add_is_locked))
             st.success('账户添加成功！')
             st.rerun()
-
-if st.session_state.show_undo_add:
-    if st.button('撤销新增操作'):
-        accounts_df = st.session_state.previous_accounts_df.copy()
-        save_data(accounts_df, 'Account.csv')
-        st.session_state.previous_accounts_df = None
-        st.session_state.show_undo_add = False
-        st.session_state.show_undo_delete = False
-        st.session_state.show_undo_edit = False
-        st.success('已撤销上一次操作！')
-        st.rerun()
+        except ValueError as e:
+            st.error(str(e))
 
 # 修改账户
 st.subheader('修改账户')
 edit_account = st.selectbox('选择要修改的账户', accounts_df['AccountName'].tolist())
 
 if edit_account:
-    account_data = accounts_df[accounts_df['AccountName'] == edit_account].iloc[0]
+    account_data = catalog.account(edit_account)
     
     with st.form('edit_account_form'):
         col1, col2, col3 = st.columns(3)
@@ -173,83 +136,64 @@ if edit_account:
         
         with col3:
             new_balance = st.number_input('余额', value=float(account_data['Balance']), step=1.0)
-            new_is_locked = '是' if st.checkbox('是否锁定', value=account_data['IsLocked']=='是') else '否'
+            new_is_locked = st.checkbox('是否锁定', value=account_data['IsLocked']=='是')
         
         submit_button = st.form_submit_button('保存修改')
         
         if submit_button:
-            if new_name and new_name != edit_account and new_name in accounts_df['AccountName'].values:
-                st.error('该账户名称已存在！')
-            else:
-                # 保存当前状态
-                st.session_state.previous_accounts_df = accounts_df.copy()
-                st.session_state.show_undo_edit = True
-                st.session_state.show_undo_add = False
-                st.session_state.show_undo_delete = False
-                
-                current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                # 使用一次性更新所有字段
-                update_data = {
-                    'AccountName': new_name,
-                    'AccountType': new_type,
-                    'Description': new_description,
-                    'AccountSuffix': new_suffix if new_suffix else None,
-                    'IsLocked': new_is_locked,
-                    'Balance': new_balance,
-                    'IsValid': '是',
-                    'LastModifiedTime': current_time
-                }
-                accounts_df.loc[accounts_df['AccountName'] == edit_account, update_data.keys()] = update_data.values()
-                
-                # 更新交易记录中的账户名称
-                if new_name != edit_account:
-                    transactions_df = load_transactions_data()
-                    transactions_df.loc[transactions_df['AccountName'] == edit_account, 'AccountName'] = new_name
-                    save_data(transactions_df, 'Transactions.csv')
-
-                save_data(accounts_df, 'Account.csv')
+            # 交易记录中只保存账户ID，改名只需修改账户表；手动修改余额时期初余额同步调整
+            try:
+                record_operation(f'修改账户 {edit_account}', update_account(
+                    edit_account, new_name, new_type, new_description, new_suffix, new_is_locked, new_balance))
                 st.success('账户信息已更新！')
                 st.rerun()
-
-if st.session_state.show_undo_edit:
-    if st.button('撤销修改操作'):
-        accounts_df = st.session_state.previous_accounts_df.copy()
-        save_data(accounts_df, 'Account.csv')
-        st.session_state.previous_accounts_df = None
-        st.session_state.show_undo_add = False
-        st.session_state.show_undo_delete = False
-        st.session_state.show_undo_edit = False
-        st.success('已撤销上一次操作！')
-        st.rerun()
+            except ValueError as e:
+                st.error(str(e))
 
 # 删除账户
 st.subheader('删除账户')
-delete_account = st.selectbox('要删除的账户名称', accounts_df['AccountName'].tolist())
+delete_account_name = st.selectbox('要删除的账户名称', accounts_df['AccountName'].tolist())
 if st.button('删除账户'):
-    if delete_account in accounts_df['AccountName'].values:
-        # 保存当前状态
-        st.session_state.previous_accounts_df = accounts_df.copy()
-        st.session_state.show_undo_delete = True
-        st.session_state.show_undo_add = False
-        st.session_state.show_undo_edit = False
-        
-        # 将账户标记为无效，而不是直接删除
-        current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        accounts_df.loc[accounts_df['AccountName'] == delete_account, 'IsValid'] = '否'
-        accounts_df.loc[accounts_df['AccountName'] == delete_account, 'LastModifiedTime'] = current_time
-        save_data(accounts_df, 'Account.csv')
-        st.success(f'账户 {delete_account} 已标记为无效！')
+    # 将账户标记为无效，而不是直接删除
+    try:
+        record_operation(f'删除账户 {delete_account_name}', delete_account(delete_account_name))
+        st.success(f'账户 {delete_account_name} 已标记为无效！')
         st.rerun()
+    except ValueError as e:
+        st.error(str(e))
+
+# 余额核对：当前余额与按账本推算的余额（期初余额 + 收支合计）对比
+st.subheader('余额核对')
+if st.checkbox('核对账户余额', value=False):
+    report = balance_report()
+    drift_report = report[report['Drift'] != 0]
+    if drift_report.empty:
+        st.success('所有账户余额与账本一致')
     else:
-        st.error('未找到该账户！')
-
-if st.session_state.show_undo_delete:
-    if st.button('撤销删除操作'):
-        accounts_df = st.session_state.previous_accounts_df.copy()
-        save_data(accounts_df, 'Account.csv')
-        st.session_state.previous_accounts_df = None
-        st.session_state.show_undo_add = False
-        st.session_state.show_undo_delete = False
-        st.session_state.show_undo_edit = False
-        st.success('已撤销上一次操作！')
-        st.rerun()
+        st.dataframe(drift_report[['AccountName', 'Balance', 'DerivedBalance', 'Drift']], hide_index=True,
+                     use_container_width=True)
+        if st.button('按账本重算余额'):
+            before_rows, after_rows = rebuild_balances()
+            record_operation('按账本重算余额', [
+                {'op': 'rows', 'file_name': 'Account.csv', 'key': 'AccountID', 'before': before_rows, 'after': after_rows}])
+            st.success('账户余额已按账本重算！')
+            st.rerun()
+
+# 余额历史：按月末快照显示各账户余额和净资产变化
+st.subheader('余额历史')
+if st.checkbox('显示余额历史', value=False):
+    balance_history_df = balance_history()
+    if balance_history_df.empty:
+        st.info('暂无交易记录')
+    else:
+        history_accounts = st.multiselect('选择账户', balance_history_df.columns.tolist())
+        chart_df = balance_history_df[history_accounts].copy() if history_accounts else pd.DataFrame(
+            index=balance_history_df.index)
+        chart_df['净资产'] = balance_history_df.sum(axis=1).round(2)
+        st.line_chart(chart_df)
+
+        as_of_date = st.date_input('查询指定日期的余额', value=datetime.now())
+        as_of_balances = balance_as_of(as_of_date).rename('Balance').rename_axis('AccountName').reset_index()
+        st.dataframe(as_of_balances.style.format({'Balance': lambda x: f'{x:,.2f}'}), hide_index=True,
+                     use_container_width=True)
+        st.metric('净资产', f"¥{as_of_balances['Balance'].sum():,.2f}")
@@ -0,0 +1,92 @@
+import bisect
+import threading
+
+import pandas as pd
+
+import links
+import util
+
+# 待退款交易索引：未退款（IsRefund 为否）且不是转账的支出，按商户分组、按日期排序
+# 商户列表和候选交易都通过在日期上二分查找得到；交易写入（例如办理退款）时增量更新
+_index = {}
+_index_lock = threading.Lock()
+candidate_columns = ['TransactionID', 'Date', 'TransactionType', 'CategoryName', 'Merchant', 'IsRefund']
+
+
+def _open_expenses(transactions_df):
+    mask = (transactions_df['TransactionType'] == '支出') & ~transactions_df['IsRefund'].astype(bool) & \
+           (transactions_df['CategoryName'] != '转账')
+    return transactions_df[mask]
+
+
+def _entries(transactions_df):
+    # 返回 (商户, 日期, 交易ID) 列表，商户为空时记为 None
+    df = _open_expenses(transactions_df)
+    merchants = df['Merchant'].astype(object).where(df['Merchant'].notna(), None)
+    return list(zip(merchants.tolist(), df['Date'].tolist(), df['TransactionID'].tolist()))
+
+
+def rebuild_refund_index():
+    version = util.transactions_version()
+    merchants = {}
+    for merchant, date, transaction_id in _entries(util.load_transactions_data(columns=candidate_columns)):
+        merchants.setdefault(merchant, []).append((date, transaction_id))
+    for entries in merchants.values():
+        entries.sort()
+    with _index_lock:
+        _index.clear()
+        _index.update(version=version, merchants=merchants)
+
+
+def _current_index():
+    if _index.get('version') != util.transactions_version():
+        rebuild_refund_index()
+    return _index
+
+
+@util.on_transactions_change
+def _update_refund_index(version, new_version, removed_df, added_df):
+    with _index_lock:
+        if _index.get('version') != version:
+            return
+        merchants = _index['merchants']
+        if removed_df is not None:
+            for merchant, date, transaction_id in _entries(removed_df):
+                entries = merchants.get(merchant, [])
+                position = bisect.bisect_left(entries, (date, transaction_id))
+                if position < len(entries) and entries[position] == (date, transaction_id):
+                    del entries[position]
+                    if not entries:
+                        del merchants[merchant]
+        if added_df is not None:
+            for merchant, date, transaction_id in _entries(added_df):
+                bisect.insort(merchants.setdefault(merchant, []), (date, transaction_id))
+        _index['version'] = new_version
+
+
+def _date_bounds(entries, start_date=None, end_date=None):
+    # 日期范围 [start_date, end_date] 内的记录位置，结束日期当天也包含在内
+    low = 0 if start_date is None else bisect.bisect_left(entries, (pd.Timestamp(start_date),))
+    high = len(entries) if end_date is None else \
+        bisect.bisect_left(entries, (pd.Timestamp(end_date) + pd.Timedelta(days=1),))
+    return low, high
+
+
+def refund_merchants(start_date=None, end_date=None):
+    # 日期范围内有待退款交易的商户
+    merchants = _current_index()['merchants']
+    found = []
+    for merchant, entries in merchants.items():
+        low, high = _date_bounds(entries, start_date, end_date)
+        if low < high:
+            found.append(merchant)
+    # 未知商户排在最后
+    return sorted(found, key=lambda merchant: (merchant is None, merchant or ''))
+
+
+def refund_candidates(merchant, start_date=None, end_date=None):
+    # 商户在日期范围内的待退款交易，按日期排序
+    entries = _current_index()['merchants'].get(merchant, [])
+    low, high = _date_bounds(entries, start_date, end_date)
+    rows = [links.get_transaction(transaction_id) for _, transaction_id in entries[low:high]]
+    return pd.DataFrame(rows, columns=util.transaction_columns)
@@ -0,0 +1,95 @@
+import json
+import os
+import threading
+
+import pandas as pd
+
+import util
+
+# 汇总表：按 月份 × 交易类型 × 类别 × 子类别 × 账户 × 是否退款 预先汇总金额和笔数
+# 交易写入时按新增/移除的行增量更新，账本在外部被修改时整表重建
+# PositiveAmount/PositiveCount 只统计金额大于 0 的交易，供统计页使用
+rollup_dir = 'Data/Rollup.json'
+rollup_dimensions = ['Month', 'TransactionType', 'CategoryName', 'SubcategoryName', 'AccountName', 'IsRefund']
+rollup_measures = ['Amount', 'Count', 'PositiveAmount', 'PositiveCount']
+rollup_source_columns = ['Date', 'TransactionType', 'CategoryName', 'SubcategoryName', 'AccountName', 'IsRefund',
+                         'Amount']
+_rollup = {}
+_rollup_lock = threading.Lock()
+
+
+def build_rollup(transactions_df):
+    positive = transactions_df['Amount'] > 0
+    df = pd.DataFrame({
+        'Month': transactions_df['Date'].dt.strftime('%Y/%m'),
+        **{column: transactions_df[column].astype(object) for column in rollup_dimensions[1:]},
+        'Amount': transactions_df['Amount'],
+        'Count': 1,
+        'PositiveAmount': transactions_df['Amount'].where(positive, 0.0),
+        'PositiveCount': positive.astype(int),
+    })
+    return _group(df)
+
+
+def _group(df):
+    df = df.groupby(rollup_dimensions, dropna=False, sort=True)[rollup_measures].sum().reset_index()
+    df['Amount'] = df['Amount'].round(2)
+    df['PositiveAmount'] = df['PositiveAmount'].round(2)
+    return df[df['Count'] != 0].reset_index(drop=True)
+
+
+def _merge(rollup_df, delta_df, sign):
+    delta_df = delta_df.copy()
+    delta_df[rollup_measures] = delta_df[rollup_measures] * sign
+    return _group(pd.concat([rollup_df, delta_df], ignore_index=True))
+
+
+def _write_rollup():
+    with open(rollup_dir, 'w', encoding='utf-8') as f:
+        json.dump({'version': _rollup['version'], 'rows': _rollup['frame'].to_dict('records')}, f,
+                  ensure_ascii=False)
+
+
+def _save_rollup():
+    with _rollup_lock:
+        if _rollup:
+            _write_rollup()
+
+
+def _read_rollup():
+    if not _rollup and os.path.exists(rollup_dir):
+        with open(rollup_dir, encoding='utf-8') as f:
+            saved = json.load(f)
+        _rollup.update(version=saved['version'],
+                       frame=pd.DataFrame(saved['rows'], columns=rollup_dimensions + rollup_measures))
+    return _rollup
+
+
+def rebuild_rollup():
+    version = util.transactions_version()
+    rollup_df = build_rollup(util.load_transactions_data(columns=rollup_source_columns))
+    with _rollup_lock:
+        _rollup.update(version=version, frame=rollup_df)
+        _write_rollup()
+    return rollup_df.copy()
+
+
+def load_rollup():
+    version = util.transactions_version()
+    with _rollup_lock:
+        if _read_rollup().get('version') == version:
+            return _rollup['frame'].copy()
+    return rebuild_rollup()
+
+
+@util.on_transactions_change
+def _update_rollup(version, new_version, removed_df, added_df):
+    with _rollup_lock:
+        if _read_rollup().get('version') != version:
+            return
+        rollup_df = _rollup['frame']
+        for df, sign in [(removed_df, -1), (added_df, 1)]:
+            if df is not None and not df.empty:
+                rollup_df = _merge(rollup_df, build_rollup(df), sign)
+        _rollup.update(version=new_version, frame=rollup_df)
+    util.persist_later(_save_rollup)
@@ -0,0 +1,263 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import pandas as pd
+
+# SQLite 存储：与 Data/ 下的 CSV 文件一一对应的表
+database_dir = 'Data/MoneyStream.db'
+table_names = {
+    'Transactions.csv': 'Transactions',
+    'Categories.csv': 'Categories',
+    'Subcategories.csv': 'Subcategories',
+    'Account.csv': 'Account',
+    'SubcategoryAliases.csv': 'SubcategoryAliases',
+}
+
+transactions_schema = '''
+CREATE TABLE IF NOT EXISTS Transactions (
+    TransactionID INTEGER PRIMARY KEY,
+    Date TEXT NOT NULL,
+    TransactionType TEXT,
+    CategoryID INTEGER,
+    SubcategoryID INTEGER,
+    Amount REAL,
+    AccountID INTEGER,
+    Remarks TEXT,
+    Merchant TEXT,
+    Item TEXT,
+    UpdatedDate TEXT,
+    IsRefund TEXT,
+    RelatedTransactionID INTEGER
+)
+'''
+
+# 每张表的写入版本号：写入某张表只改变该表的版本，其他表的缓存不受影响
+versions_schema = '''
+CREATE TABLE IF NOT EXISTS TableVersions (
+    TableName TEXT PRIMARY KEY,
+    Version INTEGER NOT NULL
+)
+'''
+
+transactions_indexes = {
+    'idx_transactions_date': 'Date',
+    'idx_transactions_account_id': 'AccountID',
+    'idx_transactions_category_id': 'CategoryID, SubcategoryID',
+    'idx_transactions_merchant': 'Merchant',
+    'idx_transactions_related': 'RelatedTransactionID',
+}
+
+# 已完成建表和升级的数据库文件
+_prepared_databases = set()
+_prepared_lock = threading.Lock()
+
+# 旧版本的交易表直接保存账户、类别、子类别名称
+# 升级时补上ID列并按维度表填入ID；维度表中找不到的名称保留在原列中，读取时仍可解析
+legacy_dimensions = [
+    ('AccountID', 'Account', 'SELECT AccountID FROM Account WHERE AccountName = Transactions.AccountName'),
+    ('CategoryID', 'Categories', 'SELECT CategoryID FROM Categories WHERE CategoryName = Transactions.CategoryName'),
+    # 优先取所属类别下的同名子类别
+    ('SubcategoryID', 'Subcategories', 'SELECT SubcategoryID FROM Subcategories WHERE SubcategoryName = '
+     'Transactions.SubcategoryName AND ParentCategoryName = Transactions.CategoryName'),
+    ('SubcategoryID', 'Subcategories', 'SELECT SubcategoryID FROM Subcategories WHERE SubcategoryName = '
+     'Transactions.SubcategoryName'),
+]
+
+
+def _table_columns(conn, table):
+    return [row[1] for row in conn.execute(f'PRAGMA table_info({table})')]
+
+
+def _upgrade_transactions(conn):
+    if 'AccountID' in _table_columns(conn, 'Transactions'):
+        return
+    for id_column in ['AccountID', 'CategoryID', 'SubcategoryID']:
+        conn.execute(f'ALTER TABLE Transactions ADD COLUMN {id_column} INTEGER')
+    for id_column, table, select in legacy_dimensions:
+        if _table_exists(conn, table):
+            conn.execute(f'UPDATE Transactions SET {id_column} = ({select} LIMIT 1) WHERE {id_column} IS NULL')
+    for name_column, id_column in [('AccountName', 'AccountID'), ('CategoryName', 'CategoryID'),
+                                   ('SubcategoryName', 'SubcategoryID')]:
+        conn.execute(f'UPDATE Transactions SET {name_column} = NULL WHERE {id_column} IS NOT NULL')
+    _bump_version(conn, 'Transactions')
+
+
+def _prepare_database(conn):
+    conn.execute(transactions_schema)
+    conn.execute(versions_schema)
+    _upgrade_transactions(conn)
+    for index_name, columns in transactions_indexes.items():
+        conn.execute(f'CREATE INDEX IF NOT EXISTS {index_name} ON Transactions ({columns})')
+    conn.commit()
+
+
+def _database_key():
+    # 数据库文件被替换时（文件标识不同）需要重新建表
+    stat = os.stat(database_dir)
+    return os.path.abspath(database_dir), stat.st_dev, stat.st_ino
+
+
+def connect():
+    # 建表、升级和建索引每个进程对每个数据库文件只执行一次；新建的文件可能沿用已删除文件的标识，总是重新建表
+    created = not os.path.exists(database_dir)
+    conn = sqlite3.connect(database_dir)
+    key = _database_key()
+    if created or key not in _prepared_databases:
+        with _prepared_lock:
+            if created or key not in _prepared_databases:
+                _prepare_database(conn)
+                _prepared_databases.add(key)
+    return conn
+
+
+@contextmanager
+def _connection():
+    conn = connect()
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def _table_exists(conn, table):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (table,)).fetchone() is not None
+
+
+def _bump_version(conn, table):
+    conn.execute('INSERT INTO TableVersions VALUES (?, 1) '
+                 'ON CONFLICT(TableName) DO UPDATE SET Version = Version + 1', (table,))
+
+
+def table_version(file_name):
+    with _connection() as conn:
+        row = conn.execute('SELECT Version FROM TableVersions WHERE TableName = ?',
+                           (table_names[file_name],)).fetchone()
+    return 0 if row is None else row[0]
+
+
+def table_versions(file_names):
+    # 一次读取多张表的版本号
+    with _connection() as conn:
+        versions = dict(conn.execute('SELECT TableName, Version FROM TableVersions').fetchall())
+    return tuple(versions.get(table_names[file_name], 0) for file_name in file_names)
+
+
+def _prepare_transactions(df):
+    df = df.copy()
+    df['Date'] = pd.to_datetime(df['Date']).dt.strftime('%Y-%m-%d %H:%M:%S')
+    df['RelatedTransactionID'] = df['RelatedTransactionID'].astype('Int64').astype(object).where(
+        df['RelatedTransactionID'].notna(), None)
+    return df
+
+
+def read_table(file_name):
+    table = table_names[file_name]
+    with _connection() as conn:
+        if not _table_exists(conn, table):
+            return pd.DataFrame()
+        return pd.read_sql_query(f'SELECT * FROM {table}', conn)
+
+
+def write_table(df, file_name):
+    # 全量替换表内容；Transactions 表保留建表语句和索引
+    table = table_names[file_name]
+    with _connection() as conn:
+        if table == 'Transactions':
+            conn.execute('DELETE FROM Transactions')
+            _prepare_transactions(df).to_sql(table, conn, if_exists='append', index=False)
+        else:
+            df.to_sql(table, conn, if_exists='replace', index=False)
+        _bump_version(conn, table)
+
+
+def insert_transactions(df):
+    with _connection() as conn:
+        _prepare_transactions(df).to_sql('Transactions', conn, if_exists='append', index=False)
+        _bump_version(conn, 'Transactions')
+
+
+def update_transactions(patches):
+    # patches: {TransactionID: {列名: 新值}}，值已转换为 Python 原生类型，逐行 UPDATE
+    # 修改中清空旧版本名称列的字段只在表中有这些列时写入
+    with _connection() as conn:
+        table_columns = set(_table_columns(conn, 'Transactions'))
+        for transaction_id, values in patches.items():
+            values = {column: value for column, value in values.items() if column in table_columns}
+            columns = ', '.join(f'{column} = ?' for column in values)
+            conn.execute(f'UPDATE Transactions SET {columns} WHERE TransactionID = ?',
+                         list(values.values()) + [transaction_id])
+        _bump_version(conn, 'Transactions')
+
+
+def delete_transactions(transaction_ids):
+    with _connection() as conn:
+        conn.executemany('DELETE FROM Transactions WHERE TransactionID = ?',
+                         [(transaction_id,) for transaction_id in transaction_ids])
+        _bump_version(conn, 'Transactions')
+
+
+def _where_clause(start_date=None, end_date=None, transaction_type=None, account_id=None, category_id=None,
+                  subcategory_id=None, is_refund=None, merchant=None):
+    conditions, params = [], []
+    if start_date is not None:
+        conditions.append('Date >= ?')
+        params.append(pd.Timestamp(start_date).strftime('%Y-%m-%d'))
+    if end_date is not None:
+        # 结束日期当天的记录也包含在内
+        conditions.append('Date < ?')
+        params.append((pd.Timestamp(end_date) + pd.Timedelta(days=1)).strftime('%Y-%m-%d'))
+    for column, value in [('TransactionType', transaction_type), ('IsRefund', is_refund), ('Merchant', merchant)]:
+        if value is None:
+            continue
+        if isinstance(value, (list, tuple, set)):
+            conditions.append(f'{column} IN ({", ".join("?" * len(value))})')
+            params.extend(value)
+        else:
+            conditions.append(f'{column} = ?')
+            params.append(value)
+    # 账户、类别、子类别按ID筛选；ID为空的旧记录一并返回，由调用方解析名称后精确筛选
+    for column, ids in [('AccountID', account_id), ('CategoryID', category_id), ('SubcategoryID', subcategory_id)]:
+        if ids is not None:
+            conditions.append(f'({column} IN ({", ".join("?" * len(ids))}) OR {column} IS NULL)')
+            params.extend(ids)
+    return (' WHERE ' + ' AND '.join(conditions) if conditions else ''), params
+
+
+def query_transactions(**filters):
+    where, params = _where_clause(**filters)
+    with _connection() as conn:
+        return pd.read_sql_query(f'SELECT * FROM Transactions{where}', conn, params=params)
+
+
+def iter_transactions(chunk_size, **filters):
+    # 按日期顺序逐块读取查询结果
+    where, params = _where_clause(**filters)
+    with _connection() as conn:
+        yield from pd.read_sql_query(f'SELECT * FROM Transactions{where} ORDER BY Date, TransactionID', conn,
+                                     params=params, chunksize=chunk_size)
+
+
+def query_distinct(column, **filters):
+    where, params = _where_clause(**filters)
+    with _connection() as conn:
+        rows = conn.execute(f'SELECT DISTINCT {column} FROM Transactions{where}', params).fetchall()
+    return [row[0] for row in rows]
+
+
+def query_date_range():
+    with _connection() as conn:
+        return conn.execute('SELECT MIN(Date), MAX(Date) FROM Transactions').fetchone()
+
+
+def max_transaction_id():
+    with _connection() as conn:
+        return conn.execute('SELECT MAX(TransactionID) FROM Transactions').fetchone()[0]
+
+
+if __name__ == '__main__':
+    import util
+    util.migrate_csv_to_sqlite()
+    print(f'已将 CSV 数据迁移至 {database_dir}')
@@ -0,0 +1,163 @@
+import argparse
+import ast
+import glob
+import subprocess
+import sys
+
+# 页面启动耗时：只执行页面模块顶层的 import 语句（不运行页面本身），用 python -X importtime 统计各模块的导入耗时
+# streamlit 在服务启动时已经导入，统计页面时先导入 streamlit，不计入页面的耗时
+# 每项测量运行 repeat 次取最小值（第一次运行还包括编译 .pyc 的时间）
+# --check：任一页面或命令行工具超出预算、页面顶层导入了应延迟导入的模块或使用了 import *、命令行工具导入了界面模块时
+# 以非零状态退出
+preloaded_modules = ['streamlit']
+cli_modules = ['moneystream', 'importer', 'export']
+# 页面顶层不应导入的模块：只在绘图等用到时再导入
+lazy_modules = ['plotly']
+# 命令行工具不应导入的模块
+ui_modules = ['streamlit', 'plotly']
+page_budget_ms = 1500
+cli_budget_ms = 1000
+repeat = 3
+top_modules = 5
+
+# 在子进程中逐条执行 import 语句；未安装的模块只记录下来，不中断测量
+_probe = '''
+import sys
+def run(source):
+    try:
+        exec(source, {})
+    except ImportError as e:
+        sys.stderr.write(f'-- missing {e.name}\\n')
+for source in %r:
+    run(source)
+sys.stderr.write('-- measure\\n')
+for source in %r:
+    run(source)
+'''
+
+
+def page_files():
+    return ['Home.py'] + sorted(glob.glob('pages/*.py'))
+
+
+def top_level_imports(path):
+    # 返回 [(import 语句, [导入的模块], 是否为 import *)]，只包括模块顶层的语句，函数内和条件分支中的延迟导入不计
+    with open(path, encoding='utf-8') as f:
+        tree = ast.parse(f.read())
+    imports = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            imports.append((ast.unparse(node), [alias.name for alias in node.names], False))
+        elif isinstance(node, ast.ImportFrom) and node.level == 0:
+            imports.append((ast.unparse(node), [node.module], any(alias.name == '*' for alias in node.names)))
+    return imports
+
+
+def _parse_importtime(output):
+    # 解析 -X importtime 的输出：只统计标记之后的导入，顶层（不是被其他模块导入的）模块的累计耗时之和为总耗时
+    modules, loaded, missing, measuring = {}, set(), [], False
+    for line in output.splitlines():
+        if line.startswith('-- missing '):
+            missing.append(line[len('-- missing '):])
+        elif line == '-- measure':
+            measuring = True
+        elif measuring and line.startswith('import time:'):
+            _, cumulative_us, name = line[len('import time:'):].split('|', 2)
+            # 跳过表头
+            if not cumulative_us.strip().isdigit():
+                continue
+            module = name.strip()
+            loaded.add(module)
+            # 顶层模块名前只有一个空格，被其他模块导入的模块按层级缩进
+            if name[1:2] != ' ':
+                modules[module] = modules.get(module, 0) + int(cumulative_us) / 1000
+    return {'total_ms': round(sum(modules.values()), 1), 'modules': modules, 'loaded': loaded,
+            'missing': sorted(set(missing))}
+
+
+def measure(statements, preload=(), repeat=repeat):
+    # 在新的解释器中执行 import 语句，返回耗时最少的一次测量
+    results = []
+    for _ in range(repeat):
+        completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', _probe % (list(preload), statements)],
+                                   capture_output=True, text=True)
+        results.append(_parse_importtime(completed.stderr))
+    return min(results, key=lambda result: result['total_ms'])
+
+
+def page_report(path, repeat=repeat):
+    imports = top_level_imports(path)
+    # 已由服务导入的模块不再计入
+    statements = [source for source, modules, _ in imports
+                  if not {_root(module) for module in modules} <= set(preloaded_modules)]
+    result = measure(statements, [f'import {module}' for module in preloaded_modules], repeat)
+    result['imports'] = [module for _, modules, _ in imports for module in modules]
+    result['star_imports'] = [module for _, modules, star in imports if star for module in modules]
+    return result
+
+
+def cli_report(module, repeat=repeat):
+    return measure([f'import {module}'], repeat=repeat)
+
+
+def _root(module):
+    return module.split('.')[0]
+
+
+def check(page_results, cli_results, page_budget=page_budget_ms, cli_budget=cli_budget_ms):
+    # 返回不符合要求的项目列表
+    problems = []
+    for path, result in page_results.items():
+        if result['total_ms'] > page_budget:
+            problems.append(f"{path} 导入耗时 {result['total_ms']:.0f} ms，超出预算 {page_budget} ms")
+        for module in sorted({_root(module) for module in result['imports']} & set(lazy_modules)):
+            problems.append(f'{path} 在顶层导入了 {module}，应在用到时再导入')
+        for module in result.get('star_imports', []):
+            problems.append(f'{path} 使用了 from {module} import *，应只导入用到的名称')
+    for module, result in cli_results.items():
+        if result['total_ms'] > cli_budget:
+            problems.append(f"{module} 导入耗时 {result['total_ms']:.0f} ms，超出预算 {cli_budget} ms")
+        for ui_module in sorted({_root(name) for name in result['loaded']} & set(ui_modules)):
+            problems.append(f'{module} 导入了 {ui_module}，命令行工具不应依赖界面模块')
+    return problems
+
+
+def _print_result(name, result, top):
+    slowest = sorted(result['modules'].items(), key=lambda item: -item[1])[:top]
+    print(f"{name:<24} {result['total_ms']:>8.1f} ms  " +
+          ', '.join(f'{module} {elapsed:.1f}' for module, elapsed in slowest))
+    if result['missing']:
+        print(f"{'':<24} 未安装（未计入）：{', '.join(result['missing'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='统计各页面和命令行工具的导入耗时')
+    parser.add_argument('--check', action='store_true', help='检查是否超出启动耗时预算，超出时以非零状态退出')
+    parser.add_argument('--page-budget', type=float, default=page_budget_ms, help='每个页面的导入耗时预算（毫秒）')
+    parser.add_argument('--cli-budget', type=float, default=cli_budget_ms, help='每个命令行工具的导入耗时预算（毫秒）')
+    parser.add_argument('--repeat', type=int, default=repeat, help='每项测量的次数，取最小值')
+    parser.add_argument('--top', type=int, default=top_modules, help='每项显示耗时最多的模块数')
+    args = parser.parse_args()
+
+    print(f"页面（不含已由服务导入的 {', '.join(preloaded_modules)}）")
+    page_results = {}
+    for path in page_files():
+        page_results[path] = page_report(path, args.repeat)
+        _print_result(path, page_results[path], args.top)
+    print('命令行工具')
+    cli_results = {}
+    for module in cli_modules:
+        cli_results[module] = cli_report(module, args.repeat)
+        _print_result(module, cli_results[module], args.top)
+
+    if args.check:
+        problems = check(page_results, cli_results, args.page_budget, args.cli_budget)
+        for problem in problems:
+            print(problem)
+        if problems:
+            sys.exit(1)
+        print('启动耗时检查通过')
+
+
+if __name__ == '__main__':
+    main()
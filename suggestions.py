@@ -0,0 +1,139 @@
+import json
+import os
+import re
+import threading
+
+import pandas as pd
+
+import util
+
+# 自动分类建议：根据商户和商品名称中的词，统计历史交易的 类别/子类别 和 账户
+# 模型为计数表：特征 -> 类别/子类别 -> 次数，特征 -> 账户 -> 次数
+# 从全部交易一次构建，与账本版本一起保存，交易写入时增量更新
+model_dir = 'Data/SuggestionModel.json'
+model_columns = ['TransactionType', 'CategoryName', 'SubcategoryName', 'AccountName', 'Merchant', 'Item']
+merchant_weight = 3
+_model = {}
+_model_lock = threading.Lock()
+
+
+def tokens(text):
+    # 英文和数字按词切分，中文按相邻两字切分
+    words = []
+    for word in re.findall(r'[a-z0-9]+|[\u4e00-\u9fff]+', str(text).lower()):
+        if len(word) > 2 and not word.isascii():
+            words.extend(word[i:i + 2] for i in range(len(word) - 1))
+        else:
+            words.append(word)
+    return words
+
+
+def _features(transactions_df):
+    # 每笔交易展开为 (特征, 交易类型, 类别, 子类别, 账户) 行
+    df = transactions_df[model_columns].astype(object).where(transactions_df[model_columns].notna(), '')
+    merchant_df = df[df['Merchant'] != ''].assign(Feature='m:' + df['Merchant'])
+    token_df = df.assign(Feature=df['Item'].map(lambda item: ['t:' + token for token in set(tokens(item))]))
+    token_df = token_df.explode('Feature').dropna(subset=['Feature'])
+    return pd.concat([merchant_df, token_df], ignore_index=True)
+
+
+def _counts(transactions_df):
+    features_df = _features(transactions_df)
+    categories, accounts = {}, {}
+    category_counts = features_df.groupby(['TransactionType', 'Feature', 'CategoryName', 'SubcategoryName']).size()
+    for (transaction_type, feature, category, subcategory), count in category_counts.items():
+        categories.setdefault(transaction_type, {}).setdefault(feature, {}).setdefault(category, {})[subcategory] = count
+    for (feature, account), count in features_df.groupby(['Feature', 'AccountName']).size().items():
+        accounts.setdefault(feature, {})[account] = count
+    return {'categories': categories, 'accounts': accounts}
+
+
+def _merge(target, counts, sign):
+    # 将 counts 按 sign 加到 target 上，次数为 0 的项删除
+    for key, value in counts.items():
+        if isinstance(value, dict):
+            child = target.setdefault(key, {})
+            _merge(child, value, sign)
+            if not child:
+                del target[key]
+        else:
+            target[key] = target.get(key, 0) + sign * int(value)
+            if target[key] <= 0:
+                del target[key]
+
+
+def _write_model():
+    with open(model_dir, 'w', encoding='utf-8') as f:
+        json.dump(_model, f, ensure_ascii=False)
+
+
+def _save_model():
+    with _model_lock:
+        if _model:
+            _write_model()
+
+
+def _read_model():
+    if not _model and os.path.exists(model_dir):
+        with open(model_dir, encoding='utf-8') as f:
+            _model.update(json.load(f))
+    return _model
+
+
+def rebuild_model():
+    version = util.transactions_version()
+    counts = json.loads(json.dumps(_counts(util.load_transactions_data(columns=model_columns)), default=int))
+    with _model_lock:
+        _model.clear()
+        _model.update(version=version, **counts)
+        _write_model()
+
+
+def load_model():
+    version = util.transactions_version()
+    with _model_lock:
+        if _read_model().get('version') == version:
+            return _model
+    rebuild_model()
+    return _model
+
+
+@util.on_transactions_change
+def _update_model(version, new_version, removed_df, added_df):
+    with _model_lock:
+        if _read_model().get('version') != version:
+            return
+        for df, sign in [(removed_df, -1), (added_df, 1)]:
+            if df is not None and not df.empty:
+                counts = _counts(df)
+                _merge(_model['categories'], counts['categories'], sign)
+                _merge(_model['accounts'], counts['accounts'], sign)
+        _model['version'] = new_version
+    util.persist_later(_save_model)
+
+
+def _best(scores):
+    return max(scores, key=scores.get) if scores else None
+
+
+def suggest(merchant, item='', transaction_type='支出'):
+    # 返回 {'CategoryName', 'SubcategoryName', 'AccountName'}，没有依据的字段为 None
+    model = load_model()
+    features = [(f't:{token}', 1) for token in set(tokens(item))]
+    if merchant:
+        features.append((f'm:{merchant}', merchant_weight))
+    category_scores, subcategory_scores, account_scores = {}, {}, {}
+    type_categories = model['categories'].get(transaction_type, {})
+    for feature, weight in features:
+        for category, subcategories in type_categories.get(feature, {}).items():
+            for subcategory, count in subcategories.items():
+                category_scores[category] = category_scores.get(category, 0) + weight * count
+                key = (category, subcategory)
+                subcategory_scores[key] = subcategory_scores.get(key, 0) + weight * count
+        for account, count in model['accounts'].get(feature, {}).items():
+            account_scores[account] = account_scores.get(account, 0) + weight * count
+    category = _best(category_scores)
+    subcategory = _best({key: score for key, score in subcategory_scores.items() if key[0] == category})
+    return {'CategoryName': category or None,
+            'SubcategoryName': subcategory[1] or None if subcategory else None,
+            'AccountName': _best(account_scores) or None}
@@ -0,0 +1,85 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import util  # noqa: E402
+
+# 各模块进程内的缓存和索引：每个测试使用新的数据目录，开始前全部清空
+_module_state = {
+    'util': ['_frame_cache', '_dimension_cache', '_catalog_cache', '_query_cache', '_transaction_index',
+             '_id_counter', '_pending_writers', '_last_persisted', '_encoded_files'],
+    'balances': ['_totals', '_checkpoints'],
+    'rollup': ['_rollup'],
+    'merchants': ['_index'],
+    'suggestions': ['_model'],
+    'links': ['_index'],
+    'refunds': ['_index'],
+    'fulltext': ['_index'],
+    'importer': ['_index'],
+    'duplicates': ['_cache'],
+    'sqlite_store': ['_prepared_databases'],
+}
+
+accounts = pd.DataFrame({
+    'AccountID': [1, 2], 'AccountName': ['现金', '银行卡'], 'AccountType': ['电子钱包', '借记卡'],
+    'Description': ['', ''], 'AccountSuffix': [None, None], 'IsLocked': ['否', '否'], 'Balance': [100.0, 500.0],
+    'IsValid': ['是', '是'], 'LastModifiedTime': ['2024-01-01 00:00:00'] * 2, 'OpeningBalance': [100.0, 500.0]})
+categories = pd.DataFrame({'CategoryID': [1, 2], 'CategoryName': ['食品', '工资'], 'Description': ['', ''],
+                           'TransactionType': ['支出', '收入']})
+subcategories = pd.DataFrame({'SubcategoryID': [1, 2], 'SubcategoryName': ['午餐', '晚餐'],
+                              'ParentCategoryName': ['食品', '食品'], 'Description': ['', '']})
+
+
+def reset_state():
+    for module_name, attributes in _module_state.items():
+        module = sys.modules.get(module_name)
+        for attribute in attributes:
+            getattr(module, attribute, {}).clear()
+
+
+def transaction(transaction_id, date, amount, account='现金', category='食品', subcategory='午餐',
+                transaction_type='支出', merchant='麦当劳', item='汉堡'):
+    return {'TransactionID': transaction_id, 'Date': date, 'TransactionType': transaction_type,
+            'CategoryName': category, 'SubcategoryName': subcategory, 'Amount': amount, 'AccountName': account,
+            'Remarks': '', 'Merchant': merchant, 'Item': item, 'UpdatedDate': '2024-01-01', 'IsRefund': '否',
+            'RelatedTransactionID': None}
+
+
+def write_ledger(rows, legacy=False):
+    # 写入 Data/Transactions.csv；legacy=True 时使用旧格式（账户、类别、子类别保存名称）
+    df = pd.DataFrame(rows, columns=util.transaction_columns)
+    if not legacy:
+        account_ids = dict(zip(accounts['AccountName'], accounts['AccountID']))
+        category_ids = dict(zip(categories['CategoryName'], categories['CategoryID']))
+        subcategory_ids = dict(zip(subcategories['SubcategoryName'], subcategories['SubcategoryID']))
+        df = df.assign(AccountName=df['AccountName'].map(account_ids),
+                       CategoryName=df['CategoryName'].map(category_ids),
+                       SubcategoryName=df['SubcategoryName'].map(subcategory_ids))
+        df = df.rename(columns={name: id_column for name, id_column in util.dimension_columns.items()})
+    df.to_csv(util.transaction_dir, index=False)
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    # 在临时目录中准备账户、类别和子类别表，交易表由各测试写入
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('Data')
+    accounts.to_csv(util.account_dir, index=False)
+    categories.to_csv(util.categories_dir, index=False)
+    subcategories.to_csv(util.subcategories_dir, index=False)
+    monkeypatch.setattr(util, 'storage_backend', 'csv')
+    reset_state()
+    yield tmp_path
+    reset_state()
+
+
+def use_backend(monkeypatch, backend):
+    # 切换存储后端；sqlite 后端先从 CSV 迁移
+    monkeypatch.setattr(util, 'storage_backend', backend)
+    if backend == 'sqlite':
+        util.migrate_csv_to_sqlite()
+    reset_state()
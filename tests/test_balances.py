@@ -0,0 +1,25 @@
+import json
+
+import pandas as pd
+
+import balances
+import util
+from conftest import transaction, write_ledger
+
+
+def test_checkpoints_written_lazily(data_dir, monkeypatch):
+    write_ledger([transaction(0, '2024-01-01', 10.0), transaction(1, '2024-02-01', 20.0)])
+    balances.load_checkpoints()
+    writes = []
+    write_checkpoints = balances._write_checkpoints
+    monkeypatch.setattr(balances, '_write_checkpoints', lambda: writes.append(1) or write_checkpoints())
+    for transaction_id in [2, 3, 4]:
+        util.append_transactions(pd.DataFrame([transaction(transaction_id, '2024-02-05', 5.0)]))
+    assert writes == []
+    assert balances.balance_as_of('2024-02-28')['现金'] == 55.0
+    util.flush_pending_writes()
+    assert writes == [1]
+    with open(balances.checkpoints_dir, encoding='utf-8') as f:
+        saved = json.load(f)
+    assert saved['version'] == util.transactions_version()
+    assert saved['months']['2024-02'] == {'现金': -45.0}
@@ -0,0 +1,26 @@
+import moneystream
+import util
+
+
+def test_catalog_lookups(data_dir):
+    catalog = util.dimension_catalog()
+    assert catalog.categories('支出') == ['食品']
+    assert catalog.categories() == ['食品', '工资']
+    assert catalog.subcategories('食品') == ['午餐', '晚餐']
+    assert catalog.subcategory_id('食品', '晚餐') == 2
+    assert catalog.account_by_id(2)['AccountName'] == '银行卡'
+    # 维度表未变化时复用同一个目录
+    assert util.dimension_catalog() is catalog
+
+
+def test_catalog_after_rename(data_dir):
+    catalog = util.dimension_catalog()
+    moneystream.update_account('现金', new_name='零钱')
+    moneystream.add_subcategory('食品', '夜宵')
+    renamed = util.dimension_catalog()
+    assert renamed is not catalog
+    assert renamed.account('现金') is None
+    assert renamed.account('零钱')['AccountID'] == 1
+    assert renamed.account_by_id(1)['AccountName'] == '零钱'
+    assert renamed.valid_accounts == ['零钱', '银行卡']
+    assert renamed.subcategories('食品') == ['午餐', '晚餐', '夜宵']
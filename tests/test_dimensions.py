@@ -0,0 +1,42 @@
+import pandas as pd
+
+import moneystream
+import util
+from conftest import transaction, write_ledger
+
+
+def test_subcategory_added_after_merge_gets_new_id(data_dir):
+    write_ledger([transaction(0, '2024-01-01', 10.0, subcategory='晚餐')])
+    moneystream.merge_subcategory('食品', '晚餐', '食品', '午餐')
+    moneystream.add_subcategory('食品', '夜宵')
+    subcategories_df = util.load_subcategories_data().set_index('SubcategoryName')
+    assert subcategories_df.at['夜宵', 'SubcategoryID'] == 3
+
+    util.append_transactions(pd.DataFrame([transaction(1, '2024-01-02', 8.0, subcategory='夜宵')]))
+    transactions_df = util.load_transactions_data().set_index('TransactionID')
+    assert transactions_df['SubcategoryName'].tolist() == ['午餐', '夜宵']
+
+
+def test_registered_subcategory_skips_merged_ids(data_dir):
+    write_ledger([transaction(0, '2024-01-01', 10.0)])
+    moneystream.merge_subcategory('食品', '晚餐', '食品', '午餐')
+    util._append_dimension_rows('Subcategories.csv', 'SubcategoryID',
+                                [{'SubcategoryName': '夜宵', 'ParentCategoryName': '食品'}])
+    assert util.load_subcategories_data()['SubcategoryID'].tolist() == [1, 3]
+
+
+def test_subcategory_patch_resolved_within_row_category(data_dir):
+    write_ledger([transaction(0, '2024-01-01', 10.0)])
+    moneystream.add_subcategory('工资', '其他')
+    moneystream.add_subcategory('食品', '其他')
+    util.patch_transactions({0: {'SubcategoryName': '其他'}})
+    subcategories_df = util.load_subcategories_data()
+    food_other = subcategories_df[(subcategories_df['ParentCategoryName'] == '食品') &
+                                  (subcategories_df['SubcategoryName'] == '其他')]
+    assert util._read_journal()[-1]['values']['SubcategoryID'] == food_other['SubcategoryID'].iloc[0]
+
+    # 改名后记录随之显示新名称
+    subcategories_df.loc[food_other.index, 'SubcategoryName'] = '杂项'
+    util.save_data(subcategories_df, 'Subcategories.csv')
+    transactions_df = util.load_transactions_data()
+    assert transactions_df[['CategoryName', 'SubcategoryName']].values.tolist() == [['食品', '杂项']]
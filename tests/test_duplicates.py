@@ -0,0 +1,37 @@
+import balances
+import duplicates
+import history
+import links
+import rollup
+import util
+from conftest import accounts, transaction, write_ledger
+
+
+def test_merge_duplicates_deletes_like_any_delete(data_dir):
+    refund = transaction(2, '2024-01-03', 5.0, account='银行卡', transaction_type='收入', merchant='', item='')
+    refund['RelatedTransactionID'] = 1
+    write_ledger([transaction(0, '2024-01-01', 10.0, item=''), transaction(1, '2024-01-01', 10.0), refund])
+    # 当前余额与账本一致：现金 100 - 20，银行卡 500 + 5
+    util.save_data(accounts.assign(Balance=[80.0, 505.0]), 'Account.csv')
+    rollup.load_rollup()
+    balances.account_totals()
+    links.linked_transactions(1)
+
+    steps = duplicates.merge_duplicates(0, 1)
+    transactions_df = util.load_transactions_data().set_index('TransactionID')
+    assert transactions_df.index.tolist() == [0, 2]
+    assert transactions_df.at[0, 'Item'] == '汉堡'
+    assert transactions_df.at[2, 'RelatedTransactionID'] == 0
+    assert [row['TransactionID'] for row in links.linked_transactions(0)] == [2]
+    # 删除的交易冲减当前余额，重算余额不再有差异
+    assert util.load_account_data().set_index('AccountName').at['现金', 'Balance'] == 90.0
+    assert (balances.balance_report()['Drift'] == 0).all()
+    before_rows, after_rows = balances.rebuild_balances()
+    assert before_rows == after_rows
+    assert rollup.load_rollup().equals(rollup.build_rollup(util.load_transactions_data()))
+
+    operations = {'undo': [{'label': '合并重复交易', 'steps': steps}], 'redo': []}
+    history.undo(operations)
+    assert sorted(util.load_transactions_data()['TransactionID']) == [0, 1, 2]
+    assert util.load_account_data().set_index('AccountName').at['现金', 'Balance'] == 80.0
+    assert (balances.balance_report()['Drift'] == 0).all()
@@ -0,0 +1,36 @@
+import pytest
+
+import util
+from conftest import transaction, write_ledger
+
+
+def test_edits_validate_only_changed_rows(data_dir):
+    write_ledger([transaction(0, '2024-01-01', 10.0), transaction(1, '2024-01-02', None)])
+    original_df = util.load_transactions_data()
+    edited_df = original_df.copy()
+    edited_df.loc[edited_df['TransactionID'] == 0, 'Amount'] = 12.0
+    patches = util.diff_transactions(original_df, edited_df)
+    changed_df = util.changed_transactions(edited_df, patches)
+    # 未修改的行即使不完整也不阻止保存
+    assert util.validate_transactions(util.apply_transaction_schema(util.to_storage_frame(changed_df))) == []
+    steps = util.save_transaction_edits(original_df, edited_df, patches)
+    assert steps == [{'op': 'patch', 'before': {0: {'Amount': 10.0}}, 'after': {0: {'Amount': 12.0}}}]
+    assert util.load_transactions_data().set_index('TransactionID').at[0, 'Amount'] == 12.0
+
+
+def test_edits_reject_unknown_dimensions(data_dir):
+    write_ledger([transaction(0, '2024-01-01', 10.0)])
+    original_df = util.load_transactions_data()
+    for column, value, message in [('SubcategoryName', '新子类', '子类别不属于该类别'),
+                                   ('CategoryName', '新类别', '类别不存在'), ('AccountName', '新账户', '账户不存在')]:
+        edited_df = original_df.astype({column: object})
+        edited_df[column] = value
+        problems = util.validate_transactions(util.apply_transaction_schema(util.to_storage_frame(edited_df)))
+        assert any(problem.startswith(message) for problem in problems)
+        with pytest.raises(ValueError):
+            util.save_transaction_edits(original_df, edited_df)
+    # 表格中输入的新名称不会登记到维度表
+    assert util.load_subcategories_data()['SubcategoryName'].tolist() == ['午餐', '晚餐']
+    assert util.load_categories_data()['CategoryName'].tolist() == ['食品', '工资']
+    assert util.load_account_data()['AccountName'].tolist() == ['现金', '银行卡']
+    assert util._read_journal() == []
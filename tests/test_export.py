@@ -0,0 +1,38 @@
+import io
+
+import pandas as pd
+import pytest
+
+import export
+import util
+from conftest import transaction, use_backend, write_ledger
+
+
+def _expected_csv(filters):
+    expected_df = util.query_transactions(**filters).sort_values('Date', kind='stable')
+    return util.to_storage_frame(expected_df[export.export_columns]).to_csv(
+        index=False, date_format='%Y-%m-%d %H:%M:%S').encode('utf-8')
+
+
+@pytest.mark.parametrize('backend', ['csv', 'sqlite', 'partitioned'])
+def test_chunked_csv_equals_filtered_query(data_dir, monkeypatch, backend):
+    write_ledger([transaction(transaction_id, f'2024-0{month}-0{day}', 10.0 + transaction_id,
+                              account='银行卡' if transaction_id % 3 else '现金')
+                  for transaction_id, (month, day) in enumerate([(3, 1), (1, 2), (2, 5), (1, 9), (2, 1), (3, 3)])])
+    use_backend(monkeypatch, backend)
+    filters = {'start_date': '2024-01-05', 'account': '银行卡'}
+    output = io.BytesIO()
+    export.write_export(output, 'csv', export.export_chunks(filters, chunk_size=2))
+    content = output.getvalue()
+    assert content.startswith(b'\xef\xbb\xbf')
+    assert content[3:] == _expected_csv(filters)
+
+
+def test_export_file_formats(data_dir, tmp_path):
+    write_ledger([transaction(0, '2024-01-01', 10.0), transaction(1, '2024-01-02', 20.0)])
+    parquet_path = export.export_transactions(str(tmp_path / 'out.parquet'), transaction_ids=[1])
+    assert pd.read_parquet(parquet_path)['TransactionID'].tolist() == [1]
+    xlsx_path = export.export_transactions(str(tmp_path / 'out.xlsx'))
+    assert pd.read_excel(xlsx_path)['TransactionID'].tolist() == [0, 1]
+    with pytest.raises(ValueError):
+        export.export_transactions(str(tmp_path / 'out.txt'))
@@ -0,0 +1,29 @@
+import fulltext
+import util
+from conftest import transaction, write_ledger
+
+
+def test_search_requires_every_word(data_dir):
+    spicy = transaction(1, '2024-01-02', 20.0, merchant='肯德基', item='汉堡')
+    spicy['Remarks'] = '加辣'
+    write_ledger([transaction(0, '2024-01-01', 10.0), spicy, transaction(2, '2024-01-03', 5.0, item='可乐')])
+    assert fulltext.search_transactions('汉堡') == {0, 1}
+    assert fulltext.search_transactions('麦当劳 汉堡') == {0}
+    assert fulltext.search_transactions('汉堡  加辣') == {1}
+    assert fulltext.search_transactions('可乐 加辣') == set()
+    assert fulltext.search_transactions('  ') == set()
+
+
+def test_search_does_not_match_across_fields(data_dir):
+    write_ledger([transaction(0, '2024-01-01', 10.0)])
+    # 商户「麦当劳」与商品「汉堡」相邻，但查询词不会跨字段匹配
+    assert fulltext.search_transactions('劳汉') == set()
+    assert fulltext.search_transactions('当劳') == {0}
+
+
+def test_index_follows_edits(data_dir):
+    write_ledger([transaction(0, '2024-01-01', 10.0)])
+    assert fulltext.search_transactions('汉堡') == {0}
+    util.patch_transactions({0: {'Item': '薯条'}})
+    assert fulltext.search_transactions('汉堡') == set()
+    assert fulltext.search_transactions('薯条') == {0}
@@ -0,0 +1,35 @@
+import io
+
+import importer
+import util
+from conftest import write_ledger
+
+statement = '日期,金额,商户\n2024-03-01,-12.5,便利店\n2024-03-01,-12.5,便利店\n2024-03-02,-30,超市\n'
+column_map = {'日期': 'Date', '金额': 'Amount', '商户': 'Merchant'}
+defaults = {'AccountName': '现金', 'CategoryName': '食品'}
+
+
+def test_reimport_skips_existing_rows_but_keeps_repeats(data_dir):
+    write_ledger([])
+    summary, _, steps = importer.import_statement(io.StringIO(statement), column_map, defaults)
+    # 同一账单中两笔相同的交易都导入
+    assert summary == {'total': 3, 'imported': 3, 'duplicates': 0, 'rejected': {}}
+    assert [step['op'] for step in steps] == ['add', 'balance']
+    accounts_df = util.load_account_data().set_index('AccountName')
+    # 补记：当前余额不变，期初余额按导入的收支反向调整
+    assert accounts_df.at['现金', 'Balance'] == 100.0
+    assert accounts_df.at['现金', 'OpeningBalance'] == 155.0
+
+    summary, _, steps = importer.import_statement(io.StringIO(statement), column_map, defaults)
+    assert summary == {'total': 3, 'imported': 0, 'duplicates': 3, 'rejected': {}}
+    assert steps == []
+    assert len(util.load_transactions_data()) == 3
+
+
+def test_extra_repeat_in_later_statement_is_imported(data_dir):
+    write_ledger([])
+    importer.import_statement(io.StringIO(statement), column_map, defaults)
+    # 账本中已有两笔，新账单中第三次出现的记录不是重复
+    extra = statement + '2024-03-01,-12.5,便利店\n'
+    summary, _, _ = importer.import_statement(io.StringIO(extra), column_map, defaults)
+    assert (summary['imported'], summary['duplicates']) == (1, 3)
@@ -0,0 +1,40 @@
+import pandas as pd
+import pytest
+
+import util
+from conftest import transaction, use_backend, write_ledger
+
+
+def mixed_ledger():
+    # 历史数据中日期格式不统一：有的带时间，有的只有日期
+    return [transaction(0, '2024-01-01', 10.0), transaction(1, '2024-02-03 12:30:00', 20.0),
+            transaction(2, '2024/03/05', 30.0)]
+
+
+@pytest.mark.parametrize('backend', ['csv', 'parquet', 'partitioned', 'sqlite'])
+def test_patch_date_on_mixed_format_ledger(data_dir, monkeypatch, backend):
+    write_ledger(mixed_ledger())
+    use_backend(monkeypatch, backend)
+    util.patch_transactions({1: {'Date': '2024-02-10 08:00:00'}, 2: {'Amount': 35.0}})
+    util.invalidate_cache()
+    transactions_df = util.load_transactions_data().set_index('TransactionID')
+    assert transactions_df.at[1, 'Date'] == pd.Timestamp('2024-02-10 08:00:00')
+    assert transactions_df.at[0, 'Date'] == pd.Timestamp('2024-01-01')
+    assert transactions_df.at[2, 'Amount'] == 35.0
+    # 合并日志后结果不变
+    util.compact_transactions()
+    util.invalidate_cache()
+    assert util.load_transactions_data().set_index('TransactionID').at[1, 'Date'] == \
+        pd.Timestamp('2024-02-10 08:00:00')
+
+
+def test_journal_replay_with_projection(data_dir):
+    write_ledger(mixed_ledger())
+    util.patch_transactions({0: {'Date': '2024-01-02', 'Merchant': '肯德基'}})
+    batch = util.TransactionBatch()
+    batch.add(Date='2024-04-01', TransactionType='支出', CategoryName='食品', Amount=5.0, AccountName='现金')
+    batch.commit()
+    util.invalidate_cache()
+    dates = util.load_transactions_data(columns=['TransactionID', 'Date']).set_index('TransactionID')['Date']
+    assert dates.tolist() == [pd.Timestamp(d) for d in ['2024-01-02', '2024-02-03 12:30:00', '2024-03-05',
+                                                        '2024-04-01']]
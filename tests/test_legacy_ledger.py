@@ -0,0 +1,29 @@
+import pytest
+
+import moneystream
+import util
+from conftest import transaction, use_backend, write_ledger
+
+
+@pytest.mark.parametrize('backend, legacy_parquet', [('csv', False), ('parquet', False), ('parquet', True)])
+def test_legacy_ledger_is_encoded_once(data_dir, monkeypatch, backend, legacy_parquet):
+    # 旧格式账本保存名称，首次读取时转换为ID，之后改名和合并同样作用于历史记录
+    write_ledger([transaction(0, '2024-01-01', 10.0), transaction(1, '2024-01-02', 20.0, subcategory='晚餐')],
+                 legacy=True)
+    if legacy_parquet:
+        # 早期版本转换出的 Parquet 文件同样保存名称
+        util.apply_transaction_schema(util._read_transactions_csv(util.transaction_dir)).to_parquet(
+            util.transaction_parquet_dir, index=False)
+    use_backend(monkeypatch, backend)
+    assert util.load_transactions_data()['AccountName'].tolist() == ['现金', '现金']
+    assert not set(util.dimension_columns) & set(util._base_columns(util._transaction_base_dir()))
+
+    moneystream.update_account('现金', new_name='零钱')
+    moneystream.merge_subcategory('食品', '晚餐', '食品', '午餐')
+    transactions_df = util.load_transactions_data()
+    assert transactions_df['AccountName'].tolist() == ['零钱', '零钱']
+    assert transactions_df['SubcategoryName'].tolist() == ['午餐', '午餐']
+
+    util.compact_transactions()
+    assert util.load_account_data()['AccountName'].tolist() == ['零钱', '银行卡']
+    assert util.load_transactions_data()['AccountName'].tolist() == ['零钱', '零钱']
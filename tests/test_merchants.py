@@ -0,0 +1,25 @@
+import merchants
+import util
+from conftest import transaction, write_ledger
+
+
+def test_merchant_index_queries_only_stale_merchants(data_dir, monkeypatch):
+    write_ledger([transaction(0, '2024-01-01', 10.0), transaction(1, '2024-01-03', 12.0),
+                  transaction(2, '2024-01-02', 20.0, merchant='肯德基'),
+                  transaction(3, '2024-01-04', 25.0, merchant='肯德基')])
+    merchants.load_merchant_index()
+    queries = []
+    query_transactions = util.query_transactions
+    monkeypatch.setattr(util, 'query_transactions', lambda **filters: queries.append(filters) or
+                        query_transactions(**filters))
+    util.patch_transactions({1: {'SubcategoryName': '晚餐'}, 2: {'Amount': 21.0}})
+    util.delete_transactions([0])
+    assert queries == []
+
+    # 删除最近一次使用后只查询该商户
+    util.delete_transactions([3])
+    assert queries == [{'merchant': ['肯德基']}]
+    index = merchants.load_merchant_index()
+    assert index == merchants._entries(util.load_transactions_data(columns=merchants.merchant_columns))
+    assert index['麦当劳']['SubcategoryName'] == '晚餐'
+    assert index['肯德基']['LastUsed'] == '2024-01-02 00:00:00'
@@ -0,0 +1,61 @@
+import pandas as pd
+import pytest
+
+import history
+import moneystream
+import util
+from conftest import transaction, write_ledger
+
+
+def test_cli_add_round_trip(data_dir, capsys):
+    write_ledger([transaction(0, '2024-01-01', 10.0)])
+    moneystream.main(['add', '--type', '支出', '--category', '食品', '--subcategory', '晚餐', '--amount', '12.5',
+                      '--account', '银行卡', '--date', '2024-02-01', '--merchant', '面馆'])
+    assert capsys.readouterr().out.strip() == '交易已添加'
+    row = util.load_transactions_data().set_index('TransactionID').loc[1]
+    assert (row['Date'], row['SubcategoryName'], row['Amount'], row['AccountName'], row['Merchant']) == \
+        (pd.Timestamp('2024-02-01'), '晚餐', 12.5, '银行卡', '面馆')
+    assert util.load_account_data().set_index('AccountName').at['银行卡', 'Balance'] == 487.5
+
+
+def test_cli_add_from_file_backdated(data_dir, tmp_path):
+    write_ledger([])
+    path = tmp_path / 'rows.csv'
+    path.write_text('Date,TransactionType,CategoryName,Amount,AccountName\n'
+                    '2024-01-01,支出,食品,5,现金\n2024-01-02,收入,工资,100,现金\n', encoding='utf-8')
+    moneystream.main(['add', '--file', str(path), '--backdated'])
+    accounts_df = util.load_account_data().set_index('AccountName')
+    # 补记只调整期初余额
+    assert accounts_df.at['现金', 'Balance'] == 100.0
+    assert accounts_df.at['现金', 'OpeningBalance'] == 5.0
+    assert util.load_transactions_data()['Amount'].tolist() == [5.0, 100.0]
+
+
+def test_cli_argument_errors(data_dir, capsys):
+    write_ledger([])
+    with pytest.raises(SystemExit) as exc_info:
+        moneystream.main(['add', '--type', '其他'])
+    assert exc_info.value.code == 2
+    # 缺少必填参数时由服务层报错，以状态 1 退出
+    with pytest.raises(SystemExit) as exc_info:
+        moneystream.main(['add', '--type', '支出', '--category', '食品'])
+    assert exc_info.value.code == 1
+    assert '--amount' in capsys.readouterr().err
+    with pytest.raises(SystemExit) as exc_info:
+        moneystream.main(['reimburse', '1', '2', '--account', '现金', '--amount', '5'])
+    assert exc_info.value.code == 2
+    with pytest.raises(SystemExit) as exc_info:
+        moneystream.main(['add', '--type', '支出', '--category', '食品', '--amount', '1', '--account', '不存在'])
+    assert exc_info.value.code == 1
+    assert util.load_transactions_data().empty
+
+
+def test_service_steps_can_be_undone(data_dir):
+    write_ledger([])
+    steps = moneystream.add_transfer('现金', '银行卡', 30.0, date='2024-01-01')
+    accounts_df = util.load_account_data().set_index('AccountName')
+    assert (accounts_df.at['现金', 'Balance'], accounts_df.at['银行卡', 'Balance']) == (70.0, 530.0)
+    history.undo({'undo': [{'label': '转账', 'steps': steps}], 'redo': []})
+    accounts_df = util.load_account_data().set_index('AccountName')
+    assert (accounts_df.at['现金', 'Balance'], accounts_df.at['银行卡', 'Balance']) == (100.0, 500.0)
+    assert util.load_transactions_data().empty
@@ -0,0 +1,22 @@
+import history
+import moneystream
+import refunds
+from conftest import transaction, write_ledger
+
+
+def test_refund_candidates_follow_refunds(data_dir):
+    write_ledger([transaction(0, '2024-01-01', 10.0), transaction(1, '2024-01-05', 12.0),
+                  transaction(2, '2024-02-01', 30.0, merchant='肯德基')])
+    assert refunds.refund_merchants() == ['肯德基', '麦当劳']
+    assert refunds.refund_merchants(end_date='2024-01-31') == ['麦当劳']
+    assert refunds.refund_candidates('麦当劳')['TransactionID'].tolist() == [0, 1]
+    assert refunds.refund_candidates('麦当劳', start_date='2024-01-05')['TransactionID'].tolist() == [1]
+
+    steps = moneystream.refund_transaction(0)
+    # 已退款的交易和新增的退款收入都不是候选
+    assert refunds.refund_candidates('麦当劳')['TransactionID'].tolist() == [1]
+    moneystream.refund_transaction(1)
+    assert refunds.refund_merchants() == ['肯德基']
+
+    history.undo({'undo': [{'label': '退款', 'steps': steps}], 'redo': []})
+    assert refunds.refund_candidates('麦当劳')['TransactionID'].tolist() == [0]
@@ -0,0 +1,27 @@
+import json
+
+import rollup
+import util
+from conftest import transaction, write_ledger
+
+
+def test_rollup_file_written_lazily(data_dir, monkeypatch):
+    write_ledger([transaction(0, '2024-01-01', 10.0)])
+    rollup.load_rollup()
+    writes = []
+    write_rollup = rollup._write_rollup
+    monkeypatch.setattr(rollup, '_write_rollup', lambda: writes.append(1) or write_rollup())
+    for amount in [1.0, 2.0, 3.0]:
+        batch = util.TransactionBatch()
+        batch.add(Date='2024-01-05', TransactionType='支出', CategoryName='食品', SubcategoryName='午餐',
+                  Amount=amount, AccountName='现金')
+        batch.commit()
+    # 第一次提交立即写入，之后的提交只更新内存
+    assert writes == [1]
+    util.flush_pending_writes()
+    assert writes == [1, 1]
+    with open(rollup.rollup_dir, encoding='utf-8') as f:
+        saved = json.load(f)
+    assert saved['version'] == util.transactions_version()
+    assert sum(row['Amount'] for row in saved['rows']) == 16.0
+    assert rollup.load_rollup().equals(rollup.build_rollup(util.load_transactions_data()))
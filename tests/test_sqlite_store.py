@@ -0,0 +1,22 @@
+import os
+
+import sqlite_store
+import util
+from conftest import transaction, use_backend, write_ledger
+
+
+def test_schema_prepared_once_per_database(data_dir, monkeypatch):
+    write_ledger([transaction(1, '2024-01-01', 10)])
+    use_backend(monkeypatch, 'sqlite')
+    calls = []
+    prepare = sqlite_store._prepare_database
+    monkeypatch.setattr(sqlite_store, '_prepare_database', lambda conn: (calls.append(1), prepare(conn)))
+    for _ in range(3):
+        sqlite_store.table_version('Transactions.csv')
+    assert calls == [1]
+
+    # 数据库文件被重新创建时需要重新建表
+    os.remove(sqlite_store.database_dir)
+    util.migrate_csv_to_sqlite()
+    assert calls == [1, 1]
+    assert util.load_transactions_data()['TransactionID'].tolist() == [1]
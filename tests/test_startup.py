@@ -0,0 +1,32 @@
+import os
+import subprocess
+import sys
+
+import startup
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_top_level_imports_skip_deferred_imports(tmp_path):
+    page = tmp_path / 'page.py'
+    page.write_text('import streamlit as st\nfrom util import *\n\ndef draw():\n    import plotly.express as px\n',
+                    encoding='utf-8')
+    assert startup.top_level_imports(str(page)) == [('import streamlit as st', ['streamlit'], False),
+                                                    ('from util import *', ['util'], True)]
+
+
+def test_check_reports_budget_and_import_problems():
+    page = {'total_ms': 2000.0, 'imports': ['streamlit', 'plotly.express'], 'star_imports': ['util']}
+    cli = {'total_ms': 10.0, 'loaded': {'util', 'streamlit.runtime'}}
+    problems = startup.check({'pages/x.py': page}, {'moneystream': cli})
+    assert len(problems) == 4
+    assert startup.check({'pages/x.py': {**page, 'total_ms': 10.0, 'imports': [], 'star_imports': []}},
+                         {'moneystream': {**cli, 'loaded': {'util'}}}) == []
+
+
+def test_startup_check_passes():
+    # 实际测量各页面和命令行工具的导入耗时（每项测量一次）
+    completed = subprocess.run([sys.executable, 'startup.py', '--check', '--repeat', '1'], cwd=root,
+                               capture_output=True, text=True)
+    assert completed.returncode == 0, completed.stdout + completed.stderr
+    assert '启动耗时检查通过' in completed.stdout
@@ -0,0 +1,26 @@
+import json
+
+import pandas as pd
+
+import suggestions
+import util
+from conftest import transaction, write_ledger
+
+
+def test_model_written_lazily(data_dir, monkeypatch):
+    write_ledger([transaction(0, '2024-01-01', 10.0)])
+    suggestions.load_model()
+    writes = []
+    write_model = suggestions._write_model
+    monkeypatch.setattr(suggestions, '_write_model', lambda: writes.append(1) or write_model())
+    for transaction_id in [1, 2, 3]:
+        util.append_transactions(util.apply_transaction_schema(pd.DataFrame(
+            [transaction(transaction_id, '2024-01-05', 5.0, merchant='肯德基', item='炸鸡')])))
+    assert writes == [1]
+    util.flush_pending_writes()
+    assert writes == [1, 1]
+    with open(suggestions.model_dir, encoding='utf-8') as f:
+        saved = json.load(f)
+    assert saved['version'] == util.transactions_version()
+    assert saved['accounts']['m:肯德基'] == {'现金': 3}
+    assert suggestions.suggest('肯德基')['CategoryName'] == '食品'
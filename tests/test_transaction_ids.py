@@ -0,0 +1,46 @@
+import pytest
+
+import util
+from conftest import transaction, use_backend, write_ledger
+
+
+@pytest.mark.parametrize('backend', ['csv', 'sqlite', 'parquet', 'partitioned'])
+def test_allocated_ids_are_unique_after_switching_backend(data_dir, monkeypatch, backend):
+    # 首次使用 parquet/分区存储时会自动转换 Transactions.csv，转换前后分配的ID不能重复
+    write_ledger([transaction(0, '2024-01-01', 10.0), transaction(1, '2024-02-03 12:00:00', 20.0)])
+    use_backend(monkeypatch, backend)
+    first = util.allocate_transaction_ids(2)
+    second = util.allocate_transaction_ids(1)
+    assert first == [2, 3]
+    assert second == [4]
+
+
+def test_batch_ids_continue_after_commit(data_dir):
+    write_ledger([transaction(0, '2024-01-01', 10.0)])
+    batch = util.TransactionBatch()
+    new_id = batch.add(Date='2024-03-01', TransactionType='支出', CategoryName='食品', Amount=5.0, AccountName='现金')
+    batch.commit()
+    assert new_id == 1
+    assert util.allocate_transaction_ids(1) == [2]
+
+
+@pytest.mark.parametrize('backend', ['csv', 'sqlite', 'parquet', 'partitioned'])
+def test_own_commits_do_not_rescan_max_id(data_dir, monkeypatch, backend):
+    write_ledger([transaction(0, '2024-01-01', 10.0)])
+    use_backend(monkeypatch, backend)
+    assert util.allocate_transaction_ids(1) == [1]
+    scans = []
+    max_transaction_id = util.max_transaction_id
+    monkeypatch.setattr(util, 'max_transaction_id', lambda: scans.append(1) or max_transaction_id())
+    batch = util.TransactionBatch()
+    batch.add(Date='2024-03-01', TransactionType='支出', CategoryName='食品', Amount=5.0, AccountName='现金')
+    batch.commit()
+    util.patch_transactions({0: {'Amount': 12.0}})
+    util.delete_transactions([0])
+    assert util.allocate_transaction_ids(1) == [3]
+    assert scans == []
+
+    # 账本被外部改写后重新计算最大ID
+    util.save_data(util.load_transactions_data().assign(TransactionID=[10]), 'Transactions.csv')
+    assert util.allocate_transaction_ids(1) == [11]
+    assert scans == [1]
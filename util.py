@@ -1,31 +1,1485 @@
+import atexit
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+import numpy as np
 import pandas as pd
 
+import sqlite_store
+
+data_dir = 'Data'
 transaction_dir = 'Data/Transactions.csv'
 categories_dir = 'Data/Categories.csv'
 subcategories_dir = 'Data/Subcategories.csv'
 account_dir = 'Data/Account.csv'
+# 子类别合并后，原子类别移入该表，MergedIntoID 指向合并到的子类别
+subcategory_aliases_dir = 'Data/SubcategoryAliases.csv'
+subcategory_alias_columns = ['SubcategoryID', 'SubcategoryName', 'ParentCategoryName', 'MergedIntoID']
+# 列式存储（Parquet），保留列类型，读取时无需解析日期
+transaction_parquet_dir = 'Data/Transactions.parquet'
+# 按月分区存储：每个自然月一个文件 Data/Transactions/YYYY-MM.csv
+transaction_partition_dir = 'Data/Transactions'
+# 交易流水日志：新增/修改以追加记录的形式写入，定期合并回 Transactions.csv
+transaction_journal_dir = 'Data/Transactions.journal.jsonl'
+# 日志超过该大小（字节）时自动合并
+journal_compact_threshold = 1024 * 1024
+# 一次新增超过该行数（例如导入账单）时直接追加到 Transactions.csv 末尾，不逐行写入日志
+bulk_append_rows = 1000
+# 存储后端：'csv'（默认）、'sqlite'、'parquet' 或 'partitioned'，可通过环境变量 MONEYSTREAM_STORAGE 切换
+# parquet 后端下交易记录存为 Transactions.parquet（同样使用交易日志追加写入），其余数据仍为 CSV
+# partitioned 后端下交易记录按月分区，读写只涉及日期范围内的分区
+storage_backend = os.environ.get('MONEYSTREAM_STORAGE', 'csv')
+
+transaction_columns = ['TransactionID', 'Date', 'TransactionType', 'CategoryName', 'SubcategoryName', 'Amount',
+                       'AccountName', 'Remarks', 'Merchant', 'Item', 'UpdatedDate', 'IsRefund', 'RelatedTransactionID']
+
+# 交易表的内存类型：读取时统一转换一次，保存时再转换回文件中的文本格式
+# 低基数的文本列使用 category（筛选时为整数比较），是否报销（'是'/'否'）使用布尔值
+transaction_schema = {
+    'TransactionID': 'int64',
+    'Date': 'datetime64',
+    'TransactionType': 'category',
+    'CategoryName': 'category',
+    'SubcategoryName': 'category',
+    'Amount': 'float64',
+    'AccountName': 'category',
+    'Merchant': 'category',
+    'IsRefund': 'bool',
+    'RelatedTransactionID': 'Int64',
+}
+transaction_types = ['收入', '支出']
+# 维度编码：文件中交易记录的账户、类别、子类别只保存ID，读取时通过维度表解析为名称
+# 账户或类别改名、子类别合并只需修改维度表，不需要重写交易记录
+dimension_columns = {'AccountName': 'AccountID', 'CategoryName': 'CategoryID', 'SubcategoryName': 'SubcategoryID'}
+storage_columns = [dimension_columns.get(column, column) for column in transaction_columns]
+dimension_files = ['Account.csv', 'Categories.csv', 'Subcategories.csv', 'SubcategoryAliases.csv']
+refund_labels = {True: '是', False: '否'}
+
+# 进程内数据缓存：文件路径 -> (文件签名, 解析后的DataFrame)
+# Streamlit 的每次重跑都会调用 load_data()，文件未变化时直接复用已解析的数据
+_frame_cache = {}
+_cache_lock = threading.Lock()
+cache_stats = {'hits': 0, 'misses': 0}
+
+
+def _file_signature(path):
+    # 以修改时间和文件大小作为缓存键，文件被外部修改时自动失效
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _read_cached(path, reader, signature=None):
+    if signature is None:
+        signature = _file_signature(path)
+    with _cache_lock:
+        cached = _frame_cache.get(path)
+        if cached is not None and cached[0] == signature:
+            cache_stats['hits'] += 1
+            return cached[1].copy()
+    df = reader(path)
+    with _cache_lock:
+        cache_stats['misses'] += 1
+        _frame_cache[path] = (signature, df)
+    # 返回副本，页面对数据的原地修改不会污染缓存
+    return df.copy()
+
+
+def invalidate_cache(path=None):
+    with _cache_lock:
+        if path is None:
+            _frame_cache.clear()
+        else:
+            # SQLite 的各张表以 '数据库路径#表' 为键缓存
+            for key in [key for key in _frame_cache if key == path or key.startswith(f'{path}#')]:
+                del _frame_cache[key]
+
+
+def get_cache_stats():
+    with _cache_lock:
+        return {'hits': cache_stats['hits'], 'misses': cache_stats['misses'], 'entries': len(_frame_cache),
+                'query_hits': query_stats['hits'], 'query_misses': query_stats['misses']}
+
 
 # 读取数据文件
 def load_data():
     return load_transactions_data(), load_categories_data(), load_subcategories_data(), load_account_data()
 
-def load_transactions_data():
-    transactions_df = pd.read_csv(transaction_dir, dtype={'RelatedTransactionID': 'Int64', 'Remarks': str}, parse_dates=['Date'])
-    return transactions_df
+def load_transactions_data(columns=None, start_date=None, end_date=None):
+    # columns: 只读取需要的列（列式存储下只解码这些列）
+    # start_date/end_date: 只返回该日期范围内的记录（分区存储下只读取重叠的月份分区）
+    read_columns = columns
+    if columns is not None and (start_date is not None or end_date is not None) and 'Date' not in columns:
+        read_columns = list(columns) + ['Date']
+    if storage_backend == 'partitioned':
+        _migrate_csv_to_partitions()
+        transactions_df = _read_partitions(read_columns, start_date, end_date)
+    elif storage_backend == 'sqlite':
+        # 缓存键包含维度映射的版本，账户等改名后重新解析名称
+        signature = (_sqlite_signature('Transactions.csv'), dimension_maps()['version'])
+        transactions_df = _read_sqlite_cached(
+            'Transactions.csv', lambda df: apply_transaction_schema(_decode_dimensions(df)), signature)
+    else:
+        if storage_backend == 'parquet':
+            _migrate_csv_to_parquet()
+        _migrate_legacy_dimensions()
+        # 缓存键同时包含主文件和日志文件，任意一方变化都会重新回放日志
+        signature = (_file_signature(_transaction_base_dir()), _file_signature(transaction_journal_dir),
+                     dimension_maps()['version'])
+        transactions_df = _read_cached(_projection_key(transaction_journal_dir, read_columns),
+                                       lambda _: _replay_transaction_journal(read_columns), signature)
+    if start_date is not None or end_date is not None:
+        transactions_df = transactions_df[_date_mask(transactions_df, start_date, end_date)]
+    return transactions_df if columns is None else transactions_df[columns]
 
 def load_categories_data():
-    categories_df = pd.read_csv(categories_dir)
-    return categories_df
+    if storage_backend == 'sqlite':
+        return _read_sqlite_cached('Categories.csv')
+    return _read_cached(categories_dir, pd.read_csv)
 
 def load_subcategories_data():
-    subcategories_df = pd.read_csv(subcategories_dir)
-    return subcategories_df
+    if storage_backend == 'sqlite':
+        return _read_sqlite_cached('Subcategories.csv')
+    return _read_cached(subcategories_dir, pd.read_csv)
 
 def load_account_data():
-    account_df = pd.read_csv(account_dir, dtype={'AccountSuffix': str})
-    return account_df
+    if storage_backend == 'sqlite':
+        return _read_sqlite_cached('Account.csv')
+    return _read_cached(account_dir, lambda path: pd.read_csv(path, dtype={'AccountSuffix': str}))
+
+def load_subcategory_aliases_data():
+    # 尚未合并过子类别时该表不存在
+    if storage_backend == 'sqlite':
+        df = _read_sqlite_cached('SubcategoryAliases.csv')
+    elif os.path.exists(subcategory_aliases_dir):
+        df = _read_cached(subcategory_aliases_dir, pd.read_csv)
+    else:
+        df = pd.DataFrame()
+    return pd.DataFrame(columns=subcategory_alias_columns) if df.empty else df
+
+
+def _read_sqlite_cached(file_name, converter=None, signature=None):
+    def reader(_):
+        df = sqlite_store.read_table(file_name)
+        return converter(df) if converter is not None else df
+    if signature is None:
+        signature = _sqlite_signature(file_name)
+    return _read_cached(f'{sqlite_store.database_dir}#{file_name}', reader, signature)
+
+
+def _sqlite_signature(file_name):
+    # 按表的写入版本号判断缓存是否有效，写入 Account 等表不会使交易数据的缓存失效
+    if not os.path.exists(sqlite_store.database_dir):
+        return None
+    return sqlite_store.table_version(file_name)
+
+
+def _projection_key(path, columns):
+    return path if columns is None else f'{path}#{",".join(columns)}'
+
+
+def _transaction_base_dir():
+    return transaction_parquet_dir if storage_backend == 'parquet' else transaction_dir
+
+
+def _storage_projection(columns):
+    # 列投影对应的文件列：始终带上 TransactionID（回放日志需要按 ID 定位记录），名称列同时读取对应的ID列
+    # 类别的解析同时依赖 CategoryID 和 SubcategoryID（见 _decode_dimensions）
+    projection = ['TransactionID']
+    for column in columns:
+        if column in ('CategoryName', 'SubcategoryName'):
+            projection += ['CategoryName', 'SubcategoryName', 'CategoryID', 'SubcategoryID']
+        elif column in dimension_columns:
+            projection += [column, dimension_columns[column]]
+        else:
+            projection.append(column)
+    return list(dict.fromkeys(projection))
+
+
+def _read_transactions_base(columns=None):
+    # 读取文件中的原始记录（尚未解析名称）
+    if columns is not None:
+        columns = _storage_projection(columns)
+    base_dir = _transaction_base_dir()
+    if storage_backend == 'parquet':
+        def reader(_):
+            import pyarrow.parquet as pq
+            # 旧格式文件中没有ID列，新格式文件中没有名称列，只读取存在的列
+            available = pq.read_schema(base_dir).names
+            return pd.read_parquet(base_dir, columns=None if columns is None else
+                                   [column for column in columns if column in available])
+    else:
+        reader = lambda _: _read_transactions_csv(base_dir, columns)
+    return _read_cached(_projection_key(base_dir, columns), reader, _file_signature(base_dir))
+
+
+def _csv_columns(path):
+    return list(pd.read_csv(path, nrows=0).columns) if os.path.exists(path) else None
+
+
+def _read_transactions_csv(path, columns=None):
+    dtype = {'RelatedTransactionID': 'Int64', 'Remarks': str,
+             'AccountID': 'Int64', 'CategoryID': 'Int64', 'SubcategoryID': 'Int64'}
+    parse_dates = ['Date']
+    usecols = None
+    if columns is not None:
+        dtype = {k: v for k, v in dtype.items() if k in columns}
+        parse_dates = [c for c in parse_dates if c in columns]
+        # 旧格式文件中没有ID列，新格式文件中没有名称列，只读取存在的列
+        usecols = lambda column: column in columns
+    return pd.read_csv(path, usecols=usecols, dtype=dtype, parse_dates=parse_dates)
+
+
+# 交易表类型转换
+def apply_transaction_schema(df):
+    # 将文件中读取的列转换为 transaction_schema 中的类型（已转换的列保持不变）
+    for column, dtype in transaction_schema.items():
+        if column not in df.columns:
+            continue
+        if dtype == 'datetime64':
+            # 历史数据中日期格式不统一（有的带时间，有的只有日期）
+            if not pd.api.types.is_datetime64_any_dtype(df[column]):
+                df[column] = pd.to_datetime(df[column], format='mixed')
+        elif dtype == 'bool':
+            if df[column].dtype != bool:
+                df[column] = df[column].isin([refund_labels[True], True])
+        elif dtype == 'category':
+            df[column] = df[column].astype('category')
+        else:
+            df[column] = pd.to_numeric(df[column]).astype(dtype)
+    return df
+
+
+def to_storage_frame(df):
+    # 转换回文件中的格式：布尔值写为 '是'/'否'，category 列写为普通文本
+    df = df.copy()
+    for column in df.columns:
+        if transaction_schema.get(column) == 'bool' and df[column].dtype == bool:
+            df[column] = df[column].map(refund_labels)
+        elif isinstance(df[column].dtype, pd.CategoricalDtype):
+            df[column] = df[column].astype(object)
+    return df
+
+
+# 维度编码：名称与ID的转换
+_dimension_cache = {}
+
+
+def _dimension_signature():
+    if storage_backend == 'sqlite':
+        if not os.path.exists(sqlite_store.database_dir):
+            return None
+        return sqlite_store.table_versions(dimension_files)
+    return tuple(_file_signature(f'{data_dir}/{file_name}') for file_name in dimension_files)
+
+
+def _id_names(df, key, name):
+    if key not in df.columns or name not in df.columns:
+        return {}
+    return {int(k): v for k, v in zip(df[key], df[name]) if pd.notna(k) and pd.notna(v)}
+
+
+def _first_ids(names):
+    # 名称 -> ID，同名时取最小的ID
+    ids = {}
+    for dimension_id, name in sorted(names.items()):
+        ids.setdefault(name, dimension_id)
+    return ids
+
+
+def dimension_maps():
+    # ID 与名称的对应关系，维度表变化时重新计算
+    # version 只取决于对应关系本身，修改账户余额等其他字段不会改变它
+    signature = _dimension_signature()
+    with _cache_lock:
+        if 'maps' in _dimension_cache and _dimension_cache['signature'] == signature:
+            return _dimension_cache['maps']
+    accounts_df, categories_df = load_account_data(), load_categories_data()
+    subcategories_df, aliases_df = load_subcategories_data(), load_subcategory_aliases_data()
+    account_names = _id_names(accounts_df, 'AccountID', 'AccountName')
+    category_names = _id_names(categories_df, 'CategoryID', 'CategoryName')
+    category_ids = _first_ids(category_names)
+    # 子类别ID -> (所属类别, 子类别名称)
+    subcategories = {}
+    for row in subcategories_df.to_dict('records'):
+        if pd.notna(row['SubcategoryID']) and pd.notna(row['SubcategoryName']):
+            parent = None if pd.isna(row['ParentCategoryName']) else row['ParentCategoryName']
+            subcategories[int(row['SubcategoryID'])] = (parent, row['SubcategoryName'])
+    aliases = {int(row['SubcategoryID']): row for row in aliases_df.to_dict('records')
+               if pd.notna(row['SubcategoryID']) and pd.notna(row['MergedIntoID'])}
+    # 已合并的子类别：原子类别下的记录解析为合并到的子类别及其所属类别，依次合并时沿链找到最终的子类别
+    redirects = []
+    for alias_id, row in sorted(aliases.items()):
+        target, seen = int(row['MergedIntoID']), {alias_id}
+        while target in aliases and target not in seen:
+            seen.add(target)
+            target = int(aliases[target]['MergedIntoID'])
+        if target in subcategories and row['ParentCategoryName'] in category_ids:
+            redirects.append((alias_id, category_ids[row['ParentCategoryName']], *subcategories[target]))
+    subcategory_names = {k: name for k, (_, name) in subcategories.items()}
+    subcategory_names.update({k: row['SubcategoryName'] for k, row in aliases.items() if k not in subcategories})
+    maps = {
+        'account_names': account_names,
+        'account_ids': _first_ids(account_names),
+        'category_names': category_names,
+        'category_ids': category_ids,
+        'subcategory_names': subcategory_names,
+        'subcategory_ids': _first_ids(subcategories),
+        'subcategory_name_ids': _first_ids({k: name for k, (_, name) in subcategories.items()}),
+        'redirects': redirects,
+    }
+    content = [sorted(account_names.items()), sorted(category_names.items()),
+               sorted(subcategory_names.items()), redirects]
+    maps['version'] = hashlib.md5(json.dumps(content, ensure_ascii=False, default=str).encode()).hexdigest()
+    with _cache_lock:
+        _dimension_cache.update(signature=signature, maps=maps)
+    return maps
+
+
+def _records(df):
+    return df.astype(object).where(df.notna(), None).to_dict('records')
+
+
+class DimensionCatalog:
+    # 类别、子类别和账户的内存目录：构建时一次整理成字典，页面上的下拉列表和按名称查找均为 O(1)
+    def __init__(self, categories_df, subcategories_df, accounts_df):
+        self.category_rows = _records(categories_df)
+        self.categories_by_type = {}
+        for row in self.category_rows:
+            if row['CategoryName'] is not None:
+                self.categories_by_type.setdefault(row['TransactionType'], []).append(row['CategoryName'])
+        self.category_names = [row['CategoryName'] for row in self.category_rows if row['CategoryName'] is not None]
+        # 所属类别 -> 子类别记录，保持表中的顺序
+        self.subcategories_by_parent = {}
+        self.subcategory_ids = {}
+        for row in _records(subcategories_df):
+            if row['SubcategoryName'] is None:
+                continue
+            self.subcategories_by_parent.setdefault(row['ParentCategoryName'], []).append(row)
+            if row['SubcategoryID'] is not None:
+                self.subcategory_ids.setdefault((row['ParentCategoryName'], row['SubcategoryName']),
+                                                int(row['SubcategoryID']))
+        self.subcategory_names = list(dict.fromkeys(
+            row['SubcategoryName'] for rows in self.subcategories_by_parent.values() for row in rows))
+        account_rows = [row for row in _records(accounts_df) if row['AccountName'] is not None]
+        self.accounts_by_name, self.accounts_by_id, self.accounts_by_type = {}, {}, {}
+        for row in account_rows:
+            self.accounts_by_name.setdefault(row['AccountName'], row)
+            if row['AccountID'] is not None:
+                self.accounts_by_id.setdefault(int(row['AccountID']), row)
+            self.accounts_by_type.setdefault(row['AccountType'], []).append(row)
+        self.account_names = [row['AccountName'] for row in account_rows]
+        # 已删除的账户 IsValid 为否；锁定的账户不再记账
+        self.valid_accounts = [row['AccountName'] for row in account_rows if row.get('IsValid') != '否']
+        self.locked_accounts = [row['AccountName'] for row in account_rows if row.get('IsLocked') == '是']
+
+    def categories(self, transaction_type=None):
+        # 指定交易类型下的类别名称，不指定时返回全部类别
+        if transaction_type is None:
+            return list(self.category_names)
+        return list(self.categories_by_type.get(transaction_type, []))
+
+    def subcategories(self, category):
+        return [row['SubcategoryName'] for row in self.subcategories_by_parent.get(category, [])]
+
+    def subcategory_rows(self, category):
+        return list(self.subcategories_by_parent.get(category, []))
+
+    def subcategory_id(self, category, subcategory):
+        return self.subcategory_ids.get((category, subcategory))
+
+    def account(self, account_name):
+        # 账户记录（字典），不存在时返回 None
+        return self.accounts_by_name.get(account_name)
+
+    def account_by_id(self, account_id):
+        return self.accounts_by_id.get(account_id)
+
+
+_catalog_cache = {}
+
+
+def dimension_catalog():
+    # 维度表未变化时直接返回已构建的目录，不在每次页面刷新时重新筛选表格
+    signature = _dimension_signature()
+    with _cache_lock:
+        if 'catalog' in _catalog_cache and _catalog_cache['signature'] == signature:
+            return _catalog_cache['catalog']
+    catalog = DimensionCatalog(load_categories_data(), load_subcategories_data(), load_account_data())
+    with _cache_lock:
+        _catalog_cache.update(signature=signature, catalog=catalog)
+    return catalog
+
+
+def _subcategory_id(maps, category, subcategory):
+    # 优先取所属类别下的同名子类别
+    if subcategory is None:
+        return None
+    return maps['subcategory_ids'].get((category, subcategory), maps['subcategory_name_ids'].get(subcategory))
+
+
+def next_dimension_id(file_name, key, empty_id=0):
+    # 新建维度行的ID；已合并的子类别移入 SubcategoryAliases.csv 后其ID仍被交易记录引用，不能复用
+    ids = table_loaders[file_name]()[key]
+    if file_name == 'Subcategories.csv':
+        ids = pd.concat([ids, load_subcategory_aliases_data()['SubcategoryID']])
+    ids = pd.to_numeric(ids).dropna()
+    return empty_id if ids.empty else int(ids.max()) + 1
+
+
+def _append_dimension_rows(file_name, key, rows):
+    df = table_loaders[file_name]()
+    first_id = next_dimension_id(file_name, key)
+    new_df = pd.DataFrame([{key: first_id + i, **row} for i, row in enumerate(rows)])
+    # 表尚不存在时（例如新建的数据库）按登记的字段建表
+    if len(df.columns):
+        new_df = new_df.reindex(columns=df.columns)
+    save_data(new_df if df.empty else pd.concat([df, new_df], ignore_index=True), file_name)
+
+
+def _register_dimensions(df):
+    # 登记维度表中还没有的账户、类别和子类别（例如旧数据中已删除的子类别），返回最新的维度映射
+    maps = dimension_maps()
+
+    def missing(column, known):
+        return [] if column not in df.columns else sorted(set(df[column].dropna()) - set(known))
+
+    def first_value(column, name_column, name, default):
+        if column not in df.columns:
+            return default
+        values = df.loc[df[name_column] == name, column].dropna()
+        return values.iloc[0] if len(values) else default
+
+    new_accounts = missing('AccountName', maps['account_ids'])
+    new_categories = missing('CategoryName', maps['category_ids'])
+    new_subcategories = missing('SubcategoryName', maps['subcategory_name_ids'])
+    if new_accounts:
+        current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        _append_dimension_rows('Account.csv', 'AccountID', [
+            {'AccountName': name, 'Balance': 0.0, 'OpeningBalance': 0.0, 'IsLocked': '否', 'IsValid': '是',
+             'LastModifiedTime': current_time} for name in new_accounts])
+    if new_categories:
+        _append_dimension_rows('Categories.csv', 'CategoryID', [
+            {'CategoryName': name, 'TransactionType': first_value('TransactionType', 'CategoryName', name, '支出')}
+            for name in new_categories])
+    if new_subcategories:
+        _append_dimension_rows('Subcategories.csv', 'SubcategoryID', [
+            {'SubcategoryName': name, 'ParentCategoryName': first_value('CategoryName', 'SubcategoryName', name, None)}
+            for name in new_subcategories])
+    return dimension_maps() if new_accounts or new_categories or new_subcategories else maps
+
+
+def _encode_dimensions(df):
+    # 名称列转换为ID列（文件中的存储格式）；已有ID的记录以ID为准
+    present = [column for column in dimension_columns if column in df.columns]
+    if not present:
+        return df
+    maps = _register_dimensions(df)
+    df = df.copy()
+    names = {column: df[column].astype(object).where(df[column].notna(), None) for column in present}
+    ids = {}
+    if 'AccountName' in names:
+        ids['AccountName'] = names['AccountName'].map(maps['account_ids'])
+    if 'CategoryName' in names:
+        ids['CategoryName'] = names['CategoryName'].map(maps['category_ids'])
+    if 'SubcategoryName' in names:
+        categories = names.get('CategoryName', pd.Series(None, index=df.index, dtype=object))
+        lookup = {pair: _subcategory_id(maps, *pair) for pair in set(zip(categories, names['SubcategoryName']))}
+        ids['SubcategoryName'] = pd.Series([lookup[pair] for pair in zip(categories, names['SubcategoryName'])],
+                                           index=df.index, dtype=object)
+    for column in present:
+        id_column = dimension_columns[column]
+        values = ids[column].astype('Int64')
+        if id_column in df.columns:
+            values = pd.to_numeric(df[id_column]).astype('Int64').fillna(values)
+        df[id_column] = values
+    df = df.drop(columns=present)
+    return df[[column for column in storage_columns if column in df.columns] +
+              [column for column in df.columns if column not in storage_columns]]
+
+
+def _encode_patches(patches):
+    # 修改中的名称转换为ID；同时清空旧格式记录中保存的名称，解析时以ID为准
+    frame = pd.DataFrame.from_dict({transaction_id: {k: v for k, v in values.items() if k in dimension_columns}
+                                    for transaction_id, values in patches.items()}, orient='index')
+    if frame.empty:
+        return patches
+    frame = frame.astype(object)
+    # 只修改子类别时按记录当前的类别解析（不同类别下可能有同名子类别）
+    missing = [transaction_id for transaction_id, values in patches.items()
+               if 'SubcategoryName' in values and 'CategoryName' not in values]
+    if missing:
+        current = transaction_rows(missing).set_index('TransactionID')['CategoryName'].astype(object)
+        frame['CategoryName'] = frame.get('CategoryName', pd.Series(None, index=frame.index, dtype=object))
+        for transaction_id in missing:
+            if transaction_id in current.index:
+                frame.at[transaction_id, 'CategoryName'] = current[transaction_id]
+    encoded = _encode_dimensions(frame)
+    stored = {}
+    for transaction_id, values in patches.items():
+        stored[transaction_id] = {}
+        for column, value in values.items():
+            if column in dimension_columns:
+                id_column = dimension_columns[column]
+                stored[transaction_id][id_column] = _json_value(encoded.at[transaction_id, id_column])
+                value = None
+            stored[transaction_id][column] = value
+    return stored
+
+
+def _decode_dimensions(df):
+    # ID列解析为名称列；旧格式（保存名称）的记录没有ID，保留原有名称
+    present = [column for column in dimension_columns if dimension_columns[column] in df.columns]
+    if not present:
+        return df
+    maps = dimension_maps()
+    lookups = {'AccountName': maps['account_names'], 'CategoryName': maps['category_names'],
+               'SubcategoryName': maps['subcategory_names']}
+    ids = {column: pd.to_numeric(df[dimension_columns[column]]).astype('Int64') for column in present}
+    names = {column: ids[column].map(lookups[column]).astype(object) for column in present}
+    if 'CategoryName' in ids and 'SubcategoryName' in ids:
+        for alias_id, category_id, target_category, target_subcategory in maps['redirects']:
+            moved = ((ids['SubcategoryName'] == alias_id) & (ids['CategoryName'] == category_id)).fillna(False)
+            names['CategoryName'] = names['CategoryName'].mask(moved.astype(bool), target_category)
+            names['SubcategoryName'] = names['SubcategoryName'].mask(moved.astype(bool), target_subcategory)
+    for column in present:
+        if column in df.columns:
+            names[column] = names[column].where(ids[column].notna(), df[column].astype(object))
+        df[column] = names[column]
+    df = df.drop(columns=[dimension_columns[column] for column in present])
+    return df[[column for column in transaction_columns if column in df.columns] +
+              [column for column in df.columns if column not in transaction_columns]]
+
+
+def _add_id_columns(transactions_df, columns):
+    # 旧格式（保存名称）的记录与以ID保存的新记录或修改合并时，补上缺少的ID列
+    for column in dimension_columns.values():
+        if column in columns and column not in transactions_df.columns:
+            transactions_df[column] = pd.Series(pd.NA, index=transactions_df.index, dtype='Int64')
+    return transactions_df
+
+
+def validate_transactions(df):
+    # 向量化校验交易记录，返回问题描述列表（为空表示通过）
+    # 账户、类别、子类别必须已存在：表格中输入的新名称不会自动登记，需先在账户/类目管理页面添加
+    problems = []
+    catalog = dimension_catalog()
+    categories, subcategories = df['CategoryName'].astype(object), df['SubcategoryName'].astype(object)
+    known_subcategory = pd.Series([catalog.subcategory_id(category, subcategory) is not None
+                                   for category, subcategory in zip(categories, subcategories)], index=df.index)
+    checks = [
+        (df['TransactionID'].duplicated(), '交易ID重复'),
+        (df['Date'].isna(), '日期为空'),
+        (~df['TransactionType'].isin(transaction_types), '交易类型不是收入/支出'),
+        (df['Amount'].isna(), '金额为空'),
+        (df['CategoryName'].isna(), '类别为空'),
+        (df['AccountName'].isna(), '账户为空'),
+        (df['AccountName'].notna() & ~df['AccountName'].astype(object).isin(catalog.accounts_by_name), '账户不存在'),
+        (categories.notna() & ~categories.isin(catalog.category_names), '类别不存在'),
+        (subcategories.notna() & subcategories.ne('') & categories.isin(catalog.category_names) & ~known_subcategory,
+         '子类别不属于该类别'),
+    ]
+    for mask, message in checks:
+        if mask.any():
+            ids = df.loc[mask, 'TransactionID'].head(5).tolist()
+            problems.append(f'{message}：{mask.sum()} 条（交易ID {ids}）')
+    return problems
+
+
+def set_transaction_values(df, mask, values):
+    # 按条件批量写入新值；category 列中尚不存在的取值会先加入类别
+    for column, value in values.items():
+        if isinstance(df[column].dtype, pd.CategoricalDtype) and value not in df[column].cat.categories:
+            df[column] = df[column].cat.add_categories([value])
+        df.loc[mask, column] = value
+    return df
+
+
+def _migrate_csv_to_parquet():
+    # 首次使用 parquet 后端时自动将 Transactions.csv 转换为 Parquet；未合并的交易日志继续有效
+    if os.path.exists(transaction_parquet_dir) or not os.path.exists(transaction_dir):
+        return
+    transactions_df = apply_transaction_schema(_encode_dimensions(_read_transactions_csv(transaction_dir)))
+    tmp_dir = f'{transaction_parquet_dir}.tmp'
+    transactions_df.to_parquet(tmp_dir, index=False)
+    os.replace(tmp_dir, transaction_parquet_dir)
+
+
+# 旧格式主文件的一次性转换：文件中保存的是账户、类别、子类别名称时，连同未合并的日志整体改存为ID
+# 否则账户改名、子类别合并不会作用于这些记录，合并日志时旧名称还会被重新登记为新的账户或类别
+_encoded_files = {}
+
+
+def _base_columns(path):
+    if storage_backend == 'parquet':
+        import pyarrow.parquet as pq
+        return pq.read_schema(path).names
+    return _csv_columns(path)
+
+
+def _migrate_legacy_dimensions():
+    base_dir = _transaction_base_dir()
+    signature = _file_signature(base_dir)
+    if signature is None or _encoded_files.get(base_dir) == signature:
+        return
+    if any(column in dimension_columns for column in _base_columns(base_dir)):
+        save_data(_replay_transaction_journal(), 'Transactions.csv')
+        signature = _file_signature(base_dir)
+    _encoded_files[base_dir] = signature
+
+
+# 按月分区存储
+def _partition_path(month):
+    return f'{transaction_partition_dir}/{month}.csv'
+
+
+def _partition_months(start_date=None, end_date=None):
+    # 根据日期范围裁剪分区，只返回与范围重叠的月份
+    if not os.path.isdir(transaction_partition_dir):
+        return []
+    months = sorted(name[:-4] for name in os.listdir(transaction_partition_dir) if name.endswith('.csv'))
+    if start_date is not None:
+        months = [month for month in months if month >= pd.Timestamp(start_date).strftime('%Y-%m')]
+    if end_date is not None:
+        months = [month for month in months if month <= pd.Timestamp(end_date).strftime('%Y-%m')]
+    return months
+
+
+def _read_partition(month, columns=None):
+    # 读取分区文件中的原始记录（尚未解析名称）
+    path = _partition_path(month)
+    if columns is not None:
+        columns = _storage_projection(columns)
+    return _read_cached(_projection_key(path, columns), lambda _: _read_transactions_csv(path, columns),
+                        _file_signature(path))
+
+
+def _read_partitions(columns=None, start_date=None, end_date=None):
+    frames = [_read_partition(month, columns) for month in _partition_months(start_date, end_date)]
+    if not frames:
+        return apply_transaction_schema(pd.DataFrame(columns=columns or transaction_columns))
+    transactions_df = apply_transaction_schema(_decode_dimensions(pd.concat(frames, ignore_index=True)))
+    return transactions_df if columns is None else transactions_df[columns]
+
+
+def _month_of(df):
+    return pd.to_datetime(df['Date'], format='mixed').dt.strftime('%Y-%m')
+
+
+def _partition_csv(rows, header=True):
+    rows = to_storage_frame(apply_transaction_schema(_encode_dimensions(rows.copy())))[storage_columns]
+    return rows.to_csv(header=header, index=False, date_format='%Y-%m-%d %H:%M:%S')
+
+
+def _write_partition(month, rows, mode='w'):
+    path = _partition_path(month)
+    with open(path, mode, encoding='utf-8', newline='') as f:
+        f.write(_partition_csv(rows, header=mode == 'w' or f.tell() == 0))
+    invalidate_cache(path)
+
+
+def _append_partitions(new_transactions_df):
+    # 追加到各记录日期所在的分区（补记的记录会写入对应的历史月份）
+    os.makedirs(transaction_partition_dir, exist_ok=True)
+    for month, rows in new_transactions_df.groupby(_month_of(new_transactions_df)):
+        _write_partition(month, rows, mode='a')
+
+
+def _patch_partitions(patches):
+    # 只重写被修改记录所在的分区；修改了日期的记录移动到新的分区
+    index_df = _read_partitions(['TransactionID', 'Date'])
+    id_months = pd.Series(_month_of(index_df).values, index=index_df['TransactionID'])
+    for month in {id_months[transaction_id] for transaction_id in patches if transaction_id in id_months.index}:
+        partition_df = _read_partition(month)
+        partition_df = _apply_patches(partition_df, {k: v for k, v in patches.items() if id_months.get(k) == month})
+        moved = _month_of(partition_df) != month
+        if moved.all():
+            os.remove(_partition_path(month))
+            invalidate_cache(_partition_path(month))
+        else:
+            _write_partition(month, partition_df[~moved])
+        if moved.any():
+            _append_partitions(partition_df[moved])
+
+
+def _delete_partitions(transaction_ids):
+    # 只重写被删除记录所在的分区
+    index_df = _read_partitions(['TransactionID', 'Date'])
+    index_df = index_df[index_df['TransactionID'].isin(transaction_ids)]
+    for month in set(_month_of(index_df)):
+        partition_df = _read_partition(month)
+        partition_df = partition_df[~partition_df['TransactionID'].isin(transaction_ids)]
+        if partition_df.empty:
+            os.remove(_partition_path(month))
+            invalidate_cache(_partition_path(month))
+        else:
+            _write_partition(month, partition_df)
+
+
+def _write_partitions(transactions_df):
+    # 全量保存时只重写内容发生变化的分区
+    os.makedirs(transaction_partition_dir, exist_ok=True)
+    transactions_df = apply_transaction_schema(_encode_dimensions(transactions_df.copy()))
+    existing_months = set(_partition_months())
+    months = _month_of(transactions_df)
+    for month, rows in transactions_df.groupby(months):
+        if month in existing_months:
+            with open(_partition_path(month), encoding='utf-8', newline='') as f:
+                if f.read() == _partition_csv(rows):
+                    continue
+        _write_partition(month, rows)
+    for month in existing_months - set(months):
+        os.remove(_partition_path(month))
+        invalidate_cache(_partition_path(month))
+
+
+def _migrate_csv_to_partitions():
+    # 首次使用分区存储时将 Transactions.csv（含未合并的交易日志）按月拆分
+    if os.path.isdir(transaction_partition_dir) or not os.path.exists(transaction_dir):
+        return
+    transactions_df = _replay_transaction_journal()
+    _write_partitions(transactions_df)
+    if os.path.exists(transaction_journal_dir):
+        os.remove(transaction_journal_dir)
+    invalidate_cache(transaction_journal_dir)
+
+
+# 交易流水日志
+def _read_journal():
+    if not os.path.exists(transaction_journal_dir):
+        return []
+    with open(transaction_journal_dir, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _replay_transaction_journal(columns=None):
+    # 在文件格式（ID）上回放日志，最后再解析名称
+    transactions_df = _read_transactions_base(columns)
+    records = _read_journal()
+    if not records:
+        transactions_df = apply_transaction_schema(_decode_dimensions(transactions_df))
+        return transactions_df if columns is None else transactions_df[columns]
+    transactions_df = _add_id_columns(transactions_df, {column for record in records
+                                                        for column in record.get('row', record.get('values', {}))})
+
+    # 依次回放：新增记录保存在 added 中，对已有记录的修改合并到 patches 中
+    # 回放是幂等的，合并中途中断后重复回放不会产生重复记录
+    existing_ids = set(transactions_df['TransactionID'].tolist())
+    added, patches, deleted = {}, {}, set()
+    for record in records:
+        if record['op'] == 'add':
+            row = record['row']
+            if row['TransactionID'] in existing_ids:
+                # 已合并的记录被删除后重新新增（例如撤销后重做），恢复该记录
+                deleted.discard(row['TransactionID'])
+                patches.setdefault(row['TransactionID'], {}).update(row)
+            else:
+                added[row['TransactionID']] = dict(row)
+        elif record['op'] == 'patch':
+            if record['id'] in added:
+                added[record['id']].update(record['values'])
+            else:
+                patches.setdefault(record['id'], {}).update(record['values'])
+        elif record['op'] == 'delete':
+            if added.pop(record['id'], None) is None:
+                deleted.add(record['id'])
+                patches.pop(record['id'], None)
+
+    if deleted:
+        transactions_df = transactions_df[~transactions_df['TransactionID'].isin(deleted)]
+    if patches:
+        transactions_df = _apply_patches(transactions_df, patches)
+    if added:
+        added_df = pd.DataFrame(list(added.values()), columns=transactions_df.columns)
+        transactions_df = added_df if transactions_df.empty else \
+            pd.concat([transactions_df, added_df], ignore_index=True)
+    transactions_df = apply_transaction_schema(_decode_dimensions(transactions_df))
+    return transactions_df if columns is None else transactions_df[columns]
+
+
+def _apply_patches(transactions_df, patches):
+    # 按列批量写入修改值，patches: {TransactionID: {列名: 新值}}
+    transactions_df = _add_id_columns(transactions_df.set_index('TransactionID'),
+                                      {column for values in patches.values() for column in values})
+    patched_columns = {column for values in patches.values() for column in values
+                       if column != 'TransactionID' and column in transactions_df.columns}
+    for column in patched_columns:
+        column_patches = {k: v[column] for k, v in patches.items() if column in v}
+        new_values = pd.Series(list(column_patches.values()), index=list(column_patches))
+        dtype = transactions_df[column].dtype
+        if column == 'Date':
+            # 文件中日期格式不统一时读取为文本列，先解析整列再写入
+            if not pd.api.types.is_datetime64_any_dtype(dtype):
+                transactions_df[column] = pd.to_datetime(transactions_df[column], format='mixed')
+            new_values = pd.to_datetime(new_values, format='mixed')
+        elif dtype == bool:
+            new_values = new_values.isin([refund_labels[True], True])
+        elif isinstance(dtype, pd.CategoricalDtype):
+            missing = set(new_values.dropna()) - set(dtype.categories)
+            if missing:
+                transactions_df[column] = transactions_df[column].cat.add_categories(sorted(missing))
+            new_values = new_values.astype(transactions_df[column].dtype)
+        else:
+            try:
+                new_values = new_values.astype(transactions_df[column].dtype)
+            except (TypeError, ValueError):
+                transactions_df[column] = transactions_df[column].astype(object)
+        transactions_df.loc[new_values.index, column] = new_values
+    return transactions_df.reset_index()
+
+
+def _storage_value(column, value):
+    if transaction_schema.get(column) == 'bool' and isinstance(value, (bool, np.bool_)):
+        return refund_labels[bool(value)]
+    return _json_value(value)
+
+
+def _json_value(value):
+    if value is None or value is pd.NA or value is pd.NaT:
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    if hasattr(value, 'item'):
+        value = value.item()
+    if isinstance(value, float) and value != value:
+        return None
+    return value
+
+
+def _json_records(df):
+    # 按列一次转换（时间戳转为文本，缺失值为 None），结果与逐个值调用 _json_value 相同
+    df = df.copy()
+    for column in df.columns:
+        if pd.api.types.is_datetime64_any_dtype(df[column]):
+            df[column] = df[column].dt.strftime('%Y-%m-%d %H:%M:%S')
+    return df.astype(object).where(df.notna(), None).to_dict('records')
+
+
+def _append_journal(records):
+    with _cache_lock:
+        with open(transaction_journal_dir, 'a', encoding='utf-8') as f:
+            f.write(''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records))
+    invalidate_cache(transaction_journal_dir)
+    if os.path.getsize(transaction_journal_dir) > journal_compact_threshold:
+        compact_transactions()
+
+
+# 派生数据（账户余额、汇总等）的增量维护：交易写入后通知已注册的监听函数
+# 监听函数参数为 (写入前版本, 写入后版本, 移除的行, 新增的行)，修改记录表示为移除旧行并新增新行
+# 监听函数只在自身状态与写入前版本一致时增量更新，否则应在下次读取时按新版本重建
+_change_listeners = []
+
+
+def on_transactions_change(listener):
+    _change_listeners.append(listener)
+    return listener
+
+
+def transactions_version():
+    # 转换为 JSON 可保存的形式，派生数据可以连同版本一起写入文件
+    return json.loads(json.dumps(_transactions_signature()))
+
+
+def _notify_change(version, removed_df, added_df):
+    new_version = transactions_version()
+    _advance_id_counter(version, new_version, added_df)
+    if not _change_listeners:
+        return
+    removed_df = None if removed_df is None else apply_transaction_schema(removed_df.copy())
+    added_df = None if added_df is None else apply_transaction_schema(added_df.copy())
+    for listener in _change_listeners:
+        listener(version, new_version, removed_df, added_df)
+
+
+# 派生数据文件（汇总表等）的延迟写入：监听函数只更新内存，并通过 persist_later 登记写文件的函数
+# 同一写文件函数距上次执行超过 persist_interval 秒时立即执行，否则留到下次登记或进程退出时执行
+# 派生数据文件中保存了对应的账本版本，未写入的更新丢失时下次读取会因版本不一致而重建
+persist_interval = 30
+_pending_writers = {}
+_last_persisted = {}
+_persist_lock = threading.Lock()
+
+
+def persist_later(writer):
+    now = time.monotonic()
+    with _persist_lock:
+        due = now - _last_persisted.get(writer, float('-inf')) >= persist_interval
+        if not due:
+            _pending_writers[writer] = True
+            return
+        _pending_writers.pop(writer, None)
+        _last_persisted[writer] = now
+    writer()
+
+
+@atexit.register
+def flush_pending_writes():
+    with _persist_lock:
+        writers = list(_pending_writers)
+        _pending_writers.clear()
+        now = time.monotonic()
+        for writer in writers:
+            _last_persisted[writer] = now
+    for writer in writers:
+        writer()
+
+
+def append_transactions(new_transactions_df):
+    # 新增交易只追加到日志末尾（或插入数据库），写入开销与账本大小无关
+    new_transactions_df = to_storage_frame(apply_transaction_schema(new_transactions_df.copy()))
+    version = transactions_version()
+    stored_df = _encode_dimensions(new_transactions_df)
+    if storage_backend == 'sqlite':
+        sqlite_store.insert_transactions(stored_df)
+        invalidate_cache(f'{sqlite_store.database_dir}#Transactions.csv')
+    elif storage_backend == 'partitioned':
+        _append_partitions(stored_df)
+    elif storage_backend == 'csv' and len(stored_df) >= bulk_append_rows and \
+            _csv_columns(transaction_dir) == list(stored_df.columns):
+        # 先合并日志，主文件即为当前账本，新增的记录（包括重做时恢复的记录）直接追加在末尾
+        if os.path.exists(transaction_journal_dir):
+            compact_transactions()
+        with _cache_lock:
+            stored_df.to_csv(transaction_dir, mode='a', header=False, index=False, date_format='%Y-%m-%d %H:%M:%S')
+        invalidate_cache(transaction_dir)
+    else:
+        _append_journal([{'op': 'add', 'row': row} for row in _json_records(stored_df)])
+    _notify_change(version, None, new_transactions_df)
+
+
+def patch_transactions(patches):
+    # patches: {TransactionID: {列名: 新值}}，只记录发生变化的字段
+    patches = {_json_value(transaction_id): {k: _storage_value(k, v) for k, v in values.items()}
+               for transaction_id, values in patches.items()}
+    version = transactions_version()
+    before_df = transaction_rows(list(patches)) if _change_listeners else None
+    stored_patches = _encode_patches(patches)
+    if storage_backend == 'sqlite':
+        sqlite_store.update_transactions(stored_patches)
+        invalidate_cache(f'{sqlite_store.database_dir}#Transactions.csv')
+    elif storage_backend == 'partitioned':
+        _patch_partitions(stored_patches)
+    else:
+        _append_journal([{'op': 'patch', 'id': transaction_id, 'values': values}
+                         for transaction_id, values in stored_patches.items()])
+    after_df = None
+    if before_df is not None:
+        existing_ids = set(before_df['TransactionID'].tolist())
+        after_df = _apply_patches(before_df, {k: v for k, v in patches.items() if k in existing_ids})
+    _notify_change(version, before_df, after_df)
+
+
+def delete_transactions(transaction_ids):
+    transaction_ids = [_json_value(transaction_id) for transaction_id in transaction_ids]
+    version = transactions_version()
+    removed_df = transaction_rows(transaction_ids) if _change_listeners else None
+    if storage_backend == 'sqlite':
+        sqlite_store.delete_transactions(transaction_ids)
+        invalidate_cache(f'{sqlite_store.database_dir}#Transactions.csv')
+    elif storage_backend == 'partitioned':
+        _delete_partitions(transaction_ids)
+    else:
+        _append_journal([{'op': 'delete', 'id': transaction_id} for transaction_id in transaction_ids])
+    _notify_change(version, removed_df, None)
+
+
+def transaction_rows(transaction_ids):
+    transactions_df = load_transactions_data()
+    return transactions_df[transactions_df['TransactionID'].isin(transaction_ids)]
+
+
+def transaction_records(transactions_df):
+    # 转换为存储格式的行字典列表，用于操作记录
+    return _json_records(to_storage_frame(apply_transaction_schema(transactions_df.copy())))
+
+
+def transaction_values(patches):
+    # 读取 patches 涉及的记录和字段的当前值，格式与 patches 相同
+    current = to_storage_frame(transaction_rows(list(patches))).set_index('TransactionID')
+    return {transaction_id: {column: _json_value(current.at[transaction_id, column]) for column in values}
+            for transaction_id, values in patches.items() if transaction_id in current.index}
+
+
+def compact_transactions():
+    # 将日志合并进交易主文件并清空日志
+    save_data(load_transactions_data(), 'Transactions.csv')
+
+
+# 查询接口：所有筛选条件合并为一次计算
+# SQLite 后端下推为 SQL；分区存储只读取日期范围内的分区；其余后端使用按列预建的位置索引
+# 筛选参数：start_date, end_date, transaction_type, account, category, subcategory,
+#           is_refund, merchant（均支持单值或列表）, exclude_category, exclude_subcategory
+# 查询结果按 (数据版本, 筛选条件) 缓存，数据变化后自动失效
+query_cache_size = 64
+_query_cache = OrderedDict()
+_transaction_index = {}
+query_stats = {'hits': 0, 'misses': 0}
+
+_equality_filters = [('transaction_type', 'TransactionType'), ('account', 'AccountName'),
+                     ('category', 'CategoryName'), ('subcategory', 'SubcategoryName'),
+                     ('is_refund', 'IsRefund'), ('merchant', 'Merchant')]
+_exclude_filters = [('exclude_category', 'CategoryName'), ('exclude_subcategory', 'SubcategoryName')]
+
+
+def _date_mask(df, start_date=None, end_date=None):
+    mask = pd.Series(True, index=df.index)
+    if start_date is not None:
+        mask &= df['Date'] >= pd.Timestamp(start_date)
+    if end_date is not None:
+        # 结束日期当天的记录也包含在内
+        mask &= df['Date'] < pd.Timestamp(end_date) + pd.Timedelta(days=1)
+    return mask
+
+
+def _filter_mask(df, start_date=None, end_date=None, **filters):
+    mask = _date_mask(df, start_date, end_date)
+    for key, column in _equality_filters:
+        value = filters.get(key)
+        if value is None:
+            continue
+        if isinstance(value, (list, tuple, set)):
+            mask &= df[column].isin(value)
+        else:
+            mask &= df[column] == value
+    for key, column in _exclude_filters:
+        if filters.get(key) is not None:
+            mask &= df[column] != filters[key]
+    return mask
+
+
+def _transactions_signature():
+    # 交易数据的版本：底层文件的签名，以及维度表中ID与名称的对应关系（改名后解析出的名称随之变化）
+    if storage_backend == 'sqlite':
+        return _sqlite_signature('Transactions.csv'), dimension_maps()['version']
+    # 先完成首次使用时的格式转换（可能登记新的维度），否则转换前后的版本不同（例如分配交易ID时会重复计算最大ID）
+    if storage_backend == 'partitioned':
+        _migrate_csv_to_partitions()
+        return tuple((month, _file_signature(_partition_path(month))) for month in _partition_months()), \
+            dimension_maps()['version']
+    if storage_backend == 'parquet':
+        _migrate_csv_to_parquet()
+    _migrate_legacy_dimensions()
+    return _file_signature(_transaction_base_dir()), _file_signature(transaction_journal_dir), \
+        dimension_maps()['version']
+
+
+def _get_transaction_index():
+    # 整表数据及其索引：按日期排序的位置数组，以及各列 取值 -> 行位置 的映射（按需构建）
+    signature = _transactions_signature()
+    with _cache_lock:
+        if _transaction_index.get('signature') == signature:
+            return _transaction_index
+    transactions_df = load_transactions_data().reset_index(drop=True)
+    date_order = np.argsort(transactions_df['Date'].values, kind='stable')
+    index = {'signature': signature, 'frame': transactions_df, 'date_order': date_order,
+             'sorted_dates': transactions_df['Date'].values[date_order], 'columns': {}}
+    with _cache_lock:
+        _transaction_index.clear()
+        _transaction_index.update(index)
+    return index
+
+
+def _column_positions(index, column):
+    positions = index['columns'].get(column)
+    if positions is None:
+        positions = index['frame'].groupby(column, observed=True, sort=False).indices
+        index['columns'][column] = positions
+    return positions
+
+
+def _indexed_positions(filters):
+    # 返回 (整表数据, 符合条件的行位置)，没有任何筛选条件时行位置为 None
+    index = _get_transaction_index()
+    transactions_df = index['frame']
+    positions = None
+
+    def narrow(candidates):
+        return candidates if positions is None else np.intersect1d(positions, candidates, assume_unique=True)
+
+    if filters.get('start_date') is not None or filters.get('end_date') is not None:
+        sorted_dates = index['sorted_dates']
+        lo, hi = 0, len(sorted_dates)
+        if filters.get('start_date') is not None:
+            lo = sorted_dates.searchsorted(np.datetime64(pd.Timestamp(filters['start_date'])), 'left')
+        if filters.get('end_date') is not None:
+            end = pd.Timestamp(filters['end_date']) + pd.Timedelta(days=1)
+            hi = sorted_dates.searchsorted(np.datetime64(end), 'left')
+        positions = np.sort(index['date_order'][lo:hi])
+    empty = np.array([], dtype=np.intp)
+    for key, column in _equality_filters:
+        value = filters.get(key)
+        if value is None:
+            continue
+        column_positions = _column_positions(index, column)
+        values = value if isinstance(value, (list, tuple, set)) else [value]
+        candidates = [column_positions[v] for v in values if v in column_positions]
+        positions = narrow(np.sort(np.concatenate(candidates)) if candidates else empty)
+    for key, column in _exclude_filters:
+        if filters.get(key) is not None:
+            excluded = _column_positions(index, column).get(filters[key], empty)
+            base = np.arange(len(transactions_df)) if positions is None else positions
+            positions = np.setdiff1d(base, excluded, assume_unique=True)
+    return transactions_df, positions
+
+
+def _indexed_query(filters):
+    transactions_df, positions = _indexed_positions(filters)
+    if positions is None:
+        return transactions_df
+    return transactions_df.take(positions)
+
+
+def _filter_key(filters):
+    key = []
+    for name, value in sorted(filters.items()):
+        if value is None:
+            continue
+        if isinstance(value, (list, tuple, set)):
+            value = tuple(sorted(value, key=str))
+        elif name in ('start_date', 'end_date'):
+            value = pd.Timestamp(value)
+        key.append((name, value))
+    return tuple(key)
+
+
+_dimension_filters = ['account', 'category', 'subcategory', 'exclude_category', 'exclude_subcategory']
+
+
+def _storage_filters(filters):
+    # SQLite 中是否报销以 '是'/'否' 存储
+    # 账户、类别、子类别转换为ID条件，得到的是结果的超集，读取并解析名称后再按名称精确筛选
+    storage_filters = {key: value for key, value in filters.items() if key not in _dimension_filters}
+    if isinstance(filters.get('is_refund'), (bool, np.bool_)):
+        storage_filters['is_refund'] = refund_labels[bool(filters['is_refund'])]
+    maps = dimension_maps()
+    values = {key: set(value) if isinstance(value, (list, tuple, set)) else {value}
+              for key, value in filters.items() if key in ('account', 'category', 'subcategory') and value is not None}
+    if 'account' in values:
+        storage_filters['account_id'] = [k for k, name in maps['account_names'].items() if name in values['account']]
+    if 'category' in values:
+        # 已合并的子类别下的记录仍保存原类别ID
+        storage_filters['category_id'] = \
+            [k for k, name in maps['category_names'].items() if name in values['category']] + \
+            [category_id for _, category_id, category, _ in maps['redirects'] if category in values['category']]
+    if 'subcategory' in values:
+        storage_filters['subcategory_id'] = \
+            [k for k, name in maps['subcategory_names'].items() if name in values['subcategory']] + \
+            [alias_id for alias_id, _, _, subcategory in maps['redirects'] if subcategory in values['subcategory']]
+    return storage_filters
+
+
+def query_transactions(**filters):
+    key = (storage_backend, _transactions_signature(), _filter_key(filters))
+    with _cache_lock:
+        cached = _query_cache.get(key)
+        if cached is not None:
+            _query_cache.move_to_end(key)
+            query_stats['hits'] += 1
+            return cached.copy()
+    if storage_backend == 'sqlite':
+        result = apply_transaction_schema(_decode_dimensions(
+            sqlite_store.query_transactions(**_storage_filters(filters))))
+        result = result[_filter_mask(result, **filters)]
+    elif storage_backend == 'partitioned':
+        transactions_df = load_transactions_data(start_date=filters.get('start_date'), end_date=filters.get('end_date'))
+        result = transactions_df[_filter_mask(transactions_df, **filters)]
+    else:
+        result = _indexed_query(filters)
+    with _cache_lock:
+        query_stats['misses'] += 1
+        _query_cache[key] = result
+        while len(_query_cache) > query_cache_size:
+            _query_cache.popitem(last=False)
+    return result.copy()
+
+
+def iter_transactions(chunk_size=50000, **filters):
+    # 按日期顺序分块返回筛选结果（筛选参数同 query_transactions），不生成完整的结果表，用于导出等大范围读取
+    # SQLite 后端逐块读取查询结果；分区存储逐个读取月份分区；其余后端从已缓存的整表中按行位置取出各块
+    if storage_backend == 'sqlite':
+        for chunk in sqlite_store.iter_transactions(chunk_size, **_storage_filters(filters)):
+            chunk = apply_transaction_schema(_decode_dimensions(chunk))
+            yield chunk[_filter_mask(chunk, **filters)]
+    elif storage_backend == 'partitioned':
+        _migrate_csv_to_partitions()
+        for month in _partition_months(filters.get('start_date'), filters.get('end_date')):
+            transactions_df = apply_transaction_schema(_decode_dimensions(_read_partition(month)))
+            transactions_df = transactions_df[_filter_mask(transactions_df, **filters)]
+            transactions_df = transactions_df.sort_values('Date', kind='stable')
+            for start in range(0, len(transactions_df), chunk_size):
+                yield transactions_df.iloc[start:start + chunk_size]
+    else:
+        transactions_df, positions = _indexed_positions(filters)
+        if positions is None:
+            positions = np.arange(len(transactions_df))
+        positions = positions[np.argsort(transactions_df['Date'].values[positions], kind='stable')]
+        for start in range(0, len(positions), chunk_size):
+            yield transactions_df.take(positions[start:start + chunk_size])
+
+
+def query_distinct(column, **filters):
+    # 账户、类别、子类别的名称需要解析后才能去重，不在 SQLite 中计算
+    if storage_backend == 'sqlite' and column not in dimension_columns and \
+            all(filters.get(key) is None for key in _dimension_filters):
+        return sqlite_store.query_distinct(column, **_storage_filters(filters))
+    return query_transactions(**filters)[column].unique().tolist()
+
+
+def query_date_range():
+    if storage_backend == 'sqlite':
+        return tuple(pd.to_datetime(list(sqlite_store.query_date_range())))
+    if storage_backend == 'partitioned':
+        # 只需读取最早和最晚的分区
+        _migrate_csv_to_partitions()
+        months = _partition_months()
+        if not months:
+            return pd.NaT, pd.NaT
+        return _read_partition(months[0], ['Date'])['Date'].min(), _read_partition(months[-1], ['Date'])['Date'].max()
+    transactions_df = load_transactions_data(columns=['Date'])
+    return transactions_df['Date'].min(), transactions_df['Date'].max()
+
+
+def max_transaction_id():
+    if storage_backend == 'sqlite':
+        return sqlite_store.max_transaction_id()
+    transactions_df = load_transactions_data(columns=['TransactionID'])
+    return None if transactions_df.empty else transactions_df['TransactionID'].max()
+
+
+# 表格编辑的差异保存：只提取被修改的单元格，以修改记录的形式写入
+def diff_transactions(original_df, edited_df):
+    # 返回 {TransactionID: {列名: 新值}}，只包含编辑前后不同的单元格
+    original = to_storage_frame(original_df).set_index('TransactionID')
+    edited = to_storage_frame(edited_df).set_index('TransactionID')
+    ids = edited.index.intersection(original.index)
+    columns = [column for column in edited.columns if column in original.columns]
+    original, edited = original.loc[ids, columns], edited.loc[ids, columns]
+    patches = {}
+    for column in columns:
+        before, after = original[column], edited[column]
+        if column == 'Date':
+            before, after = pd.to_datetime(before, format='mixed'), pd.to_datetime(after, format='mixed')
+        before, after = before.astype(object), after.astype(object)
+        changed = (before != after) & ~(before.isna() & after.isna())
+        for transaction_id, value in after[changed].items():
+            patches.setdefault(transaction_id, {})[column] = value
+    return patches
+
+
+def changed_transactions(edited_df, patches):
+    # 编辑后表格中被修改的行，保存前只需校验这些行
+    return edited_df[edited_df['TransactionID'].isin(list(patches))]
+
+
+def save_transaction_edits(original_df, edited_df, patches=None):
+    # 只写入有改动的行，返回操作记录（见 history.py），其中 after 的长度即改动的行数
+    # patches 为已经计算好的 diff_transactions 结果
+    if patches is None:
+        patches = diff_transactions(original_df, edited_df)
+    if not patches:
+        return []
+    changed_df = apply_transaction_schema(to_storage_frame(changed_transactions(edited_df, patches)))
+    problems = validate_transactions(changed_df)
+    if problems:
+        raise ValueError('交易记录校验失败：\n' + '\n'.join(problems))
+    before = diff_transactions(changed_transactions(edited_df, patches), original_df)
+    patch_transactions(patches)
+    return [{'op': 'patch', 'before': before, 'after': patches}]
+
+
+# 交易ID分配：只在数据被其他进程修改（版本与计数器记录的不一致）时重新计算最大ID，之后在内存中递增
+_id_counter = {}
+_id_lock = threading.Lock()
+
+
+def _advance_id_counter(version, new_version, added_df):
+    # 本进程写入后计数器直接跟随到新版本，新增记录中更大的ID一并计入；写入前计数器已过期则留待下次分配时重算
+    with _id_lock:
+        if _id_counter.get('signature') != version:
+            return
+        next_id = _id_counter['next']
+        if added_df is not None and not added_df.empty:
+            current = pd.to_numeric(added_df['TransactionID'], errors='coerce').max()
+            if pd.notna(current):
+                next_id = max(next_id, int(current) + 1)
+        _id_counter.update(signature=new_version, next=next_id)
+
+
+def allocate_transaction_ids(count=1):
+    signature = transactions_version()
+    with _id_lock:
+        if _id_counter.get('signature') != signature:
+            current = max_transaction_id()
+            _id_counter.update(signature=signature, next=0 if current is None or pd.isna(current) else int(current) + 1)
+        first = _id_counter['next']
+        _id_counter['next'] += count
+    return list(range(first, first + count))
+
+
+def signed_amounts(transactions_df):
+    # 交易对账户余额的影响：收入记为正，支出记为负
+    return transactions_df['Amount'].where(transactions_df['TransactionType'] == '收入', -transactions_df['Amount'])
+
+
+def ledger_totals(transactions_df):
+    # 各账户收支合计 {账户名称: 金额}
+    totals = signed_amounts(transactions_df).groupby(transactions_df['AccountName'], observed=True, sort=False).sum()
+    return totals.to_dict()
+
+
+class TransactionBatch:
+    # 批量提交：暂存新增交易、对已有交易的修改、删除和账户余额变动，commit() 时每个文件只写入一次
+    def __init__(self):
+        self.new_rows = []
+        self.patches = {}
+        self.deleted_ids = []
+        self.balance_changes = {}
+        self.opening_changes = {}
+
+    def add(self, **row):
+        # 返回新交易的ID；未给出的字段使用默认值
+        transaction_id = row.get('TransactionID')
+        if transaction_id is None:
+            transaction_id = allocate_transaction_ids()[0]
+        new_row = {'UpdatedDate': datetime.now().strftime('%Y-%m-%d'), 'IsRefund': False,
+                   'RelatedTransactionID': None, 'Remarks': '', **row, 'TransactionID': transaction_id}
+        self.new_rows.append(new_row)
+        return transaction_id
+
+    def update(self, transaction_id, **values):
+        # 修改本批次新增的交易时直接改写暂存行
+        for new_row in self.new_rows:
+            if new_row['TransactionID'] == transaction_id:
+                new_row.update(values)
+                return
+        self.patches.setdefault(transaction_id, {}).update(values)
+
+    def add_transactions(self, transactions_df, backdated=False):
+        # 一次暂存多笔新增交易（需已分配 TransactionID），并按账户汇总登记余额变动
+        for row in transactions_df.to_dict('records'):
+            self.add(**row)
+        for account_name, amount in ledger_totals(transactions_df).items():
+            self.adjust_balance(account_name, round(float(amount), 2), backdated=backdated)
+
+    def delete(self, transaction_id):
+        # 与新增一样，删除对余额的影响由调用方通过 adjust_balance 登记
+        self.patches.pop(transaction_id, None)
+        self.deleted_ids.append(transaction_id)
+
+    def adjust_balance(self, account_name, amount, backdated=False):
+        # 补记的交易已经反映在当前余额中，改为反向调整期初余额，使余额与账本保持一致
+        if backdated:
+            self.opening_changes[account_name] = self.opening_changes.get(account_name, 0) - amount
+        else:
+            self.balance_changes[account_name] = self.balance_changes.get(account_name, 0) + amount
+
+    def commit(self):
+        # 返回本次提交的操作记录（见 history.py），用于撤销和重做
+        steps = []
+        if self.new_rows:
+            new_transactions_df = pd.DataFrame(self.new_rows, columns=transaction_columns)
+            append_transactions(new_transactions_df)
+            steps.append({'op': 'add', 'rows': transaction_records(new_transactions_df)})
+        if self.patches:
+            before = transaction_values(self.patches)
+            patch_transactions(self.patches)
+            steps.append({'op': 'patch', 'before': before, 'after': self.patches})
+        if self.deleted_ids:
+            removed = transaction_records(transaction_rows(self.deleted_ids))
+            delete_transactions(self.deleted_ids)
+            steps.append({'op': 'delete', 'rows': removed})
+        if self.balance_changes or self.opening_changes:
+            adjust_account_balances(self.balance_changes, self.opening_changes)
+            steps.append({'op': 'balance', 'changes': self.balance_changes, 'opening': self.opening_changes})
+        self.new_rows, self.patches, self.deleted_ids = [], {}, []
+        self.balance_changes, self.opening_changes = {}, {}
+        return steps
+
+
+def adjust_account_balances(balance_changes, opening_changes=None):
+    # balance_changes: {账户名称: 变动金额}，opening_changes: {账户名称: 期初余额变动金额}，一次写入 Account.csv
+    # 尚未记录期初余额的旧数据不调整期初余额，首次核对余额时会以当前余额反推（见 balances.py）
+    accounts_df = load_account_data()
+    current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    for column, changes in [('Balance', balance_changes), ('OpeningBalance', opening_changes or {})]:
+        if column not in accounts_df.columns:
+            continue
+        for account_name, amount in changes.items():
+            mask = accounts_df['AccountName'] == account_name
+            accounts_df.loc[mask, column] = (accounts_df.loc[mask, column] + amount).round(2)
+            accounts_df.loc[mask, 'LastModifiedTime'] = current_time
+    save_data(accounts_df, 'Account.csv')
+
+
+table_loaders = {
+    'Account.csv': load_account_data,
+    'Categories.csv': load_categories_data,
+    'Subcategories.csv': load_subcategories_data,
+    'SubcategoryAliases.csv': load_subcategory_aliases_data,
+}
+
+
+def replace_rows(file_name, key, before_rows, after_rows):
+    # 按主键将 before_rows 替换为 after_rows：只在 before_rows 中的行被删除，只在 after_rows 中的行被新增
+    df = table_loaders[file_name]()
+    keys = {row[key] for row in before_rows} | {row[key] for row in after_rows}
+    df = df[~df[key].isin(keys)]
+    if after_rows:
+        after_df = pd.DataFrame(after_rows, columns=df.columns)
+        df = after_df if df.empty else pd.concat([df, after_df], ignore_index=True)
+    save_data(df.sort_values(key), file_name)
+
+
+def table_rows(df, key, keys):
+    # 读取表中指定主键的行，格式与 replace_rows 的参数相同
+    return [{k: _json_value(v) for k, v in row.items()} for row in df[df[key].isin(keys)].to_dict('records')]
+
+
+def migrate_csv_to_sqlite():
+    # 一次性迁移：读取 CSV（含未合并的交易日志）写入 SQLite 数据库
+    global storage_backend
+    previous_backend, storage_backend = storage_backend, 'csv'
+    try:
+        frames = dict(zip(['Transactions.csv', 'Categories.csv', 'Subcategories.csv', 'Account.csv'], load_data()))
+        frames['SubcategoryAliases.csv'] = load_subcategory_aliases_data()
+        storage_backend = 'sqlite'
+        invalidate_cache(sqlite_store.database_dir)
+        # 先写入维度表，交易记录按其中的ID保存
+        for file_name in dimension_files:
+            save_data(frames[file_name], file_name)
+        save_data(frames['Transactions.csv'], 'Transactions.csv')
+    finally:
+        storage_backend = previous_backend
 
 
 # 保存数据
 def save_data(df, file_name):
-    df.to_csv(f'Data/{file_name}', index=False)
\ No newline at end of file
+    if file_name == 'Transactions.csv':
+        df = _encode_dimensions(to_storage_frame(df))
+    if storage_backend == 'sqlite':
+        sqlite_store.write_table(df, file_name)
+        invalidate_cache(f'{sqlite_store.database_dir}#{file_name}')
+        return
+    path = f'{data_dir}/{file_name}'
+    if path == transaction_dir and storage_backend == 'partitioned':
+        _write_partitions(df)
+        return
+    if path == transaction_dir and storage_backend == 'parquet':
+        path = transaction_parquet_dir
+        # 列式存储直接保存内存类型（category/布尔值/时间戳）
+        apply_transaction_schema(df.copy()).to_parquet(path, index=False)
+    else:
+        df.to_csv(path, index=False)
+    invalidate_cache(path)
+    if path == _transaction_base_dir():
+        # 全量写入已包含所有日志内容
+        if os.path.exists(transaction_journal_dir):
+            os.remove(transaction_journal_dir)
+        invalidate_cache(transaction_journal_dir)